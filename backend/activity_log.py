@@ -0,0 +1,82 @@
+import atexit
+import threading
+from collections import deque
+from datetime import datetime
+from sqlalchemy import insert
+from config import app, db
+
+class ActivityLog:
+    """Журнал активности: события копятся в кольцевом буфере и записываются в activity_log пачкой"""
+    
+    def __init__(self, buffer_size, flush_interval, flush_threshold):
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self._buffer = deque(maxlen=buffer_size)  # При переполнении теряются самые старые события
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flush_requested = threading.Event()
+        self._thread = None
+    
+    def record(self, user_id, event_type, object_id=None):
+        with self._lock:
+            self._buffer.append({
+                'user_id': int(user_id) if user_id else None,
+                'event_type': event_type,
+                'object_id': object_id,
+                'created_at': datetime.utcnow()
+            })
+            self._ensure_thread()
+            if len(self._buffer) >= self.flush_threshold:
+                self._flush_requested.set()
+    
+    def flush(self):
+        """Запись накопленных событий одним пакетным INSERT, возвращает число записанных событий"""
+        from models import ActivityEvent
+        with self._flush_lock:
+            with self._lock:
+                if not self._buffer:
+                    return 0
+                events = list(self._buffer)
+                self._buffer.clear()
+            
+            try:
+                with app.app_context():
+                    db.session.execute(insert(ActivityEvent), events)
+                    db.session.commit()
+            except Exception as e:
+                # Возвращаем события в начало буфера для следующей попытки; при переполнении
+                # deque отбрасывает слева, то есть теряются самые старые события, а не новые
+                print(f"Ошибка записи журнала активности: {e}")
+                with self._lock:
+                    newer = list(self._buffer)
+                    self._buffer.clear()
+                    self._buffer.extend(events)
+                    self._buffer.extend(newer)
+                return 0
+            
+            return len(events)
+    
+    def _ensure_thread(self):
+        # Поток запускается при первом событии, а не при импорте
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='activity-log-flush', daemon=True)
+            self._thread.start()
+    
+    def _run(self):
+        while True:
+            self._flush_requested.wait(self.flush_interval)
+            self._flush_requested.clear()
+            self.flush()
+
+activity_log = ActivityLog(
+    buffer_size=app.config['ACTIVITY_LOG_BUFFER_SIZE'],
+    flush_interval=app.config['ACTIVITY_LOG_FLUSH_INTERVAL'],
+    flush_threshold=app.config['ACTIVITY_LOG_FLUSH_THRESHOLD']
+)
+
+# Незаписанные события сохраняются при остановке сервера
+atexit.register(activity_log.flush)
+
+def record_activity(user_id, event_type, object_id=None):
+    """Регистрация действия пользователя (без записи в БД в рамках запроса)"""
+    activity_log.record(user_id, event_type, object_id)
@@ -1,24 +1,33 @@
 import os
 import json
 from flask import request, jsonify
-from flask_jwt_extended import get_jwt_identity, jwt_required
+from flask_jwt_extended import jwt_required
 from datetime import datetime, timedelta
 from config import app, db
-from models import User, Panorama, Tour, UserSession
+from models import User, Panorama, Tour, ActivityEvent, DailyRollup, StatsTotal, UserRollup, StorageUsage
 from sqlalchemy import func, desc
-# Импортируем функцию очистки из utils.py
-from utils import cleanup_expired_panoramas
+# Фоновая очистка истекшего контента
+from sweeper import sweeper
+from stats_rollups import stats_rollups, user_totals, count_user_change, count_removed_user, count_removed_panoramas, count_removed_tour
+from image_processing import remove_panorama_derivatives
+from blob_store import release_blob
+from tour_manifest import get_panorama_tour_ids, get_user_tour_ids, invalidate_tour_manifests
+from storage_usage import remove_storage_usage, get_storage_usage, storage_reconciler
+from pagination import paginate_listing, desc_key, InvalidCursor
+from current_user import get_current_user_id, get_current_user_state, invalidate_user_state
+from user_stats import invalidate_user_stats
+from read_replica import use_read_replica, get_read_replica_status
 
 def admin_required(f):
     """Декоратор для проверки прав администратора"""
     @jwt_required()
     def wrapper(*args, **kwargs):
         try:
-            user_id = get_jwt_identity()
-            if not user_id:
+            if not get_current_user_id():
                 return jsonify({'error': 'Неверный токен'}), 401
             
-            user = User.query.get(int(user_id))
+            # Права из кэша: проверка не стоит запроса к БД
+            user = get_current_user_state()
             if not user:
                 return jsonify({'error': 'Пользователь не найден'}), 404
             
@@ -35,41 +44,41 @@ def admin_required(f):
 
 @app.route('/api/admin/stats', methods=['GET'])
 @admin_required
+@use_read_replica
 def get_admin_stats():
     """Получение расширенной статистики для админ-панели"""
     try:
-        # Основная статистика
-        total_users = User.query.count()
-        total_panoramas = Panorama.query.count()
-        total_tours = Tour.query.count()
-        
-        # Статистика пользователей
-        premium_users = User.query.filter_by(subscription_type='premium').count()
-        active_users = User.query.filter_by(is_active=True).count()
-        blocked_users = User.query.filter_by(is_active=False).count()
+        # Агрегаты пересчитываются в фоне (stats_rollups.py), здесь только чтение готовых строк
+        stats_rollups.ensure_fresh()
+        totals = {row.metric: row.value for row in StatsTotal.query.all()}
         
         # Статистика по подпискам
-        subscription_stats = db.session.query(
-            User.subscription_type,
-            func.count(User.id).label('count')
-        ).group_by(User.subscription_type).all()
+        subscription_stats = [
+            (metric.split(':', 1)[1], value) for metric, value in totals.items()
+            if metric.startswith('subscription:')
+        ]
+        
+        # Дневные агрегаты за последние 30 дней
+        month_ago = (datetime.utcnow() - timedelta(days=30)).date()
+        daily = {}
+        for row in DailyRollup.query.filter(DailyRollup.day >= month_ago).order_by(DailyRollup.day).all():
+            daily.setdefault(row.metric, []).append((row.day, row.value))
         
-        # Статистика по датам регистрации (последние 30 дней)
-        month_ago = datetime.utcnow() - timedelta(days=30)
-        recent_registrations = db.session.query(
-            func.date(User.created_at).label('date'),
-            func.count(User.id).label('count')
-        ).filter(User.created_at >= month_ago).group_by(func.date(User.created_at)).order_by('date').all()
+        recent_registrations = daily.get('registrations', [])
+        visit_stats = daily.get('visits', [])
+        
+        # Количество посещений сегодня
+        today = datetime.utcnow().date()
+        today_visits = sum(value for day, value in visit_stats if day == today)
         
         # Топ пользователей по количеству панорам
         top_users = db.session.query(
             User.username,
             User.email,
             User.subscription_type,
-            func.count(Panorama.id).label('panorama_count')
-        ).join(Panorama, User.id == Panorama.user_id, isouter=True)\
-         .group_by(User.id)\
-         .order_by(desc('panorama_count'))\
+            UserRollup.panorama_count
+        ).join(UserRollup, User.id == UserRollup.user_id)\
+         .order_by(desc(UserRollup.panorama_count))\
          .limit(10).all()
         
         # Последние загруженные панорамы
@@ -82,34 +91,20 @@ def get_admin_stats():
          .order_by(desc(Panorama.upload_date))\
          .limit(10).all()
         
-        # Статистика посещений сайта (за последние 30 дней)
-        visit_stats = db.session.query(
-            func.date(UserSession.created_at).label('date'),
-            func.count(UserSession.id).label('count')
-        ).filter(UserSession.created_at >= month_ago)\
-         .group_by(func.date(UserSession.created_at))\
-         .order_by('date').all()
-        
-        # Количество посещений сегодня
-        today = datetime.utcnow().date()
-        today_visits = db.session.query(UserSession)\
-            .filter(func.date(UserSession.created_at) == today)\
-            .count()
-        
         # Количество активных пользователей прямо сейчас (за последние 15 минут)
         fifteen_minutes_ago = datetime.utcnow() - timedelta(minutes=15)
-        current_active_users = db.session.query(UserSession)\
-            .filter(UserSession.created_at >= fifteen_minutes_ago)\
-            .count()
+        current_active_users = db.session.query(func.count(func.distinct(ActivityEvent.user_id)))\
+            .filter(ActivityEvent.created_at >= fifteen_minutes_ago)\
+            .scalar()
         
         return jsonify({
             'total_stats': {
-                'users': total_users,
-                'panoramas': total_panoramas,
-                'tours': total_tours,
-                'premium_users': premium_users,
-                'active_users': active_users,
-                'blocked_users': blocked_users,
+                'users': totals.get('users', 0),
+                'panoramas': totals.get('panoramas', 0),
+                'tours': totals.get('tours', 0),
+                'premium_users': totals.get('premium_users', 0),
+                'active_users': totals.get('active_users', 0),
+                'blocked_users': totals.get('blocked_users', 0),
                 'today_visits': today_visits,
                 'current_active_users': current_active_users
             },
@@ -122,6 +117,9 @@ def get_admin_stats():
             'visit_chart': [
                 {'date': str(stat[0]), 'count': stat[1]} for stat in visit_stats
             ],
+            'upload_chart': [
+                {'date': str(stat[0]), 'count': stat[1]} for stat in daily.get('uploads', [])
+            ],
             'top_users': [
                 {
                     'username': user[0],
@@ -137,7 +135,8 @@ def get_admin_stats():
                     'created_at': p[2].isoformat(),
                     'username': p[3]
                 } for p in recent_panoramas
-            ]
+            ],
+            'updated_at': stats_rollups.last_refreshed_at.isoformat() if stats_rollups.last_refreshed_at else None
         }), 200
         
     except Exception as e:
@@ -147,16 +146,30 @@ def get_admin_stats():
 
 @app.route('/api/admin/users', methods=['GET'])
 @admin_required
+@use_read_replica
 def get_users():
     """Получение списка пользователей с пагинацией и фильтрацией"""
     try:
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 20, type=int)
         search = request.args.get('search', '')
         subscription_filter = request.args.get('subscription', '')
         status_filter = request.args.get('status', '')
         
-        query = User.query
+        # Статистика пользователя считается коррелированными подзапросами в том же SELECT
+        # (по индексам ix_panoramas_user_listing, ix_tours_user_listing, ix_activity_log_user_created),
+        # а не отдельными запросами на каждую строку страницы
+        panorama_count = db.session.query(func.count(Panorama.id))\
+            .filter(Panorama.user_id == User.id).correlate(User).scalar_subquery()
+        tour_count = db.session.query(func.count(Tour.id))\
+            .filter(Tour.user_id == User.id).correlate(User).scalar_subquery()
+        last_activity = db.session.query(func.max(ActivityEvent.created_at))\
+            .filter(ActivityEvent.user_id == User.id).correlate(User).scalar_subquery()
+        
+        query = db.session.query(
+            User,
+            panorama_count.label('panorama_count'),
+            tour_count.label('tour_count'),
+            last_activity.label('last_activity')
+        )
         
         # Поиск по username или email
         if search:
@@ -178,39 +191,27 @@ def get_users():
             query = query.filter(User.is_active == False)
         
         # Сортировка по дате создания (новые сначала)
-        query = query.order_by(desc(User.created_at))
-        
-        users = query.paginate(
-            page=page, 
-            per_page=per_page, 
-            error_out=False
+        users, pagination = paginate_listing(
+            query,
+            [desc_key(User.created_at), desc_key(User.id)],
+            default_per_page=20
         )
         
-        # Добавляем статистику для каждого пользователя
         users_data = []
-        for user in users.items:
+        for user, user_panorama_count, user_tour_count, user_last_activity in users:
             user_dict = user.to_dict()
-            # Количество панорам
-            user_dict['panorama_count'] = Panorama.query.filter_by(user_id=user.id).count()
-            # Количество туров
-            user_dict['tour_count'] = Tour.query.filter_by(user_id=user.id).count()
-            # Последняя активность
-            last_session = UserSession.query.filter_by(user_id=user.id).order_by(desc(UserSession.created_at)).first()
-            user_dict['last_activity'] = last_session.created_at.isoformat() if last_session else None
+            user_dict['panorama_count'] = user_panorama_count
+            user_dict['tour_count'] = user_tour_count
+            user_dict['last_activity'] = user_last_activity.isoformat() if user_last_activity else None
             users_data.append(user_dict)
         
         return jsonify({
             'users': users_data,
-            'pagination': {
-                'page': users.page,
-                'pages': users.pages,
-                'per_page': users.per_page,
-                'total': users.total,
-                'has_next': users.has_next,
-                'has_prev': users.has_prev
-            }
+            'pagination': pagination
         }), 200
         
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': f'Ошибка получения пользователей: {str(e)}'}), 500
 
@@ -230,13 +231,16 @@ def update_user_subscription(user_id):
         if not user:
             return jsonify({'error': 'Пользователь не найден'}), 404
         
+        before = user_totals(user)
         user.subscription_type = subscription_type
         if expires_at:
             user.subscription_expires = datetime.fromisoformat(expires_at.replace('Z', '+00:00'))
         else:
             user.subscription_expires = None
         
+        count_user_change(before, user)
         db.session.commit()
+        invalidate_user_state(user.id)
         
         return jsonify({
             'message': 'Подписка обновлена',
@@ -262,8 +266,11 @@ def update_user_status(user_id):
         if user.role == 'admin':
             return jsonify({'error': 'Нельзя заблокировать администратора'}), 403
         
+        before = user_totals(user)
         user.is_active = is_active
+        count_user_change(before, user)
         db.session.commit()
+        invalidate_user_state(user.id)
         
         action = 'разблокирован' if is_active else 'заблокирован'
         return jsonify({
@@ -287,18 +294,31 @@ def delete_user(user_id):
         if user.role == 'admin':
             return jsonify({'error': 'Нельзя удалить администратора'}), 403
         
-        # Удаляем файлы панорам пользователя
+        # Освобождаем файлы панорам пользователя (удаляются после коммита, если на них не ссылаются другие панорамы)
         user_panoramas = Panorama.query.filter_by(user_id=int(user_id)).all()
         for panorama in user_panoramas:
-            if panorama.file_path and os.path.exists(panorama.file_path):
-                try:
-                    os.remove(panorama.file_path)
-                except:
-                    pass
+            release_blob(panorama.file_path)
+        remove_storage_usage(user_panoramas)
+        count_removed_panoramas(user_panoramas)
+        
+        # Туры пользователя и туры с его панорамами
+        affected_tour_ids = get_user_tour_ids(user_id)
+        count_removed_user(user, len(affected_tour_ids))
+        for panorama in user_panoramas:
+            affected_tour_ids.extend(get_panorama_tour_ids(panorama.id))
+        
+        # Журнал активности не связан с пользователем внешним ключом
+        ActivityEvent.query.filter_by(user_id=user.id).delete(synchronize_session=False)
+        StorageUsage.query.filter_by(user_id=user.id).delete(synchronize_session=False)
         
         # Удаляем все связанные данные (каскадное удаление настроено в моделях)
         db.session.delete(user)
         db.session.commit()
+        invalidate_user_state(user_id)
+        invalidate_tour_manifests(affected_tour_ids)
+        
+        for panorama in user_panoramas:
+            remove_panorama_derivatives(panorama.id)
         
         return jsonify({'message': 'Пользователь удален'}), 200
         
@@ -310,11 +330,10 @@ def delete_user(user_id):
 
 @app.route('/api/admin/panoramas', methods=['GET'])
 @admin_required
+@use_read_replica
 def get_all_panoramas():
     """Получение всех панорам для модерации"""
     try:
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 20, type=int)
         search = request.args.get('search', '')
         
         query = db.session.query(Panorama, User.username)\
@@ -328,32 +347,25 @@ def get_all_panoramas():
                 )
             )
         
-        query = query.order_by(desc(Panorama.upload_date))
-        
-        panoramas = query.paginate(
-            page=page,
-            per_page=per_page,
-            error_out=False
+        panoramas, pagination = paginate_listing(
+            query,
+            [desc_key(Panorama.upload_date), desc_key(Panorama.id)],
+            default_per_page=20
         )
         
         panoramas_data = []
-        for panorama, username in panoramas.items:
+        for panorama, username in panoramas:
             panorama_dict = panorama.to_dict()
             panorama_dict['username'] = username
             panoramas_data.append(panorama_dict)
         
         return jsonify({
             'panoramas': panoramas_data,
-            'pagination': {
-                'page': panoramas.page,
-                'pages': panoramas.pages,
-                'per_page': panoramas.per_page,
-                'total': panoramas.total,
-                'has_next': panoramas.has_next,
-                'has_prev': panoramas.has_prev
-            }
+            'pagination': pagination
         }), 200
         
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': f'Ошибка получения панорам: {str(e)}'}), 500
 
@@ -366,15 +378,19 @@ def delete_panorama_admin(panorama_id):
         if not panorama:
             return jsonify({'error': 'Панорама не найдена'}), 404
         
-        # Удаляем файл
-        if panorama.file_path and os.path.exists(panorama.file_path):
-            try:
-                os.remove(panorama.file_path)
-            except:
-                pass
+        # Освобождаем файл (удаляется после коммита, если на него не ссылаются другие панорамы)
+        release_blob(panorama.file_path)
+        remove_storage_usage([panorama])
+        count_removed_panoramas([panorama])
+        affected_tour_ids = get_panorama_tour_ids(panorama_id)
         
         db.session.delete(panorama)
         db.session.commit()
+        invalidate_tour_manifests(affected_tour_ids)
+        invalidate_user_stats(panorama.user_id)
+        
+        # Удаляем тайлы и другие производные файлы
+        remove_panorama_derivatives(panorama_id)
         
         return jsonify({'message': 'Панорама удалена'}), 200
         
@@ -384,11 +400,10 @@ def delete_panorama_admin(panorama_id):
 
 @app.route('/api/admin/tours', methods=['GET'])
 @admin_required
+@use_read_replica
 def get_all_tours():
     """Получение всех туров для модерации"""
     try:
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 20, type=int)
         search = request.args.get('search', '')
         
         query = db.session.query(Tour, User.username)\
@@ -402,32 +417,25 @@ def get_all_tours():
                 )
             )
         
-        query = query.order_by(desc(Tour.created_at))
-        
-        tours = query.paginate(
-            page=page,
-            per_page=per_page,
-            error_out=False
+        tours, pagination = paginate_listing(
+            query,
+            [desc_key(Tour.created_at), desc_key(Tour.id)],
+            default_per_page=20
         )
         
         tours_data = []
-        for tour, username in tours.items:
+        for tour, username in tours:
             tour_dict = tour.to_dict()
             tour_dict['username'] = username
             tours_data.append(tour_dict)
         
         return jsonify({
             'tours': tours_data,
-            'pagination': {
-                'page': tours.page,
-                'pages': tours.pages,
-                'per_page': tours.per_page,
-                'total': tours.total,
-                'has_next': tours.has_next,
-                'has_prev': tours.has_prev
-            }
+            'pagination': pagination
         }), 200
         
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': f'Ошибка получения туров: {str(e)}'}), 500
 
@@ -440,8 +448,10 @@ def delete_tour_admin(tour_id):
         if not tour:
             return jsonify({'error': 'Тур не найден'}), 404
         
+        count_removed_tour(tour.user_id)
         db.session.delete(tour)
         db.session.commit()
+        invalidate_tour_manifests([tour_id])
         
         return jsonify({'message': 'Тур удален'}), 200
         
@@ -481,6 +491,8 @@ def get_system_settings():
             },
             'system_info': {
                 'total_storage_used': get_total_storage_used(),
+                'storage_reconciliation': storage_reconciler.last_report,
+                'read_replica': get_read_replica_status(),
                 'server_uptime': get_server_uptime(),
                 'database_size': get_database_size()
             }
@@ -492,16 +504,9 @@ def get_system_settings():
         return jsonify({'error': f'Ошибка получения настроек: {str(e)}'}), 500
 
 def get_total_storage_used():
-    """Подсчет использованного места на диске"""
+    """Использованное место по счетчику (обновляется при загрузке и удалении панорам)"""
     try:
-        upload_folder = app.config.get('UPLOAD_FOLDER', 'uploads')
-        total_size = 0
-        if os.path.exists(upload_folder):
-            for dirpath, dirnames, filenames in os.walk(upload_folder):
-                for filename in filenames:
-                    filepath = os.path.join(dirpath, filename)
-                    total_size += os.path.getsize(filepath)
-        return total_size
+        return get_storage_usage()['bytes_used']
     except:
         return 0
 
@@ -520,16 +525,63 @@ def get_database_size():
 def cleanup_expired_content():
     """Очистка истекшего контента"""
     try:
-        # Используем функцию из utils.py
-        deleted_count = cleanup_expired_panoramas()
+        # Внеочередной проход фоновой очистки
+        result = sweeper.run_once()
         
         return jsonify({
-            'message': f'Очистка завершена. Удалено панорам: {deleted_count}'
+            'message': f'Очистка завершена. Удалено панорам: {result["removed"]["expired_panoramas"]}',
+            'removed': result['removed'],
+            'resumed': result['resumed']
         }), 200
         
     except Exception as e:
         return jsonify({'error': f'Ошибка очистки: {str(e)}'}), 500
 
+@app.route('/api/admin/sweeper', methods=['GET'])
+@admin_required
+def get_sweeper_stats():
+    """Статистика фоновой очистки"""
+    try:
+        return jsonify({'sweeper': sweeper.stats()}), 200
+    
+    except Exception as e:
+        return jsonify({'error': f'Ошибка получения статистики очистки: {str(e)}'}), 500
+
+@app.route('/api/admin/storage', methods=['GET'])
+@admin_required
+def get_storage_stats():
+    """Использованное место: общий счетчик, крупнейшие пользователи и результат последней сверки"""
+    try:
+        top_users = db.session.query(StorageUsage, User.username).join(
+            User, User.id == StorageUsage.user_id
+        ).order_by(desc(StorageUsage.bytes_used)).limit(10).all()
+        
+        return jsonify({
+            'usage': get_storage_usage(),
+            'top_users': [
+                {**usage.to_dict(), 'username': username}
+                for usage, username in top_users
+            ],
+            'reconciler': storage_reconciler.stats()
+        }), 200
+    
+    except Exception as e:
+        return jsonify({'error': f'Ошибка получения статистики хранилища: {str(e)}'}), 500
+
+@app.route('/api/admin/storage/reconcile', methods=['POST'])
+@admin_required
+def reconcile_storage():
+    """Внеочередная сверка счетчиков места с БД и диском"""
+    try:
+        report = storage_reconciler.reconcile()
+        if report is None:
+            return jsonify({'error': 'Не удалось выполнить сверку'}), 500
+        
+        return jsonify({'message': 'Сверка завершена', 'report': report}), 200
+    
+    except Exception as e:
+        return jsonify({'error': f'Ошибка сверки: {str(e)}'}), 500
+
 @app.route('/api/admin/backup', methods=['POST'])
 @admin_required
 def create_backup():
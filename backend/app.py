@@ -9,10 +9,10 @@ import uuid
 import hashlib
 
 # Импорт конфигурации
-from config import app, db, jwt, blacklisted_tokens
+from config import app, db, jwt
 
 # Импорт утилит
-from utils import cleanup_expired_panoramas
+from activity_log import record_activity
 
 # Разрешенные расширения для панорам
 ALLOWED_EXTENSIONS = {'jpg', 'jpeg', 'png'}
@@ -23,7 +23,7 @@ def allowed_file(filename):
 # Основной маршрут
 @app.route('/')
 def index():
-    from models import User, Panorama, Tour, UserSession
+    from models import User, Panorama, Tour
     from flask import request
     from datetime import datetime, timedelta
     
@@ -33,23 +33,13 @@ def index():
         'tours': Tour.query.count()
     }
     
-    # Создаем сессию для отслеживания посещений главной страницы
+    # Отмечаем посещение главной страницы в журнале активности
     try:
         from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
         verify_jwt_in_request(optional=True)
         user_id = get_jwt_identity()
         if user_id:
-            # Создание сессии для отслеживания активности
-            session = UserSession(
-                user_id=int(user_id),
-                token=f"home_{datetime.utcnow().timestamp()}",
-                expires_at=datetime.utcnow() + timedelta(hours=1),
-                ip_address=request.remote_addr,
-                user_agent=request.headers.get('User-Agent')
-            )
-            
-            db.session.add(session)
-            db.session.commit()
+            record_activity(user_id, 'home')
     except:
         pass  # Если пользователь не авторизован, просто продолжаем
     
@@ -63,34 +53,16 @@ def index():
 # Маршрут для проверки здоровья API
 @app.route('/api/health')
 def health_check():
-    # Очистка истекших панорам при каждой проверке
-    cleanup_expired_panoramas()
-    
-    # Очистка старых сессий
-    from utils import cleanup_old_sessions
-    cleanup_old_sessions()
-    
-    from models import User, UserSession
-    from flask import request
-    from datetime import datetime, timedelta
+    # Проверка живости без обращений к БД; очистка выполняется фоновым процессом (sweeper.py)
+    from datetime import datetime
     
-    # Создаем сессию для отслеживания посещений API
+    # Отмечаем обращение к API в журнале активности
     try:
         from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
         verify_jwt_in_request(optional=True)
         user_id = get_jwt_identity()
         if user_id:
-            # Создание сессии для отслеживания активности
-            session = UserSession(
-                user_id=int(user_id),
-                token=f"api_health_{datetime.utcnow().timestamp()}",
-                expires_at=datetime.utcnow() + timedelta(hours=1),
-                ip_address=request.remote_addr,
-                user_agent=request.headers.get('User-Agent')
-            )
-            
-            db.session.add(session)
-            db.session.commit()
+            record_activity(user_id, 'health')
     except:
         pass  # Если пользователь не авторизован, просто продолжаем
     
@@ -108,10 +80,19 @@ import user_management  # Импорт маршрутов управления 
 import panorama_api  # Импорт API панорам
 import tours_api  # Импорт API туров
 import admin_api  # Импорт админ API
+import jobs  # Импорт API фоновых задач
+import chunked_upload  # Импорт API загрузки по частям
+from sweeper import sweeper  # Фоновая очистка истекшего контента
+from stats_rollups import stats_rollups, count_new_user  # Фоновый пересчет статистики админ-панели
+from storage_usage import storage_reconciler  # Фоновая сверка счетчиков места на диске
+from search_index import ensure_search_index  # Полнотекстовый поиск (FTS5)
+from read_replica import replica_sync, ensure_read_replica  # Реплика для чтения
 
-if __name__ == '__main__':
+def init_database():
+    """Создание таблиц, поискового индекса и администратора по умолчанию"""
     with app.app_context():
         db.create_all()
+        ensure_search_index()
         
         # Создание администратора по умолчанию
         admin = User.query.filter_by(username='admin').first()
@@ -125,6 +106,8 @@ if __name__ == '__main__':
             admin.role = 'admin'
             admin.subscription_type = 'premium'
             db.session.add(admin)
+            db.session.flush()
+            count_new_user(admin)
             db.session.commit()
             print("👤 Создан администратор: admin / 209030Tes!")
         else:
@@ -133,10 +116,34 @@ if __name__ == '__main__':
             db.session.commit()
             print("👤 Пароль администратора обновлен: admin / 209030Tes!")
     
+        # Реплика SQLite должна содержать таблицы до первых запросов к ней
+        ensure_read_replica()
+
+def start_background_workers():
+    """Возобновление прерванных задач и запуск фоновых потоков (только в одном процессе сервера)"""
+    with app.app_context():
+        resumed_jobs = jobs.resume_unfinished_jobs()
+        if resumed_jobs:
+            print(f"⚙️  Возобновлено фоновых задач: {resumed_jobs}")
+        
+        sweeper.start()
+        stats_rollups.start()
+        storage_reconciler.start()
+        replica_sync.start()
+
+if __name__ == '__main__':
+    init_database()
+    
+    # Возобновление фоновых задач, прерванных перезапуском
+    # (только в рабочем процессе перезагрузчика, чтобы не запускать их дважды)
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_workers()
+    
     print("\n🚀 Panorama 360 App API Server запускается...")
     print("📱 Frontend: http://localhost:3000")
     print("🔧 API: http://localhost:5000")
     print("📊 Health check: http://localhost:5000/api/health")
-    print("👤 Админ: admin / 209030Tes!\n")
+    print("👤 Админ: admin / 209030Tes!")
+    print("⚠️  Это сервер разработки; для продакшна: python serve.py\n")
     
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -1,10 +1,15 @@
 from flask import request, jsonify
-from flask_jwt_extended import create_access_token, get_jwt_identity, get_jwt, jwt_required
+from flask_jwt_extended import create_access_token, get_jwt, jwt_required
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
 import re
-from config import app, db, blacklisted_tokens
+from config import app, db
 from models import User, UserSession
+from tour_manifest import get_user_tour_ids, invalidate_tour_manifests
+from activity_log import record_activity
+from token_revocation import revoke_token
+from current_user import get_current_user, get_current_user_id, invalidate_user_state
+from stats_rollups import count_new_user
 
 def validate_email(email):
     """Валидация email адреса"""
@@ -61,6 +66,8 @@ def register():
         )
         
         db.session.add(user)
+        db.session.flush()
+        count_new_user(user)
         db.session.commit()
         
         # Создание токена доступа
@@ -80,6 +87,7 @@ def register():
         
         db.session.add(session)
         db.session.commit()
+        record_activity(user.id, 'register')
         
         return jsonify({
             'message': 'Регистрация успешна',
@@ -136,6 +144,7 @@ def login():
         
         db.session.add(session)
         db.session.commit()
+        record_activity(user.id, 'login')
         
         return jsonify({
             'message': 'Авторизация успешна',
@@ -152,13 +161,13 @@ def logout():
     """Выход из системы"""
     try:
         jti = get_jwt()['jti']
-        user_id = get_jwt_identity()
+        user_id = get_current_user_id()
         
-        # Добавляем токен в черный список
-        blacklisted_tokens.add(jti)
+        # Отзываем токен до истечения его срока (во всех процессах сервера)
+        revoke_token(jti, datetime.utcfromtimestamp(get_jwt()['exp']))
         
         # Удаляем сессию из базы данных
-        session = UserSession.query.filter_by(user_id=int(user_id), token=request.headers.get('Authorization', '').replace('Bearer ', '')).first()
+        session = UserSession.query.filter_by(user_id=user_id, token=request.headers.get('Authorization', '').replace('Bearer ', '')).first()
         if session:
             db.session.delete(session)
             db.session.commit()
@@ -173,8 +182,7 @@ def logout():
 def get_profile():
     """Получение профиля текущего пользователя"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(int(user_id))
+        user = get_current_user()
         
         if not user:
             return jsonify({'error': 'Пользователь не найден'}), 404
@@ -191,8 +199,7 @@ def get_profile():
 def update_profile():
     """Обновление профиля пользователя"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(int(user_id))
+        user = get_current_user()
         
         if not user:
             return jsonify({'error': 'Пользователь не найден'}), 404
@@ -230,6 +237,11 @@ def update_profile():
         
         user.updated_at = datetime.utcnow()
         db.session.commit()
+        invalidate_user_state(user.id)
+        
+        # Имя владельца входит в манифесты туров
+        if 'username' in data:
+            invalidate_tour_manifests(get_user_tour_ids(user.id))
         
         return jsonify({
             'message': 'Профиль обновлен успешно',
@@ -245,8 +257,7 @@ def update_profile():
 def change_password():
     """Смена пароля пользователя"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(int(user_id))
+        user = get_current_user()
         
         if not user:
             return jsonify({'error': 'Пользователь не найден'}), 404
@@ -283,8 +294,7 @@ def change_password():
 def refresh_token():
     """Обновление токена доступа"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(int(user_id))
+        user = get_current_user()
         
         if not user or not user.is_active:
             return jsonify({'error': 'Пользователь не найден или заблокирован'}), 404
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Сравнение планов (EXPLAIN QUERY PLAN) и времени частых запросов без индексов из models.py и с ними
+
+python benchmark_query_plans.py [--panoramas 100000] [--runs 5]
+
+База создается во временном файле и заполняется тестовыми данными, рабочая база не затрагивается.
+"""
+
+import os
+import sys
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+# Добавляем путь к backend в sys.path
+backend_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, backend_path)
+
+from sqlalchemy import create_engine
+from config import db
+import models  # Регистрирует таблицы и индексы в db.metadata
+from migrate_indexes import get_index_statements
+
+NOW = datetime(2024, 6, 1, 12, 0, 0)
+
+# Запросы в том виде, в каком их выполняют API и фоновые задачи
+QUERIES = [
+    ('Галерея: первая страница', """
+        SELECT id FROM panoramas
+        WHERE is_public = 1 AND tour_only = 0 AND (is_permanent = 1 OR expires_at > :now)
+        ORDER BY upload_date DESC, id DESC LIMIT 13
+    """),
+    ('Галерея: страница по курсору', """
+        SELECT id FROM panoramas
+        WHERE is_public = 1 AND tour_only = 0 AND (is_permanent = 1 OR expires_at > :now)
+          AND (upload_date < :cursor_date OR (upload_date = :cursor_date AND id < :cursor_id))
+        ORDER BY upload_date DESC, id DESC LIMIT 13
+    """),
+    ('Панорамы пользователя', """
+        SELECT id FROM panoramas WHERE user_id = :user_id AND tour_only = 0
+        ORDER BY upload_date DESC, id DESC LIMIT 11
+    """),
+    ('Лимит загрузок за день', """
+        SELECT count(*) FROM panoramas
+        WHERE user_id = :user_id AND upload_date >= :day_start AND upload_date < :day_end
+    """),
+    ('Очистка истекших панорам', """
+        SELECT id, user_id, file_path, file_size FROM panoramas
+        WHERE expires_at <= :now AND is_permanent = 0 LIMIT 500
+    """),
+    ('Туры: публичный список', """
+        SELECT id FROM tours WHERE is_public = 1 ORDER BY created_at DESC, id DESC LIMIT 13
+    """),
+    ('Туры пользователя', """
+        SELECT id FROM tours WHERE user_id = :user_id ORDER BY created_at DESC, id DESC LIMIT 11
+    """),
+    ('Сцены тура', """
+        SELECT * FROM tour_panoramas WHERE tour_id = :tour_id ORDER BY order_index
+    """),
+    ('Туры с панорамой', """
+        SELECT tour_id FROM tour_panoramas WHERE panorama_id = :panorama_id
+    """),
+    ('Панорама уже в туре', """
+        SELECT id FROM tour_panoramas WHERE tour_id = :tour_id AND panorama_id = :panorama_id LIMIT 1
+    """),
+    ('Переходы внутри тура', """
+        SELECT * FROM hotspots
+        WHERE from_panorama_id IN (:p1, :p2, :p3, :p4) AND to_panorama_id IN (:p1, :p2, :p3, :p4)
+    """),
+    ('Удаление переходов панорамы', """
+        SELECT id FROM hotspots WHERE from_panorama_id = :panorama_id OR to_panorama_id = :panorama_id
+    """),
+    ('Очистка старых сессий', """
+        SELECT id FROM user_sessions WHERE created_at < :month_ago LIMIT 500
+    """),
+    ('Задачи в обработке у пользователя', """
+        SELECT count(*) FROM processing_jobs
+        WHERE user_id = :user_id AND status = 'pending' AND created_at >= :day_start AND created_at < :day_end
+    """),
+    ('Последняя активность пользователя', """
+        SELECT max(created_at) FROM activity_log WHERE user_id = :user_id
+    """),
+    ('Пользователи в админ-панели', """
+        SELECT id FROM users ORDER BY created_at DESC, id DESC LIMIT 21
+    """),
+]
+
+def create_schema(db_path):
+    """Таблицы из models.py без индексов (кроме уникальных колонок и первичных ключей)"""
+    engine = create_engine(f'sqlite:///{db_path}')
+    db.metadata.create_all(engine)
+    engine.dispose()
+    
+    conn = sqlite3.connect(db_path)
+    for index_name, _, _ in get_index_statements():
+        conn.execute(f"DROP INDEX IF EXISTS {index_name}")
+    conn.commit()
+    return conn
+
+def fill_data(conn, panorama_count):
+    """Тестовые данные с пропорциями, похожими на рабочую базу"""
+    random.seed(42)
+    user_count = max(10, panorama_count // 50)
+    tour_count = max(10, panorama_count // 20)
+    
+    def moment(days):
+        return NOW - timedelta(days=random.random() * days)
+    
+    conn.executemany(
+        "INSERT INTO users (id, username, email, password_hash, subscription_type, role, created_at, is_active)"
+        " VALUES (?, ?, ?, 'x', ?, 'user', ?, 1)",
+        [(i, f'user{i}', f'user{i}@example.com', random.choice(['free', 'premium']), moment(365))
+         for i in range(1, user_count + 1)]
+    )
+    
+    panoramas = []
+    for i in range(1, panorama_count + 1):
+        uploaded = moment(365)
+        is_permanent = random.random() < 0.3
+        panoramas.append((
+            i, random.randint(1, user_count), f'Панорама {i}', f'blobs/{i}.jpg', 1000000, 4096, 2048,
+            uploaded, None if is_permanent else uploaded + timedelta(days=1), is_permanent,
+            random.random() < 0.8, f'p{i}', random.random() < 0.2
+        ))
+    conn.executemany(
+        "INSERT INTO panoramas (id, user_id, title, file_path, file_size, width, height, upload_date,"
+        " expires_at, is_permanent, is_public, embed_code, tour_only)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        panoramas
+    )
+    
+    conn.executemany(
+        "INSERT INTO tours (id, user_id, title, created_at, updated_at, is_public, embed_code)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(i, random.randint(1, user_count), f'Тур {i}', moment(365), NOW, random.random() < 0.7, f't{i}')
+         for i in range(1, tour_count + 1)]
+    )
+    
+    tour_panoramas = []
+    hotspots = []
+    for tour_id in range(1, tour_count + 1):
+        scene_ids = random.sample(range(1, panorama_count + 1), 4)
+        for order_index, panorama_id in enumerate(scene_ids):
+            tour_panoramas.append((tour_id, panorama_id, order_index))
+        for from_id, to_id in zip(scene_ids, scene_ids[1:]):
+            hotspots.append((from_id, to_id, 0.0, 0.0, 0.0))
+    conn.executemany(
+        "INSERT INTO tour_panoramas (tour_id, panorama_id, order_index) VALUES (?, ?, ?)", tour_panoramas
+    )
+    conn.executemany(
+        "INSERT INTO hotspots (from_panorama_id, to_panorama_id, position_x, position_y, position_z)"
+        " VALUES (?, ?, ?, ?, ?)",
+        hotspots
+    )
+    
+    conn.executemany(
+        "INSERT INTO user_sessions (user_id, token, expires_at, created_at) VALUES (?, ?, ?, ?)",
+        [(random.randint(1, user_count), f'token{i}', NOW, moment(60)) for i in range(panorama_count // 5)]
+    )
+    conn.executemany(
+        "INSERT INTO processing_jobs (id, user_id, job_type, status, payload, created_at, updated_at)"
+        " VALUES (?, ?, 'panorama_upload', ?, '{}', ?, ?)",
+        [(f'job{i}', random.randint(1, user_count), random.choice(['completed'] * 9 + ['pending']), moment(30), NOW)
+         for i in range(panorama_count // 2)]
+    )
+    conn.executemany(
+        "INSERT INTO activity_log (user_id, event_type, created_at) VALUES (?, 'home', ?)",
+        [(random.randint(1, user_count), moment(90)) for _ in range(panorama_count * 2)]
+    )
+    conn.commit()
+    
+    return {
+        'now': NOW,
+        'cursor_date': NOW - timedelta(days=180),
+        'cursor_id': panorama_count // 2,
+        'user_id': user_count // 2,
+        'day_start': datetime.combine(NOW.date(), datetime.min.time()),
+        'day_end': datetime.combine(NOW.date(), datetime.min.time()) + timedelta(days=1),
+        'month_ago': NOW - timedelta(days=30),
+        'tour_id': tour_count // 2,
+        'panorama_id': tour_panoramas[len(tour_panoramas) // 2][1],
+        'p1': tour_panoramas[0][1], 'p2': tour_panoramas[1][1],
+        'p3': tour_panoramas[2][1], 'p4': tour_panoramas[3][1]
+    }
+
+def measure(conn, params, runs):
+    """План и медианное время каждого запроса"""
+    sqlite_params = {
+        key: value.isoformat(' ') if isinstance(value, datetime) else value
+        for key, value in params.items()
+    }
+    results = {}
+    for name, sql in QUERIES:
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", sqlite_params)]
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            conn.execute(sql, sqlite_params).fetchall()
+            timings.append(time.perf_counter() - started)
+        results[name] = (plan, sorted(timings)[len(timings) // 2])
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Планы частых запросов без индексов и с ними')
+    parser.add_argument('--panoramas', type=int, default=100000, help='Число панорам в тестовой базе')
+    parser.add_argument('--runs', type=int, default=5, help='Повторов каждого запроса')
+    args = parser.parse_args()
+    
+    db_path = os.path.join(tempfile.mkdtemp(prefix='panorama-bench-'), 'bench.db')
+    print(f"📋 Тестовая база: {db_path}")
+    
+    conn = create_schema(db_path)
+    print(f"🔄 Заполняем тестовыми данными ({args.panoramas} панорам)...")
+    params = fill_data(conn, args.panoramas)
+    conn.execute("ANALYZE")
+    
+    before = measure(conn, params, args.runs)
+    
+    print("🔄 Создаем индексы из models.py...")
+    for _, _, sql in get_index_statements():
+        conn.execute(sql)
+    conn.execute("ANALYZE")
+    conn.commit()
+    
+    after = measure(conn, params, args.runs)
+    conn.close()
+    
+    for name, _ in QUERIES:
+        plan_before, time_before = before[name]
+        plan_after, time_after = after[name]
+        speedup = time_before / time_after if time_after else float('inf')
+        print(f"\n=== {name}: {time_before * 1000:.2f} мс -> {time_after * 1000:.2f} мс (x{speedup:.1f})")
+        print("  без индексов:")
+        for line in plan_before:
+            print(f"    {line}")
+        print("  с индексами:")
+        for line in plan_after:
+            print(f"    {line}")
+    
+    os.remove(db_path)
+    os.rmdir(os.path.dirname(db_path))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Чтение во время записи в SQLite: режим журнала по умолчанию против PRAGMA из db_engine.py (WAL и др.)
+
+python benchmark_sqlite_concurrency.py [--readers 8] [--writers 1] [--duration 10]
+
+Писатели коммитят обновления счетчиков просмотров и сессий, читатели выполняют запрос галереи.
+База создается во временном файле, рабочая база не затрагивается.
+"""
+
+import os
+import sys
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+import threading
+from datetime import datetime, timedelta
+
+# Добавляем путь к backend в sys.path
+backend_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, backend_path)
+
+from sqlalchemy import create_engine
+from config import app, db
+import models  # Регистрирует таблицы в db.metadata
+from db_engine import get_sqlite_pragmas
+
+NOW = datetime(2024, 6, 1, 12, 0, 0)
+
+READ_SQL = """
+    SELECT id, title, view_count FROM panoramas
+    WHERE is_public = 1 AND tour_only = 0 AND (is_permanent = 1 OR expires_at > ?)
+    ORDER BY upload_date DESC, id DESC LIMIT 12
+"""
+
+PROFILES = [
+    ('по умолчанию', [('journal_mode', 'DELETE'), ('synchronous', 'FULL')]),
+    ('db_engine.py', get_sqlite_pragmas(app.config))
+]
+
+def create_database(db_path, panorama_count):
+    engine = create_engine(f'sqlite:///{db_path}')
+    db.metadata.create_all(engine)
+    engine.dispose()
+    
+    random.seed(42)
+    conn = sqlite3.connect(db_path)
+    conn.executemany(
+        "INSERT INTO users (id, username, email, password_hash, created_at) VALUES (?, ?, ?, 'x', ?)",
+        [(i, f'user{i}', f'user{i}@example.com', NOW) for i in range(1, 101)]
+    )
+    conn.executemany(
+        "INSERT INTO panoramas (id, user_id, title, file_path, file_size, width, height, upload_date,"
+        " is_permanent, is_public, embed_code, tour_only, view_count)"
+        " VALUES (?, ?, ?, ?, 1000000, 4096, 2048, ?, 1, 1, ?, 0, 0)",
+        [(i, random.randint(1, 100), f'Панорама {i}', f'blobs/{i}.jpg',
+          NOW - timedelta(minutes=i), f'p{i}') for i in range(1, panorama_count + 1)]
+    )
+    conn.commit()
+    conn.close()
+
+def connect(db_path, pragmas):
+    conn = sqlite3.connect(db_path, timeout=app.config['SQLITE_BUSY_TIMEOUT'] / 1000, check_same_thread=False)
+    for name, value in pragmas:
+        conn.execute(f"PRAGMA {name}={value}").fetchall()
+    return conn
+
+def run_profile(db_path, pragmas, readers, writers, duration, panorama_count):
+    deadline = time.monotonic() + duration
+    read_latencies = []
+    write_count = [0]
+    errors = [0]
+    lock = threading.Lock()
+    
+    def reader():
+        conn = connect(db_path, pragmas)
+        latencies = []
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                conn.execute(READ_SQL, (NOW.isoformat(' '),)).fetchall()
+                latencies.append(time.perf_counter() - started)
+            except sqlite3.OperationalError:
+                with lock:
+                    errors[0] += 1
+        conn.close()
+        with lock:
+            read_latencies.extend(latencies)
+    
+    def writer():
+        conn = connect(db_path, pragmas)
+        commits = 0
+        while time.monotonic() < deadline:
+            try:
+                # Как сброс счетчиков просмотров (view_counter.py) и запись сессии при входе
+                conn.executemany(
+                    "UPDATE panoramas SET view_count = view_count + 1 WHERE id = ?",
+                    [(random.randint(1, panorama_count),) for _ in range(50)]
+                )
+                conn.execute(
+                    "INSERT INTO user_sessions (user_id, token, expires_at, created_at) VALUES (?, ?, ?, ?)",
+                    (random.randint(1, 100), f'token{random.random()}', NOW, NOW)
+                )
+                conn.commit()
+                commits += 1
+            except sqlite3.OperationalError:
+                conn.rollback()
+                with lock:
+                    errors[0] += 1
+        conn.close()
+        with lock:
+            write_count[0] += commits
+    
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=writer) for _ in range(writers)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    
+    read_latencies.sort()
+    
+    def percentile(p):
+        if not read_latencies:
+            return 0.0
+        return read_latencies[min(len(read_latencies) - 1, int(len(read_latencies) * p))] * 1000
+    
+    return {
+        'reads': len(read_latencies) / elapsed,
+        'writes': write_count[0] / elapsed,
+        'p50': percentile(0.50),
+        'p99': percentile(0.99),
+        'errors': errors[0]
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Чтение во время записи в SQLite с PRAGMA и без')
+    parser.add_argument('--panoramas', type=int, default=20000, help='Число панорам в тестовой базе')
+    parser.add_argument('--readers', type=int, default=8, help='Потоков чтения')
+    parser.add_argument('--writers', type=int, default=1, help='Потоков записи')
+    parser.add_argument('--duration', type=float, default=10, help='Секунд на каждый вариант')
+    args = parser.parse_args()
+    
+    results = []
+    for name, pragmas in PROFILES:
+        db_dir = tempfile.mkdtemp(prefix='panorama-sqlite-bench-')
+        db_path = os.path.join(db_dir, 'bench.db')
+        print(f"🔄 {name}: {', '.join(f'{key}={value}' for key, value in pragmas)}")
+        create_database(db_path, args.panoramas)
+        results.append((name, run_profile(db_path, pragmas, args.readers, args.writers, args.duration, args.panoramas)))
+        for file_name in os.listdir(db_dir):
+            os.remove(os.path.join(db_dir, file_name))
+        os.rmdir(db_dir)
+    
+    print(f"\n{'Вариант':<14} {'чтений/с':>10} {'p50, мс':>10} {'p99, мс':>10} {'коммитов/с':>12} {'ошибок':>8}")
+    for name, result in results:
+        print(f"{name:<14} {result['reads']:>10.1f} {result['p50']:>10.2f} {result['p99']:>10.2f} "
+              f"{result['writes']:>12.1f} {result['errors']:>8}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+import os
+import time
+import uuid
+import hashlib
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql, sqlite
+from config import app, db
+from db_engine import RoutingSession
+from models import Blob
+
+# Размер блока при потоковой записи и хэшировании
+STREAM_BLOCK_SIZE = 1024 * 1024
+
+# Файлы, освобожденные в текущей транзакции сессии: (путь, файл в корзине или None)
+RELEASED_FILES_KEY = 'released_blob_files'
+
+# Возраст файла в корзине, после которого его транзакция точно завершена
+TOMBSTONE_GRACE_SECONDS = 3600
+
+def normalize_extension(filename):
+    """Расширение файла в едином виде (jpeg -> jpg)"""
+    extension = filename.rsplit('.', 1)[1].lower()
+    return 'jpg' if extension == 'jpeg' else extension
+
+def get_blob_path(content_hash, extension):
+    """Путь к файлу в хранилище: blobs/<первые 2 символа хэша>/<хэш>.<расширение>"""
+    return os.path.join(app.config['BLOBS_FOLDER'], content_hash[:2], f"{content_hash}.{extension}")
+
+def get_blob_temp_path():
+    """Временный файл внутри хранилища (перемещение в blobs/ будет атомарным)"""
+    temp_folder = os.path.join(app.config['BLOBS_FOLDER'], '.tmp')
+    os.makedirs(temp_folder, exist_ok=True)
+    return os.path.join(temp_folder, uuid.uuid4().hex)
+
+def store_blob_stream(stream, filename):
+    """Сохранение загружаемого потока с вычислением SHA-256 по ходу записи, возвращает Blob"""
+    temp_path = get_blob_temp_path()
+    digest = hashlib.sha256()
+    size = 0
+    
+    try:
+        with open(temp_path, 'wb') as f:
+            for block in iter(lambda: stream.read(STREAM_BLOCK_SIZE), b''):
+                digest.update(block)
+                f.write(block)
+                size += len(block)
+        
+        return _acquire_blob(temp_path, digest.hexdigest(), normalize_extension(filename), size)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def store_blob_file(file_path, filename):
+    """Перенос уже собранного файла (загрузка по частям) в хранилище, возвращает Blob"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(STREAM_BLOCK_SIZE), b''):
+            digest.update(block)
+    
+    try:
+        return _acquire_blob(file_path, digest.hexdigest(), normalize_extension(filename), os.path.getsize(file_path))
+    finally:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+def _acquire_blob(source_path, content_hash, extension, size):
+    """Увеличение счетчика ссылок; файл кладется в хранилище, только если такого содержимого еще нет"""
+    # Одна команда INSERT ... ON CONFLICT: две одновременные первые загрузки одного файла
+    # не вставляют запись дважды (в PostgreSQL UPDATE + INSERT здесь не сериализуется)
+    insert = postgresql.insert if db.engine.dialect.name == 'postgresql' else sqlite.insert
+    statement = insert(Blob).values(
+        content_hash=content_hash,
+        file_path=get_blob_path(content_hash, extension),
+        size=size,
+        ref_count=1
+    ).on_conflict_do_update(
+        index_elements=[Blob.content_hash],
+        set_={'ref_count': Blob.ref_count + 1}
+    )
+    db.session.execute(statement)
+    blob = db.session.get(Blob, content_hash, populate_existing=True)
+    
+    # Только что созданная запись (ref_count == 1) всегда получает свой файл: старый файл на диске
+    # может принадлежать удаленной записи и уже переноситься в корзину. Для дубликата временный
+    # файл просто удаляется вызывающей функцией
+    if blob.ref_count == 1 or not os.path.exists(blob.file_path):
+        os.makedirs(os.path.dirname(blob.file_path), exist_ok=True)
+        os.replace(source_path, blob.file_path)
+    
+    return blob
+
+def release_blob(file_path):
+    """Освобождение ссылки на файл панорамы; True, если ссылок не осталось.
+    Такой файл удаляется после коммита транзакции, а при откате остается на месте"""
+    blob = Blob.query.filter_by(file_path=file_path).first()
+    
+    if not blob:
+        # Файл загружен до появления хранилища и принадлежит только одной панораме
+        _remove_after_commit(file_path, None)
+        return True
+    
+    Blob.query.filter_by(content_hash=blob.content_hash).update(
+        {Blob.ref_count: Blob.ref_count - 1}, synchronize_session=False
+    )
+    db.session.refresh(blob)
+    
+    if blob.ref_count > 0:
+        return False
+    
+    db.session.delete(blob)
+    db.session.flush()
+    
+    # Файл переносится в корзину до коммита: загрузка того же содержимого, которая создаст
+    # новую запись после коммита, положит свой файл уже после переноса, и удаление его не затронет
+    tombstone = _move_to_tombstone(file_path)
+    if tombstone:
+        _remove_after_commit(file_path, tombstone)
+    return True
+
+def get_tombstones_folder():
+    """Корзина хранилища: файлы освобожденных записей до коммита удаления"""
+    return os.path.join(app.config['BLOBS_FOLDER'], '.deleted')
+
+def _move_to_tombstone(file_path):
+    tombstones_folder = get_tombstones_folder()
+    os.makedirs(tombstones_folder, exist_ok=True)
+    tombstone = os.path.join(tombstones_folder, f"{uuid.uuid4().hex}-{os.path.basename(file_path)}")
+    try:
+        os.replace(file_path, tombstone)
+    except FileNotFoundError:
+        return None
+    return tombstone
+
+def _remove_after_commit(file_path, tombstone):
+    db.session.info.setdefault(RELEASED_FILES_KEY, []).append((file_path, tombstone))
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _remove_released_files(session):
+    for file_path, tombstone in session.info.pop(RELEASED_FILES_KEY, []):
+        _remove_file(tombstone or file_path)
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def _restore_released_files(session, transaction):
+    # После коммита список уже пуст; здесь остаются файлы отмененной транзакции
+    if transaction.parent is not None:
+        return
+    for file_path, tombstone in session.info.pop(RELEASED_FILES_KEY, []):
+        if tombstone:
+            _restore_file(tombstone, file_path)
+
+def _restore_file(tombstone, file_path):
+    # Содержимое адресуется хэшем: если файл уже положен заново, он точно такой же
+    try:
+        os.replace(tombstone, file_path)
+    except Exception as e:
+        print(f"Ошибка восстановления файла {file_path}: {e}")
+
+def _remove_file(file_path):
+    if file_path and os.path.exists(file_path):
+        try:
+            os.remove(file_path)
+        except Exception as e:
+            print(f"Ошибка удаления файла {file_path}: {e}")
+
+def discard_orphan_blob(file_path):
+    """Удаление файла, на который не осталось записи (после отката неудачной загрузки)"""
+    if Blob.query.filter_by(file_path=file_path).first():
+        return
+    
+    tombstone = _move_to_tombstone(file_path)
+    if not tombstone:
+        return
+    
+    # Запись могла появиться, пока файл переносился; загрузки после переноса кладут свой файл сами
+    if Blob.query.filter_by(file_path=file_path).first():
+        _restore_file(tombstone, file_path)
+    else:
+        _remove_file(tombstone)
+
+def cleanup_blob_tombstones(batch_size=None):
+    """Разбор корзины после падения процесса между переносом файла и коммитом: файл живой записи
+    возвращается на место, остальные удаляются"""
+    tombstones_folder = get_tombstones_folder()
+    if not os.path.isdir(tombstones_folder):
+        return 0
+    
+    batch_size = batch_size or app.config['SWEEPER_BATCH_SIZE']
+    # Свежие файлы еще могут принадлежать незавершенной транзакции
+    cutoff = time.time() - TOMBSTONE_GRACE_SECONDS
+    
+    removed = 0
+    for name in os.listdir(tombstones_folder)[:batch_size]:
+        tombstone = os.path.join(tombstones_folder, name)
+        try:
+            if os.path.getmtime(tombstone) > cutoff:
+                continue
+        except OSError:
+            continue
+        
+        content_hash = name.split('-', 1)[-1].split('.', 1)[0]
+        blob = db.session.get(Blob, content_hash)
+        if blob and not os.path.exists(blob.file_path):
+            os.makedirs(os.path.dirname(blob.file_path), exist_ok=True)
+            _restore_file(tombstone, blob.file_path)
+        else:
+            _remove_file(tombstone)
+            removed += 1
+    return removed
@@ -0,0 +1,265 @@
+import os
+import shutil
+from datetime import datetime
+from flask import request, jsonify
+from flask_jwt_extended import jwt_required
+from werkzeug.utils import secure_filename
+from config import app, db, allowed_file
+from models import Tour, ChunkedUpload
+from current_user import get_current_user, get_current_user_id
+from jobs import enqueue_panorama_upload
+from blob_store import store_blob_file, discard_orphan_blob, get_blob_temp_path
+
+# Размер блока при потоковой записи части на диск
+STREAM_BLOCK_SIZE = 1024 * 1024
+
+def get_assembly_path(upload_id):
+    """Путь к файлу, в который собираются части загрузки"""
+    return os.path.join(app.config['CHUNKED_UPLOAD_FOLDER'], f"{upload_id}.part")
+
+def get_user_upload(upload_id):
+    """Поиск загрузки текущего пользователя, возвращает (upload, ответ с ошибкой)"""
+    user_id = get_current_user_id()
+    upload = ChunkedUpload.query.get(upload_id)
+    
+    if not upload or upload.user_id != int(user_id):
+        return None, (jsonify({'error': 'Загрузка не найдена'}), 404)
+    
+    if upload.expires_at <= datetime.utcnow():
+        return None, (jsonify({'error': 'Срок действия загрузки истек'}), 410)
+    
+    return upload, None
+
+def remove_chunked_upload(upload):
+    """Удаление загрузки вместе с недокачанным файлом"""
+    assembly_path = get_assembly_path(upload.id)
+    if os.path.exists(assembly_path):
+        try:
+            os.remove(assembly_path)
+        except Exception as e:
+            print(f"Ошибка удаления файла загрузки {assembly_path}: {e}")
+    db.session.delete(upload)
+
+@app.route('/api/uploads', methods=['POST'])
+@jwt_required()
+def init_chunked_upload():
+    """Начало загрузки панорамы по частям"""
+    try:
+        user_id = get_current_user_id()
+        user = get_current_user()
+        
+        if not user:
+            return jsonify({'error': 'Пользователь не найден'}), 404
+        
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({'error': 'Нет данных для загрузки'}), 400
+        
+        filename = secure_filename(data.get('filename', ''))
+        title = data.get('title', '').strip()
+        description = data.get('description', '').strip()
+        is_public = bool(data.get('is_public', True))
+        tour_id = data.get('tour_id')
+        total_size = data.get('total_size')
+        
+        if not filename:
+            return jsonify({'error': 'Файл не выбран'}), 400
+        
+        if not title:
+            return jsonify({'error': 'Название панорамы обязательно'}), 400
+        
+        if not allowed_file(filename):
+            return jsonify({'error': 'Неподдерживаемый формат файла. Используйте JPG, JPEG или PNG'}), 400
+        
+        if not isinstance(total_size, int) or total_size <= 0:
+            return jsonify({'error': 'Размер файла обязателен'}), 400
+        
+        max_size = app.config['CHUNKED_UPLOAD_MAX_SIZE']
+        if total_size > max_size:
+            return jsonify({'error': f'Файл слишком большой. Максимальный размер: {max_size // (1024 * 1024)}MB'}), 400
+        
+        if tour_id:
+            tour = Tour.query.get(tour_id)
+            if not tour:
+                return jsonify({'error': 'Тур не найден'}), 404
+            if tour.user_id != int(user_id) and not user.is_admin():
+                return jsonify({'error': 'Недостаточно прав'}), 403
+        elif not user.can_upload_panorama():
+            return jsonify({
+                'error': 'Превышен лимит загрузок',
+                'message': 'Бесплатные пользователи могут загружать до 3 панорам в день. Оформите премиум подписку для безлимитных загрузок.'
+            }), 403
+        
+        upload = ChunkedUpload(
+            user_id=int(user_id),
+            filename=filename,
+            title=title,
+            description=description,
+            total_size=total_size,
+            expires_at=datetime.utcnow() + app.config['CHUNKED_UPLOAD_EXPIRES'],
+            is_public=is_public,
+            tour_id=tour_id
+        )
+        
+        # Пустой файл сборки, части дописываются в него по смещению
+        open(get_assembly_path(upload.id), 'wb').close()
+        
+        db.session.add(upload)
+        db.session.commit()
+        
+        return jsonify({
+            'message': 'Загрузка создана',
+            'upload': upload.to_dict(),
+            'chunk_size': app.config['CHUNKED_UPLOAD_CHUNK_SIZE']
+        }), 201
+    
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Ошибка создания загрузки: {str(e)}'}), 500
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+@jwt_required()
+def get_chunked_upload(upload_id):
+    """Состояние загрузки (для возобновления с последнего полученного байта)"""
+    try:
+        upload, error = get_user_upload(upload_id)
+        if error:
+            return error
+        
+        return jsonify({'upload': upload.to_dict()}), 200
+    
+    except Exception as e:
+        return jsonify({'error': f'Ошибка получения загрузки: {str(e)}'}), 500
+
+@app.route('/api/uploads/<upload_id>', methods=['PUT'])
+@jwt_required()
+def upload_chunk(upload_id):
+    """Прием очередной части файла (смещение передается в параметре offset)"""
+    try:
+        upload, error = get_user_upload(upload_id)
+        if error:
+            return error
+        
+        offset = request.args.get('offset', type=int)
+        if offset is None:
+            return jsonify({'error': 'Не указано смещение части'}), 400
+        
+        # Принимаем только продолжение с последнего сохраненного байта
+        if offset != upload.received_size:
+            return jsonify({
+                'error': 'Неверное смещение части',
+                'upload': upload.to_dict()
+            }), 409
+        
+        remaining = upload.total_size - upload.received_size
+        chunk_length = request.content_length
+        if not chunk_length:
+            return jsonify({'error': 'Пустая часть файла'}), 400
+        
+        if chunk_length > remaining:
+            return jsonify({'error': 'Часть выходит за пределы объявленного размера файла'}), 400
+        
+        # Пишем тело запроса на диск блоками, не держа его в памяти
+        written = 0
+        with open(get_assembly_path(upload.id), 'r+b') as f:
+            f.seek(offset)
+            while written < chunk_length:
+                block = request.stream.read(min(STREAM_BLOCK_SIZE, chunk_length - written))
+                if not block:
+                    break
+                f.write(block)
+                written += len(block)
+            # Отбрасываем хвост от предыдущей оборванной попытки
+            f.truncate(offset + written)
+        
+        upload.received_size = offset + written
+        upload.updated_at = datetime.utcnow()
+        db.session.commit()
+        
+        return jsonify({'upload': upload.to_dict()}), 200
+    
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Ошибка загрузки части: {str(e)}'}), 500
+
+@app.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+@jwt_required()
+def complete_chunked_upload(upload_id):
+    """Завершение загрузки и передача файла в фоновую обработку"""
+    try:
+        upload, error = get_user_upload(upload_id)
+        if error:
+            return error
+        
+        if not upload.is_complete():
+            return jsonify({
+                'error': 'Файл загружен не полностью',
+                'upload': upload.to_dict()
+            }), 400
+        
+        # Лимит проверяется и здесь: иначе можно открыть несколько загрузок до его исчерпания
+        if not upload.tour_id:
+            user = get_current_user()
+            if not user or not user.can_upload_panorama():
+                return jsonify({
+                    'error': 'Превышен лимит загрузок',
+                    'message': 'Бесплатные пользователи могут загружать до 3 панорам в день. Оформите премиум подписку для безлимитных загрузок.'
+                }), 403
+        
+        # В хранилище уходит копия (жесткая ссылка) собранного файла: сам файл и загрузка
+        # остаются до успешной постановки в очередь, чтобы complete можно было повторить
+        staged_path = get_blob_temp_path()
+        try:
+            os.link(get_assembly_path(upload.id), staged_path)
+        except OSError:
+            shutil.copyfile(get_assembly_path(upload.id), staged_path)
+        blob = store_blob_file(staged_path, upload.filename)
+        file_path = blob.file_path
+        
+        job = enqueue_panorama_upload(
+            user_id=upload.user_id,
+            file_path=file_path,
+            file_size=upload.total_size,
+            title=upload.title,
+            description=upload.description,
+            is_public=upload.is_public if not upload.tour_id else False,
+            tour_id=upload.tour_id,
+            content_hash=blob.content_hash
+        )
+        
+        db.session.delete(upload)
+        db.session.commit()
+        os.remove(get_assembly_path(upload_id))
+        
+        return jsonify({
+            'message': 'Панорама принята в обработку',
+            'job': job.to_dict(),
+            'status_url': f'/api/jobs/{job.id}'
+        }), 202
+    
+    except Exception as e:
+        # Ссылка на файл откатывается вместе с транзакцией (или уже освобождена задачей,
+        # если не удался ее запуск); загрузка остается, complete можно повторить
+        db.session.rollback()
+        if 'file_path' in locals():
+            discard_orphan_blob(file_path)
+        return jsonify({'error': f'Ошибка завершения загрузки: {str(e)}'}), 500
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+@jwt_required()
+def abort_chunked_upload(upload_id):
+    """Отмена загрузки по частям"""
+    try:
+        upload, error = get_user_upload(upload_id)
+        if error:
+            return error
+        
+        remove_chunked_upload(upload)
+        db.session.commit()
+        
+        return jsonify({'message': 'Загрузка отменена'}), 200
+    
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Ошибка отмены загрузки: {str(e)}'}), 500
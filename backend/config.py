@@ -5,6 +5,7 @@ from flask_migrate import Migrate
 from flask_jwt_extended import JWTManager
 from datetime import timedelta
 import os
+from db_engine import configure_engine, register_sqlite_pragmas, RoutingSession
 
 # Инициализация Flask
 app = Flask(__name__)
@@ -13,16 +14,64 @@ app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'panorama-site-secret-key-2024')
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///panorama_site.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['DATABASE_READ_REPLICA_URL'] = os.environ.get('DATABASE_READ_REPLICA_URL')  # Реплика для списков, туров, встраивания и статистики (sqlite:///... или postgresql://...)
+app.config['READ_REPLICA_SYNC_INTERVAL'] = int(os.environ.get('READ_REPLICA_SYNC_INTERVAL', 10))  # Секунд между копированиями основной SQLite базы в реплику
+app.config['READ_REPLICA_STICKY_SECONDS'] = int(os.environ.get('READ_REPLICA_STICKY_SECONDS', 30))  # Секунд чтения с основной базы после записи клиента
+app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 10))  # Постоянных соединений в пуле каждого процесса (по числу потоков сервера)
+app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', 5))  # Дополнительных соединений при пиках
+app.config['DB_POOL_TIMEOUT'] = int(os.environ.get('DB_POOL_TIMEOUT', 30))  # Секунд ожидания свободного соединения
+app.config['DB_POOL_RECYCLE'] = int(os.environ.get('DB_POOL_RECYCLE', 1800))  # Пересоздание соединений с сервером БД старше N секунд
+app.config['SQLITE_BUSY_TIMEOUT'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 15000))  # Миллисекунд ожидания блокировки записи
+app.config['SQLITE_SYNCHRONOUS'] = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')  # FULL - fsync на каждый коммит
+app.config['SQLITE_CACHE_SIZE_KB'] = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 64 * 1024))  # Кэш страниц на соединение
+app.config['SQLITE_MMAP_SIZE'] = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))  # Чтение файла базы через mmap (0 - выключено)
 app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', 'jwt-secret-string')
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=24)
 app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'uploads')
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB максимум
+app.config['BLOBS_FOLDER'] = os.path.join(app.config['UPLOAD_FOLDER'], 'blobs')  # Файлы панорам, адресуемые по SHA-256
+app.config['CHUNKED_UPLOAD_FOLDER'] = os.path.join(app.config['UPLOAD_FOLDER'], '.incoming')  # Недокачанные файлы
+app.config['CHUNKED_UPLOAD_MAX_SIZE'] = int(os.environ.get('CHUNKED_UPLOAD_MAX_SIZE', 200 * 1024 * 1024))  # 200MB для загрузки по частям
+app.config['CHUNKED_UPLOAD_CHUNK_SIZE'] = 5 * 1024 * 1024  # Рекомендуемый размер части
+app.config['CHUNKED_UPLOAD_EXPIRES'] = timedelta(hours=24)  # Срок жизни незавершенной загрузки
+app.config['DERIVATIVES_FOLDER'] = os.environ.get('DERIVATIVES_FOLDER', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'derivatives'))
+app.config['TILE_SIZE'] = int(os.environ.get('TILE_SIZE', 512))  # Размер тайла пирамиды в пикселях
+app.config['TILE_QUALITY'] = int(os.environ.get('TILE_QUALITY', 85))  # Качество JPEG тайлов
+app.config['THUMBNAIL_WIDTHS'] = (160, 320, 640, 1280, 2048)  # Допустимые ширины миниатюр (последняя - превью среднего разрешения)
+app.config['THUMBNAIL_CACHE_MAX_BYTES'] = int(os.environ.get('THUMBNAIL_CACHE_MAX_BYTES', 512 * 1024 * 1024))  # Лимит кэша миниатюр
+app.config['TOUR_MANIFEST_FOLDER'] = os.path.join(app.config['DERIVATIVES_FOLDER'], 'tours')  # Скомпилированные манифесты туров
+app.config['TOUR_MANIFEST_CACHE_SIZE'] = int(os.environ.get('TOUR_MANIFEST_CACHE_SIZE', 256))  # Манифестов туров в памяти
+app.config['VIEW_COUNT_FLUSH_INTERVAL'] = float(os.environ.get('VIEW_COUNT_FLUSH_INTERVAL', 5))  # Секунд между записями счетчиков просмотров
+app.config['VIEW_COUNT_FLUSH_THRESHOLD'] = int(os.environ.get('VIEW_COUNT_FLUSH_THRESHOLD', 500))  # Досрочная запись при таком числе просмотров
+app.config['ACTIVITY_LOG_BUFFER_SIZE'] = int(os.environ.get('ACTIVITY_LOG_BUFFER_SIZE', 10000))  # Максимум событий активности в памяти
+app.config['ACTIVITY_LOG_FLUSH_INTERVAL'] = float(os.environ.get('ACTIVITY_LOG_FLUSH_INTERVAL', 5))  # Секунд между записями журнала активности
+app.config['ACTIVITY_LOG_FLUSH_THRESHOLD'] = int(os.environ.get('ACTIVITY_LOG_FLUSH_THRESHOLD', 1000))  # Досрочная запись при таком числе событий
+app.config['ACTIVITY_LOG_RETENTION_DAYS'] = int(os.environ.get('ACTIVITY_LOG_RETENTION_DAYS', 90))  # Срок хранения журнала активности
+app.config['SWEEPER_INTERVAL'] = int(os.environ.get('SWEEPER_INTERVAL', 300))  # Секунд между проходами фоновой очистки
+app.config['SWEEPER_BATCH_SIZE'] = int(os.environ.get('SWEEPER_BATCH_SIZE', 500))  # Максимум строк в одном DELETE
+app.config['STATS_ROLLUP_INTERVAL'] = int(os.environ.get('STATS_ROLLUP_INTERVAL', 60))  # Секунд между пересчетами статистики текущего дня
+app.config['STATS_RECONCILE_INTERVAL'] = int(os.environ.get('STATS_RECONCILE_INTERVAL', 3600))  # Секунд между полными пересчетами статистики админ-панели
+app.config['STATS_ROLLUP_BACKFILL_DAYS'] = 30  # Дней истории, пересчитываемых при сверке
+app.config['USER_STATS_CACHE_TTL'] = int(os.environ.get('USER_STATS_CACHE_TTL', 15))  # Секунд кэширования статистики пользователя (0 - без кэша)
+app.config['STORAGE_RECONCILE_INTERVAL'] = int(os.environ.get('STORAGE_RECONCILE_INTERVAL', 3600))  # Секунд между сверками счетчиков места с диском
+app.config['TOKEN_REVOCATION_REDIS_URL'] = os.environ.get('TOKEN_REVOCATION_REDIS_URL')  # Отозванные токены в Redis вместо таблицы revoked_tokens
+app.config['TOKEN_REVOCATION_CACHE_TTL'] = float(os.environ.get('TOKEN_REVOCATION_CACHE_TTL', 5))  # Секунд, на которые процесс запоминает, что токен не отозван
+app.config['CURRENT_USER_CACHE_TTL'] = int(os.environ.get('CURRENT_USER_CACHE_TTL', 30))  # Секунд кэширования роли, блокировки и подписки пользователя (0 - без кэша)
+app.config['PROCESSING_WORKERS'] = int(os.environ.get('PROCESSING_WORKERS', 2))  # Процессы фоновой обработки изображений
+app.config['JOB_HEARTBEAT_INTERVAL'] = int(os.environ.get('JOB_HEARTBEAT_INTERVAL', 30))  # Секунд между отметками процесса о его задачах
+app.config['JOB_STALE_AFTER'] = int(os.environ.get('JOB_STALE_AFTER', 120))  # Задачи без отметки дольше этого перехватываются другим процессом
+app.config['CUBEMAP_MAX_FACE_SIZE'] = int(os.environ.get('CUBEMAP_MAX_FACE_SIZE', 4096))  # Максимальный размер грани куба
 
 # Создание папки для загрузок
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+os.makedirs(app.config['BLOBS_FOLDER'], exist_ok=True)
+os.makedirs(app.config['CHUNKED_UPLOAD_FOLDER'], exist_ok=True)
+os.makedirs(app.config['DERIVATIVES_FOLDER'], exist_ok=True)
 
 # Инициализация расширений
-db = SQLAlchemy(app)
+configure_engine(app)
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+register_sqlite_pragmas(app, db)
 migrate = Migrate(app, db)
 jwt = JWTManager(app)
 
@@ -35,12 +84,11 @@ CORS(app,
      expose_headers=['Content-Type', 'Authorization'],
      max_age=3600)
 
-# Список заблокированных токенов (в продакшн нужен Redis)
-blacklisted_tokens = set()
-
+# Отозванные токены хранятся вне процесса, чтобы выход действовал во всех процессах сервера
 @jwt.token_in_blocklist_loader
 def check_if_token_revoked(jwt_header, jwt_payload):
-    return jwt_payload['jti'] in blacklisted_tokens
+    from token_revocation import is_token_revoked
+    return is_token_revoked(jwt_payload['jti'])
 
 # Разрешенные расширения для панорам
 ALLOWED_EXTENSIONS = {'jpg', 'jpeg', 'png'}
@@ -0,0 +1,75 @@
+from datetime import datetime
+from flask import g
+from flask_jwt_extended import get_jwt_identity
+from config import app, db
+from models import User
+from read_replica import read_from_primary
+from ttl_cache import TTLCache
+
+class UserAuthState:
+    """Поля пользователя, нужные для проверок прав (роль, блокировка, подписка)"""
+    
+    __slots__ = ('id', 'role', 'is_active', 'subscription_type', 'subscription_expires')
+    
+    def __init__(self, user):
+        self.id = user.id
+        self.role = user.role
+        self.is_active = user.is_active
+        self.subscription_type = user.subscription_type
+        self.subscription_expires = user.subscription_expires
+    
+    def is_premium(self):
+        """Проверка премиум статуса (как User.is_premium)"""
+        if self.subscription_type == 'premium':
+            if self.subscription_expires is None or self.subscription_expires > datetime.utcnow():
+                return True
+        return False
+    
+    def is_admin(self):
+        return self.role == 'admin'
+
+# Права пользователей между запросами (проверки прав без запроса к БД)
+user_state_cache = TTLCache(app.config['CURRENT_USER_CACHE_TTL'])
+
+def get_current_user_id():
+    """id пользователя из JWT текущего запроса (int; в токене он хранится строкой)"""
+    if 'current_user_id' not in g:
+        identity = get_jwt_identity()
+        g.current_user_id = int(identity) if identity else None
+    return g.current_user_id
+
+def get_current_user():
+    """Пользователь текущего запроса: загружается из БД один раз за запрос"""
+    if 'current_user' not in g:
+        user_id = get_current_user_id()
+        with read_from_primary():
+            g.current_user = db.session.get(User, user_id) if user_id else None
+    return g.current_user
+
+def get_current_user_state():
+    """Права пользователя текущего запроса (из кэша, если они загружены недавно)"""
+    if 'current_user_state' not in g:
+        user_id = get_current_user_id()
+        if not user_id:
+            state = None
+        elif 'current_user' in g or not user_state_cache.ttl:
+            user = get_current_user()
+            state = UserAuthState(user) if user else None
+        else:
+            state = user_state_cache.get(user_id, lambda: _load_user_state(user_id))
+            if state and state.is_admin():
+                # Сброс кэша действует только в своем процессе: права администратора подтверждаются
+                # основной базой, иначе роль, снятая в другом процессе, действовала бы до конца TTL
+                state = _load_user_state(user_id)
+        g.current_user_state = state
+    return g.current_user_state
+
+def _load_user_state(user_id):
+    # Права проверяются по основной базе: реплика может отставать после блокировки или смены роли
+    with read_from_primary():
+        user = db.session.get(User, user_id)
+    return UserAuthState(user) if user else None
+
+def invalidate_user_state(user_id):
+    """Сброс кэша после смены роли, блокировки, подписки или профиля пользователя"""
+    user_state_cache.invalidate(int(user_id))
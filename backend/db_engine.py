@@ -0,0 +1,113 @@
+from flask import g, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# Ключ SQLALCHEMY_BINDS для реплики только на чтение
+READ_REPLICA_BIND = 'read_replica'
+
+def is_sqlite_uri(uri):
+    return make_url(uri).get_backend_name() == 'sqlite'
+
+def is_sqlite_memory_uri(uri):
+    return is_sqlite_uri(uri) and make_url(uri).database in (None, '', ':memory:')
+
+def get_engine_options(config, uri):
+    """Параметры движка SQLAlchemy для базы по ее URI"""
+    if is_sqlite_memory_uri(uri):
+        # База в памяти живет в одном соединении, пул SQLAlchemy подбирает сам
+        return {}
+    
+    options = {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT']
+    }
+    if is_sqlite_uri(uri):
+        # Соединения переходят между потоками через пул; ожидание блокировки берет на себя SQLite
+        options['connect_args'] = {
+            'timeout': config['SQLITE_BUSY_TIMEOUT'] / 1000,
+            'check_same_thread': False
+        }
+    else:
+        # Сервер БД закрывает простаивающие соединения: проверяем перед выдачей и пересоздаем заранее
+        options['pool_pre_ping'] = True
+        options['pool_recycle'] = config['DB_POOL_RECYCLE']
+    return options
+
+def get_sqlite_pragmas(config):
+    """PRAGMA для каждого нового соединения SQLite"""
+    return [
+        # WAL: читатели не ждут писателя, писатель не ждет читателей
+        ('journal_mode', 'WAL'),
+        # В WAL режим NORMAL не теряет целостность при сбое, но не делает fsync на каждый коммит
+        ('synchronous', config['SQLITE_SYNCHRONOUS']),
+        ('busy_timeout', config['SQLITE_BUSY_TIMEOUT']),
+        # Отрицательное значение - размер в КиБ, а не в страницах
+        ('cache_size', -config['SQLITE_CACHE_SIZE_KB']),
+        ('mmap_size', config['SQLITE_MMAP_SIZE']),
+        ('temp_store', 'MEMORY')
+    ]
+
+def configure_engine(app):
+    """Параметры пула и привязка реплики в конфигурации; вызывается до создания SQLAlchemy(app)"""
+    options = get_engine_options(app.config, app.config['SQLALCHEMY_DATABASE_URI'])
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+    
+    replica_uri = app.config.get('DATABASE_READ_REPLICA_URL')
+    if replica_uri:
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        binds[READ_REPLICA_BIND] = {'url': replica_uri, **get_engine_options(app.config, replica_uri)}
+        app.config['SQLALCHEMY_BINDS'] = binds
+
+def register_sqlite_pragmas(app, db):
+    """PRAGMA для соединений движков приложения (других движков и баз это не касается)"""
+    with app.app_context():
+        engines = dict(db.engines)
+    
+    for key, engine in engines.items():
+        uri = engine.url
+        if not is_sqlite_uri(uri):
+            continue
+        
+        pragmas = get_sqlite_pragmas(app.config)
+        if is_sqlite_memory_uri(uri):
+            # У базы в памяти нет файла журнала
+            pragmas = [(name, value) for name, value in pragmas if name != 'journal_mode']
+        if key == READ_REPLICA_BIND:
+            # Реплика обновляется только синхронизацией, приложение в нее не пишет
+            pragmas.append(('query_only', 1))
+        
+        event.listen(engine, 'connect', _pragma_setter(pragmas))
+
+def _pragma_setter(pragmas):
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas:
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+    return set_sqlite_pragmas
+
+class RoutingSession(Session):
+    """Сессия, отправляющая SELECT помеченных запросов (read_replica.py) на реплику, а остальное - на основную базу"""
+    
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and clause is not None and has_request_context():
+            if getattr(clause, 'is_dml', False):
+                # Массовые UPDATE/DELETE: дальше запрос читает свои записи с основной базы
+                g.read_primary = True
+                g.db_wrote = True
+            elif (
+                g.get('read_replica') and not g.get('read_primary')
+                and getattr(clause, 'is_select', False)
+                and getattr(clause, '_for_update_arg', None) is None
+            ):
+                return self._db.engines[READ_REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _mark_request_wrote(session, flush_context):
+    if has_request_context():
+        g.read_primary = True
+        g.db_wrote = True
@@ -0,0 +1,341 @@
+import os
+import json
+import math
+import shutil
+import uuid
+import base64
+import hashlib
+import io
+import numpy as np
+from PIL import Image, ImageFilter
+from config import app
+
+# Имя файла с описанием тайловой пирамиды
+TILES_METADATA_FILE = 'tiles.json'
+
+# Грани куба в порядке, принятом в THREE.CubeTextureLoader
+CUBE_FACES = ('px', 'nx', 'py', 'ny', 'pz', 'nz')
+CUBEMAP_METADATA_FILE = 'cubemap.json'
+
+def get_derivatives_dir(panorama_id):
+    """Папка производных файлов панорамы (тайлы, превью и т.д.)"""
+    return os.path.join(app.config['DERIVATIVES_FOLDER'], str(panorama_id))
+
+def get_tiles_dir(panorama_id):
+    """Папка тайловой пирамиды панорамы"""
+    return os.path.join(get_derivatives_dir(panorama_id), 'tiles')
+
+def get_tile_path(panorama_id, level, x, y):
+    """Путь к файлу тайла"""
+    return os.path.join(get_tiles_dir(panorama_id), str(level), f"{x}_{y}.jpg")
+
+def compute_pyramid_levels(width, height, tile_size):
+    """Расчет уровней пирамиды: уровень 0 помещается в один тайл, последний - оригинал"""
+    max_level = 0
+    while max(width, height) > tile_size * 2 ** max_level:
+        max_level += 1
+    
+    levels = []
+    for level in range(max_level + 1):
+        scale = 2 ** (max_level - level)
+        level_width = max(1, math.ceil(width / scale))
+        level_height = max(1, math.ceil(height / scale))
+        levels.append({
+            'level': level,
+            'width': level_width,
+            'height': level_height,
+            'columns': math.ceil(level_width / tile_size),
+            'rows': math.ceil(level_height / tile_size)
+        })
+    return levels
+
+def publish_dir(tmp_dir, output_dir, metadata_file):
+    """Публикация собранной папки переименованием: output_dir ни в какой момент не пропадает.
+    False - папку уже опубликовал другой обработчик (из того же файла), она остается"""
+    os.makedirs(os.path.dirname(output_dir), exist_ok=True)
+    for attempt in range(3):
+        try:
+            os.rename(tmp_dir, output_dir)
+            return True
+        except OSError:
+            if os.path.exists(os.path.join(output_dir, metadata_file)):
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                return False
+            if attempt == 2:
+                raise
+        
+        # Папка без описания (недописанная старой версией) читателям не видна - убираем ее в сторону
+        stale_dir = f"{output_dir}.stale-{uuid.uuid4().hex}"
+        try:
+            os.rename(output_dir, stale_dir)
+        except FileNotFoundError:
+            continue
+        shutil.rmtree(stale_dir, ignore_errors=True)
+
+def generate_tile_pyramid(source_path, output_dir, tile_size=512, quality=85):
+    """Нарезка изображения в пирамиду тайлов (от оригинала к уменьшенным уровням)"""
+    # Пишем во временную папку и подменяем целиком, чтобы не отдавать недописанную пирамиду
+    tmp_dir = f"{output_dir}.tmp-{uuid.uuid4().hex}"
+    os.makedirs(tmp_dir, exist_ok=True)
+    
+    try:
+        with Image.open(source_path) as source:
+            width, height = source.size
+            levels = compute_pyramid_levels(width, height, tile_size)
+            img = source.convert('RGB')
+        
+        # Идем сверху вниз: каждый следующий уровень - уменьшение предыдущего в 2 раза
+        for info in reversed(levels):
+            if img.size != (info['width'], info['height']):
+                img = img.resize((info['width'], info['height']), Image.LANCZOS)
+            
+            level_dir = os.path.join(tmp_dir, str(info['level']))
+            os.makedirs(level_dir, exist_ok=True)
+            
+            for y in range(info['rows']):
+                for x in range(info['columns']):
+                    box = (
+                        x * tile_size,
+                        y * tile_size,
+                        min((x + 1) * tile_size, info['width']),
+                        min((y + 1) * tile_size, info['height'])
+                    )
+                    tile = img.crop(box)
+                    tile.save(os.path.join(level_dir, f"{x}_{y}.jpg"), 'JPEG', quality=quality)
+        
+        metadata = {
+            'width': width,
+            'height': height,
+            'tile_size': tile_size,
+            'levels': levels
+        }
+        with open(os.path.join(tmp_dir, TILES_METADATA_FILE), 'w', encoding='utf-8') as f:
+            json.dump(metadata, f)
+        
+        if not publish_dir(tmp_dir, output_dir, TILES_METADATA_FILE):
+            with open(os.path.join(output_dir, TILES_METADATA_FILE), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return metadata
+    
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+def generate_panorama_tiles(panorama_id, file_path):
+    """Генерация тайловой пирамиды для панорамы"""
+    return generate_tile_pyramid(
+        file_path,
+        get_tiles_dir(panorama_id),
+        tile_size=app.config['TILE_SIZE'],
+        quality=app.config['TILE_QUALITY']
+    )
+
+def load_tiles_metadata(panorama_id):
+    """Чтение описания пирамиды, None если тайлы еще не сгенерированы"""
+    metadata_path = os.path.join(get_tiles_dir(panorama_id), TILES_METADATA_FILE)
+    if not os.path.exists(metadata_path):
+        return None
+    with open(metadata_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def get_cubemap_dir(panorama_id):
+    """Папка граней кубической карты панорамы"""
+    return os.path.join(get_derivatives_dir(panorama_id), 'cubemap')
+
+def get_cubemap_face_path(panorama_id, face):
+    """Путь к файлу грани кубической карты"""
+    return os.path.join(get_cubemap_dir(panorama_id), f"{face}.jpg")
+
+def _cube_face_directions(face, a, b):
+    """Направления лучей для точек грани (a - вправо, b - вниз, оба в диапазоне [-1, 1])"""
+    ones = np.ones_like(a)
+    if face == 'px':
+        return ones, -b, -a
+    if face == 'nx':
+        return -ones, -b, a
+    if face == 'py':
+        return a, ones, b
+    if face == 'ny':
+        return a, -ones, -b
+    if face == 'pz':
+        return a, -b, ones
+    return -a, -b, -ones
+
+def _sample_bilinear(src, xs, ys):
+    """Билинейная выборка из массива изображения с заворачиванием по горизонтали"""
+    height, width = src.shape[:2]
+    x0 = np.floor(xs).astype(np.int64)
+    y0 = np.floor(ys).astype(np.int64)
+    fx = (xs - x0)[..., None]
+    fy = (ys - y0)[..., None]
+    
+    x1 = (x0 + 1) % width
+    x0 = x0 % width
+    y1 = np.clip(y0 + 1, 0, height - 1)
+    y0 = np.clip(y0, 0, height - 1)
+    
+    top = src[y0, x0].astype(np.float32) * (1 - fx) + src[y0, x1].astype(np.float32) * fx
+    bottom = src[y1, x0].astype(np.float32) * (1 - fx) + src[y1, x1].astype(np.float32) * fx
+    return top * (1 - fy) + bottom * fy
+
+def equirect_to_cubemap(source, face_size, chunk_rows=256):
+    """Перепроекция эквидистантной панорамы в 6 граней куба (векторизовано через NumPy)"""
+    src = np.asarray(source.convert('RGB'))
+    height, width = src.shape[:2]
+    
+    # Центры пикселей грани в координатах [-1, 1]
+    coords = (np.arange(face_size, dtype=np.float32) + 0.5) * (2.0 / face_size) - 1.0
+    
+    faces = {}
+    for face in CUBE_FACES:
+        out = np.empty((face_size, face_size, 3), dtype=np.uint8)
+        # Обрабатываем грань полосами, чтобы ограничить расход памяти на больших панорамах
+        for start in range(0, face_size, chunk_rows):
+            stop = min(start + chunk_rows, face_size)
+            a, b = np.meshgrid(coords, coords[start:stop])
+            x, y, z = _cube_face_directions(face, a, b)
+            
+            norm = np.sqrt(x * x + y * y + z * z)
+            lon = np.arctan2(z, x)
+            lat = np.arcsin(np.clip(y / norm, -1.0, 1.0))
+            
+            # Та же развертка, что у THREE.EquirectangularReflectionMapping
+            xs = (lon / (2 * np.pi) + 0.5) * width - 0.5
+            ys = (0.5 - lat / np.pi) * height - 0.5
+            
+            out[start:stop] = np.clip(_sample_bilinear(src, xs, ys) + 0.5, 0, 255).astype(np.uint8)
+        faces[face] = Image.fromarray(out)
+    return faces
+
+def generate_panorama_cubemap(panorama_id, file_path):
+    """Генерация кубической карты для панорамы"""
+    output_dir = get_cubemap_dir(panorama_id)
+    tmp_dir = f"{output_dir}.tmp-{uuid.uuid4().hex}"
+    os.makedirs(tmp_dir, exist_ok=True)
+    
+    try:
+        with Image.open(file_path) as source:
+            width, height = source.size
+            face_size = max(1, min(width // 4, app.config['CUBEMAP_MAX_FACE_SIZE']))
+            faces = equirect_to_cubemap(source, face_size)
+        
+        for face, image in faces.items():
+            image.save(os.path.join(tmp_dir, f"{face}.jpg"), 'JPEG', quality=app.config['TILE_QUALITY'])
+        
+        metadata = {
+            'face_size': face_size,
+            'faces': list(CUBE_FACES)
+        }
+        with open(os.path.join(tmp_dir, CUBEMAP_METADATA_FILE), 'w', encoding='utf-8') as f:
+            json.dump(metadata, f)
+        
+        if not publish_dir(tmp_dir, output_dir, CUBEMAP_METADATA_FILE):
+            with open(os.path.join(output_dir, CUBEMAP_METADATA_FILE), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return metadata
+    
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+def load_cubemap_metadata(panorama_id):
+    """Чтение описания кубической карты, None если она еще не сгенерирована"""
+    metadata_path = os.path.join(get_cubemap_dir(panorama_id), CUBEMAP_METADATA_FILE)
+    if not os.path.exists(metadata_path):
+        return None
+    with open(metadata_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def get_thumbnails_dir(panorama_id):
+    """Папка миниатюр панорамы (кэшируемые производные)"""
+    return os.path.join(get_derivatives_dir(panorama_id), 'thumbs')
+
+def get_thumbnail_path(panorama_id, width):
+    """Путь к миниатюре заданной ширины"""
+    return os.path.join(get_thumbnails_dir(panorama_id), f"w{width}.jpg")
+
+def render_thumbnail(source_path, output_path, width, quality=85):
+    """Уменьшенная копия изображения заданной ширины с сохранением пропорций"""
+    tmp_path = f"{output_path}.tmp-{uuid.uuid4().hex}"
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    
+    try:
+        with Image.open(source_path) as img:
+            height = max(1, round(img.size[1] * width / img.size[0]))
+            # Для JPEG декодируем сразу в уменьшенном масштабе (1/2, 1/4, 1/8) - в разы быстрее
+            img.draft('RGB', (width, height))
+            thumb = img.convert('RGB')
+            thumb.thumbnail((width, height), Image.LANCZOS)
+            thumb.save(tmp_path, 'JPEG', quality=quality, optimize=True, progressive=True)
+        
+        os.replace(tmp_path, output_path)
+        return output_path
+    
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def render_placeholder(source_path, width=32, quality=40):
+    """Крошечная размытая копия изображения в виде data URI (LQIP, около 1KB)"""
+    with Image.open(source_path) as img:
+        height = max(1, round(img.size[1] * width / img.size[0]))
+        img.draft('RGB', (width * 4, height * 4))
+        small = img.convert('RGB').resize((width, height), Image.BILINEAR)
+    
+    small = small.filter(ImageFilter.GaussianBlur(1))
+    buffer = io.BytesIO()
+    small.save(buffer, 'JPEG', quality=quality, optimize=True)
+    return 'data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+def generate_panorama_thumbnails(panorama_id, file_path):
+    """Генерация миниатюры для карточек и превью при загрузке"""
+    widths = app.config['THUMBNAIL_WIDTHS']
+    for width in (widths[1], widths[-1]):
+        render_thumbnail(file_path, get_thumbnail_path(panorama_id, width), width, quality=app.config['TILE_QUALITY'])
+
+def compute_file_hash(file_path, block_size=1024 * 1024):
+    """SHA-256 содержимого файла (читается блоками)"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def analyze_panorama_file(file_path, content_hash=None):
+    """Проверка, что файл является изображением, и извлечение его метаданных"""
+    with Image.open(file_path) as img:
+        img.verify()
+    
+    # После verify() изображение нужно открыть заново
+    with Image.open(file_path) as img:
+        width, height = img.size
+        metadata = {
+            'width': width,
+            'height': height,
+            'format': img.format,
+            'mode': img.mode,
+            'file_size': os.path.getsize(file_path),
+            'content_hash': content_hash or compute_file_hash(file_path)
+        }
+    
+    # Заглушка для мгновенного показа, пока грузится текстура
+    metadata['placeholder'] = render_placeholder(file_path)
+    return metadata
+
+def process_panorama_derivatives(panorama_id, file_path):
+    """Генерация всех производных файлов панорамы (ошибка одного этапа не прерывает остальные)"""
+    for stage in (generate_panorama_thumbnails, generate_panorama_tiles, generate_panorama_cubemap):
+        try:
+            stage(panorama_id, file_path)
+        except Exception as e:
+            print(f"Ошибка обработки панорамы {panorama_id} ({stage.__name__}): {e}")
+
+def remove_panorama_derivatives(panorama_id):
+    """Удаление всех производных файлов панорамы"""
+    derivatives_dir = get_derivatives_dir(panorama_id)
+    if os.path.exists(derivatives_dir):
+        try:
+            shutil.rmtree(derivatives_dir)
+        except Exception as e:
+            print(f"Ошибка удаления производных файлов панорамы {panorama_id}: {e}")
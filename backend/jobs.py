@@ -0,0 +1,403 @@
+import os
+import json
+import time
+import queue
+import socket
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from flask import jsonify
+from flask_jwt_extended import jwt_required
+from config import app, db
+from models import Panorama, Tour, TourPanorama, ProcessingJob
+from current_user import get_current_user_id, get_current_user_state
+from image_processing import analyze_panorama_file, process_panorama_derivatives
+from blob_store import release_blob
+from storage_usage import add_storage_usage
+from stats_rollups import count_new_panorama
+from user_stats import invalidate_user_stats
+from tour_manifest import invalidate_tour_manifests
+
+# Пул процессов для тяжелой обработки изображений (создается при первой задаче)
+_executor = None
+_executor_lock = threading.Lock()
+
+# Завершенные задачи пула: обработчик, id задачи, future
+_completed = queue.Queue()
+_dispatcher = None
+
+# Проверка и создание задачи генерации производных файлов по запросу
+_derivatives_lock = threading.Lock()
+DERIVATIVES_RETRY_DELAY = timedelta(hours=1)  # Пауза перед повтором неудавшейся генерации
+
+def get_job_owner():
+    """Владелец задач этого процесса (хост и pid): задачи живого владельца не перехватываются"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def get_executor():
+    """Получение пула процессов обработки изображений"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=app.config['PROCESSING_WORKERS'])
+        return _executor
+
+def _ensure_dispatcher():
+    """Запуск потока, обрабатывающего результаты пула (повторный вызов ничего не делает)"""
+    global _dispatcher
+    with _executor_lock:
+        if _dispatcher is None:
+            _dispatcher = threading.Thread(target=_dispatch_results, name='jobs-dispatcher', daemon=True)
+            _dispatcher.start()
+
+def _dispatch_results():
+    """Запись результатов в БД и запуск следующих этапов в одном потоке, а не в служебном потоке пула"""
+    interval = app.config['JOB_HEARTBEAT_INTERVAL']
+    last_heartbeat = time.monotonic()
+    while True:
+        try:
+            handler, job_id, future = _completed.get(timeout=interval)
+            try:
+                handler(job_id, future)
+            except Exception as e:
+                print(f"Ошибка обработки результата задачи {job_id}: {e}")
+        except queue.Empty:
+            pass
+        
+        if time.monotonic() - last_heartbeat >= interval:
+            _heartbeat()
+            last_heartbeat = time.monotonic()
+
+def _heartbeat():
+    """Отметка, что задачи этого процесса еще выполняются (иначе их перехватит resume_unfinished_jobs)"""
+    with app.app_context():
+        try:
+            ProcessingJob.query.filter(
+                ProcessingJob.owner == get_job_owner(),
+                ProcessingJob.status.in_(['pending', 'processing'])
+            ).update({ProcessingJob.heartbeat_at: datetime.utcnow()}, synchronize_session=False)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Ошибка обновления heartbeat задач: {e}")
+
+def _on_done(handler, job_id):
+    # Колбэк выполняется в служебном потоке пула: только передаем результат диспетчеру
+    return lambda future: _completed.put((handler, job_id, future))
+
+def _replace_broken_executor(broken):
+    """Замена пула, в котором погиб рабочий процесс (например, OOM на огромном изображении)"""
+    global _executor
+    with _executor_lock:
+        if _executor is broken:
+            broken.shutdown(wait=False)
+            _executor = None
+
+def _submit(fn, *args):
+    """Отправка задачи в пул; сломанный пул пересоздается один раз"""
+    _ensure_dispatcher()
+    executor = get_executor()
+    try:
+        return executor.submit(fn, *args)
+    except BrokenProcessPool:
+        print("⚠️  Пул обработки изображений сломан, создается новый")
+        _replace_broken_executor(executor)
+        return get_executor().submit(fn, *args)
+
+def enqueue_panorama_upload(user_id, file_path, file_size, title, description, is_public=True, tour_id=None, content_hash=None):
+    """Создание задачи обработки загруженной панорамы"""
+    payload = {
+        'file_path': file_path,
+        'content_hash': content_hash,
+        'file_size': file_size,
+        'title': title,
+        'description': description,
+        'is_public': is_public,
+        'tour_id': tour_id
+    }
+    job_type = 'tour_panorama_upload' if tour_id else 'panorama_upload'
+    job = ProcessingJob(user_id=int(user_id), job_type=job_type, payload=payload)
+    job.owner = get_job_owner()
+    job.heartbeat_at = datetime.utcnow()
+    
+    db.session.add(job)
+    db.session.commit()
+    
+    try:
+        _submit_analysis(job.id, file_path, content_hash)
+    except Exception as e:
+        # Задача не останется в pending навсегда, а файл - со ссылкой без панорамы
+        print(f"Ошибка запуска задачи {job.id}: {e}")
+        _fail_job_and_release(job, 'Обработка изображений недоступна, попробуйте позже')
+        raise RuntimeError('Обработка изображений недоступна, попробуйте позже')
+    return job
+
+def _submit_analysis(job_id, file_path, content_hash=None):
+    future = _submit(analyze_panorama_file, file_path, content_hash)
+    future.add_done_callback(_on_done(_on_analysis_done, job_id))
+
+def _submit_derivatives(job_id, panorama_id, file_path):
+    future = _submit(process_panorama_derivatives, panorama_id, file_path)
+    future.add_done_callback(_on_done(_on_derivatives_done, job_id))
+
+def _fail_job(job, error):
+    job.status = 'failed'
+    job.error = error
+    job.updated_at = datetime.utcnow()
+    db.session.commit()
+
+def _fail_job_and_release(job, error):
+    """Ошибка задачи до создания панорамы: ссылка на файл освобождается в той же транзакции"""
+    # Только из pending: задачу мог уже обработать другой процесс
+    failed = ProcessingJob.query.filter_by(id=job.id, status='pending', panorama_id=None).update({
+        ProcessingJob.status: 'failed',
+        ProcessingJob.error: error,
+        ProcessingJob.updated_at: datetime.utcnow()
+    }, synchronize_session=False)
+    if not failed:
+        db.session.rollback()
+        return
+    
+    # Файл без других ссылок удаляется после коммита
+    release_blob(job.get_payload()['file_path'])
+    db.session.commit()
+
+def request_panorama_derivatives(panorama):
+    """Фоновая генерация недостающих производных файлов панорамы (одна задача на панораму).
+    None - генерация недавно выполнялась и не удалась, повторять ее на каждый запрос не нужно"""
+    retry_after = datetime.utcnow() - DERIVATIVES_RETRY_DELAY
+    with _derivatives_lock:
+        jobs = ProcessingJob.query.filter_by(panorama_id=panorama.id).all()
+        for job in jobs:
+            if job.status in ('pending', 'processing'):
+                return job
+        if any(job.job_type == 'panorama_derivatives' and job.updated_at > retry_after for job in jobs):
+            return None
+        
+        job = ProcessingJob(user_id=panorama.user_id, job_type='panorama_derivatives', payload={'file_path': panorama.file_path})
+        job.status = 'processing'
+        job.panorama_id = panorama.id
+        job.owner = get_job_owner()
+        job.heartbeat_at = datetime.utcnow()
+        db.session.add(job)
+        db.session.commit()
+    
+    _start_derivatives(job.id, panorama.id, panorama.file_path)
+    return job
+
+def _start_derivatives(job_id, panorama_id, file_path):
+    """Запуск генерации производных файлов; если пул недоступен, задача завершается без них"""
+    try:
+        _submit_derivatives(job_id, panorama_id, file_path)
+    except Exception as e:
+        print(f"Ошибка запуска задачи {job_id}: {e}")
+        # Панорама уже создана, производные файлы можно будет построить позже
+        _complete_job(job_id)
+
+def _complete_job(job_id):
+    ProcessingJob.query.filter_by(id=job_id, status='processing').update({
+        ProcessingJob.status: 'completed',
+        ProcessingJob.updated_at: datetime.utcnow()
+    }, synchronize_session=False)
+    db.session.commit()
+
+def _on_analysis_done(job_id, future):
+    """Создание панорамы после проверки файла (выполняется вне запроса)"""
+    with app.app_context():
+        try:
+            job = ProcessingJob.query.get(job_id)
+            if not job or job.status != 'pending' or job.panorama_id:
+                # Задача уже обработана (например, перехвачена другим процессом)
+                return
+            
+            payload = job.get_payload()
+            file_path = payload['file_path']
+            
+            try:
+                metadata = future.result()
+            except Exception as e:
+                print(f"Ошибка проверки файла для задачи {job_id}: {e}")
+                if isinstance(e, BrokenProcessPool):
+                    _fail_job_and_release(job, 'Обработка изображения прервана (недостаточно памяти?)')
+                else:
+                    _fail_job_and_release(job, 'Файл поврежден или не является изображением')
+                return
+            
+            tour = None
+            if payload.get('tour_id'):
+                tour = Tour.query.get(payload['tour_id'])
+                if not tour:
+                    _fail_job_and_release(job, 'Тур не найден')
+                    return
+            
+            panorama = Panorama(
+                user_id=job.user_id,
+                title=payload['title'],
+                description=payload['description'],
+                file_path=file_path,
+                file_size=payload['file_size'],
+                width=metadata['width'],
+                height=metadata['height']
+            )
+            panorama.placeholder = metadata.pop('placeholder', None)
+            panorama.content_hash = metadata['content_hash']
+            
+            tour_panorama = None
+            if tour:
+                # Панорамы только для тура не публичные и не отображаются в общей коллекции
+                panorama.is_public = False
+                panorama.tour_only = True
+                db.session.add(panorama)
+                db.session.flush()
+                
+                tour_panorama = TourPanorama(
+                    tour_id=tour.id,
+                    panorama_id=panorama.id,
+                    order_index=len(tour.tour_panoramas)  # Добавляем в конец
+                )
+                db.session.add(tour_panorama)
+                tour.updated_at = datetime.utcnow()
+                db.session.flush()
+            else:
+                panorama.is_public = payload['is_public']
+                db.session.add(panorama)
+                db.session.flush()
+            
+            add_storage_usage(job.user_id, panorama.file_size)
+            count_new_panorama(job.user_id)
+            
+            result = {'panorama': panorama.to_dict(), 'metadata': metadata}
+            if tour_panorama:
+                result['tour_panorama'] = tour_panorama.to_dict()
+            
+            # Панорама создается, только если задача все еще в pending: при двойном запуске
+            # второй обработчик откатывает свою панораму вместе с учетом места
+            claimed = ProcessingJob.query.filter_by(id=job_id, status='pending', panorama_id=None).update({
+                ProcessingJob.panorama_id: panorama.id,
+                ProcessingJob.status: 'processing',
+                ProcessingJob.result: json.dumps(result),
+                ProcessingJob.updated_at: datetime.utcnow()
+            }, synchronize_session=False)
+            if not claimed:
+                db.session.rollback()
+                return
+            
+            db.session.commit()
+            invalidate_user_stats(job.user_id)
+            
+            if tour:
+                invalidate_tour_manifests([tour.id])
+            
+            _start_derivatives(job_id, panorama.id, file_path)
+        
+        except Exception as e:
+            db.session.rollback()
+            print(f"Ошибка обработки задачи {job_id}: {e}")
+            job = ProcessingJob.query.get(job_id)
+            if job:
+                _fail_job_and_release(job, f'Ошибка обработки: {str(e)}')
+
+def _on_derivatives_done(job_id, future):
+    """Завершение задачи после генерации тайлов и кубической карты"""
+    with app.app_context():
+        try:
+            try:
+                future.result()
+            except Exception as e:
+                # Панорама уже доступна, производные файлы можно будет построить позже
+                print(f"Ошибка генерации производных файлов для задачи {job_id}: {e}")
+            
+            _complete_job(job_id)
+        
+        except Exception as e:
+            db.session.rollback()
+            print(f"Ошибка завершения задачи {job_id}: {e}")
+
+def _is_owner_alive(job, now):
+    """Выполняет ли задачу живой процесс: heartbeat свежий, а на этом же хосте - процесс существует"""
+    if not job.owner:
+        return False
+    if job.owner == get_job_owner():
+        return True
+    if not job.heartbeat_at or job.heartbeat_at < now - timedelta(seconds=app.config['JOB_STALE_AFTER']):
+        return False
+    
+    host, _, pid = job.owner.rpartition(':')
+    if host != socket.gethostname() or os.name == 'nt':
+        # Под Windows os.kill(pid, 0) завершает процесс, поэтому полагаемся только на heartbeat
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, ValueError):
+        pass
+    return True
+
+def _claim_job(job, now):
+    """Атомарный перехват задачи умершего владельца: из нескольких процессов задачу получит один"""
+    claimed = ProcessingJob.query.filter(
+        ProcessingJob.id == job.id,
+        ProcessingJob.status == job.status,
+        ProcessingJob.owner == job.owner,
+        ProcessingJob.heartbeat_at == job.heartbeat_at
+    ).update({
+        ProcessingJob.owner: get_job_owner(),
+        ProcessingJob.heartbeat_at: now
+    }, synchronize_session=False)
+    db.session.commit()
+    return claimed == 1
+
+def resume_unfinished_jobs(limit=None):
+    """Повторный запуск задач, владелец которых завершился (перезапуск сервера, падение процесса)"""
+    now = datetime.utcnow()
+    query = ProcessingJob.query.filter(ProcessingJob.status.in_(['pending', 'processing'])).order_by(ProcessingJob.created_at)
+    
+    resumed = 0
+    for job in query.all():
+        if limit and resumed >= limit:
+            break
+        if _is_owner_alive(job, now) or not _claim_job(job, now):
+            continue
+        
+        resumed += 1
+        payload = job.get_payload()
+        if not os.path.exists(payload['file_path']):
+            if job.status == 'pending':
+                _fail_job_and_release(job, 'Файл панорамы не найден')
+            else:
+                _fail_job(job, 'Файл панорамы не найден')
+            continue
+        
+        if job.status == 'pending':
+            try:
+                _submit_analysis(job.id, payload['file_path'], payload.get('content_hash'))
+            except Exception as e:
+                print(f"Ошибка запуска задачи {job.id}: {e}")
+                _fail_job_and_release(job, 'Обработка изображений недоступна')
+        else:
+            _start_derivatives(job.id, job.panorama_id, payload['file_path'])
+    
+    return resumed
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def get_job_status(job_id):
+    """Получение статуса фоновой задачи"""
+    try:
+        user_id = get_current_user_id()
+        user = get_current_user_state()
+        job = ProcessingJob.query.get(job_id)
+        
+        if not job:
+            return jsonify({'error': 'Задача не найдена'}), 404
+        
+        # Проверяем права (владелец или админ)
+        if job.user_id != int(user_id) and not (user and user.is_admin()):
+            return jsonify({'error': 'Недостаточно прав'}), 403
+        
+        return jsonify({'job': job.to_dict()}), 200
+    
+    except Exception as e:
+        return jsonify({'error': f'Ошибка получения задачи: {str(e)}'}), 500
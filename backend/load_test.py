@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Нагрузочный тест API: запросы в секунду и задержки при параллельных клиентах
+
+Уже запущенный сервер:
+python load_test.py --url http://localhost:5000 [--concurrency 32] [--duration 15]
+
+Сравнение сервера разработки (app.py) с продакшн-запуском (serve.py) на свободных портах:
+python load_test.py --compare [--workers 4] [--threads 4]
+
+Запросы только на чтение (главная, проверка здоровья, галерея, туры); база берется из DATABASE_URL.
+"""
+
+import os
+import sys
+import time
+import socket
+import argparse
+import threading
+import subprocess
+import http.client
+from urllib.parse import urlsplit
+
+backend_path = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_PATHS = [
+    '/api/health',
+    '/api/panoramas?per_page=12',
+    '/api/tours?per_page=12',
+    '/'
+]
+
+def run_load(base_url, paths, concurrency, duration):
+    """Клиенты в потоках с keep-alive соединениями; возвращает сводку"""
+    parts = urlsplit(base_url)
+    deadline = time.monotonic() + duration
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    
+    def client(index):
+        conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+        local_latencies = []
+        local_errors = 0
+        request_index = index
+        while time.monotonic() < deadline:
+            path = paths[request_index % len(paths)]
+            request_index += 1
+            started = time.perf_counter()
+            try:
+                conn.request('GET', path)
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 500:
+                    local_errors += 1
+                else:
+                    local_latencies.append(time.perf_counter() - started)
+            except (OSError, http.client.HTTPException):
+                local_errors += 1
+                conn.close()
+                conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+        conn.close()
+        with lock:
+            latencies.extend(local_latencies)
+            errors[0] += local_errors
+    
+    started = time.monotonic()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    
+    latencies.sort()
+    
+    def percentile(p):
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+    
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'rps': len(latencies) / elapsed,
+        'p50': percentile(0.50),
+        'p95': percentile(0.95),
+        'p99': percentile(0.99)
+    }
+
+def print_result(name, result):
+    print(f"{name:<12} {result['rps']:>10.1f} {result['p50']:>10.1f} {result['p95']:>10.1f} "
+          f"{result['p99']:>10.1f} {result['requests']:>10} {result['errors']:>8}")
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def wait_until_ready(base_url, process, timeout=60):
+    parts = urlsplit(base_url)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'Сервер завершился с кодом {process.returncode}')
+        try:
+            conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=2)
+            conn.request('GET', '/api/health')
+            conn.getresponse().read()
+            conn.close()
+            return
+        except OSError:
+            time.sleep(0.5)
+    raise RuntimeError('Сервер не ответил за отведенное время')
+
+def start_server(server, args):
+    """serve.py в отдельном процессе на свободном порту"""
+    port = free_port()
+    command = [sys.executable, os.path.join(backend_path, 'serve.py'), '--server', server,
+               '--host', '127.0.0.1', '--port', str(port)]
+    if server != 'dev':
+        command += ['--workers', str(args.workers), '--threads', str(args.threads)]
+    process = subprocess.Popen(command, cwd=backend_path, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_until_ready(base_url, process)
+    except Exception:
+        process.kill()
+        raise
+    return process, base_url
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест API')
+    parser.add_argument('--url', default='http://localhost:5000', help='Адрес запущенного сервера')
+    parser.add_argument('--compare', action='store_true', help='Сравнить сервер разработки и serve.py')
+    parser.add_argument('--server', default='waitress' if os.name == 'nt' else 'gunicorn',
+                        help='Продакшн-сервер для сравнения')
+    parser.add_argument('--workers', type=int, default=4, help='Процессов продакшн-сервера')
+    parser.add_argument('--threads', type=int, default=4, help='Потоков в процессе продакшн-сервера')
+    parser.add_argument('--concurrency', type=int, default=32, help='Параллельных клиентов')
+    parser.add_argument('--duration', type=float, default=15, help='Секунд нагрузки на каждый сервер')
+    parser.add_argument('--path', action='append', dest='paths', help='Путь для запросов (можно несколько)')
+    args = parser.parse_args()
+    paths = args.paths or DEFAULT_PATHS
+    
+    print(f"📋 Клиентов: {args.concurrency}, длительность: {args.duration} с, пути: {', '.join(paths)}\n")
+    header = f"{'Сервер':<12} {'запр/с':>10} {'p50, мс':>10} {'p95, мс':>10} {'p99, мс':>10} {'запросов':>10} {'ошибок':>8}"
+    
+    if not args.compare:
+        result = run_load(args.url, paths, args.concurrency, args.duration)
+        print(header)
+        print_result(urlsplit(args.url).netloc, result)
+        return
+    
+    results = []
+    for server in ['dev', args.server]:
+        print(f"🔄 Запуск {server}...")
+        process, base_url = start_server(server, args)
+        try:
+            # Прогрев: соединения с БД, кэши, первые запросы
+            run_load(base_url, paths, 2, 1)
+            results.append((server, run_load(base_url, paths, args.concurrency, args.duration)))
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+    
+    print()
+    print(header)
+    for server, result in results:
+        print_result(server, result)
+    
+    dev_rps = results[0][1]['rps']
+    if dev_rps:
+        print(f"\n✅ {args.server}: x{results[1][1]['rps'] / dev_rps:.1f} запросов в секунду относительно сервера разработки")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Скрипт миграции для переноса служебных записей user_sessions (просмотры, посещения) в журнал активности activity_log
+"""
+
+import os
+import sys
+import sqlite3
+
+# Добавляем путь к backend в sys.path
+backend_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, backend_path)
+
+# Префиксы токенов, которыми помечались посещения, и соответствующие типы событий
+SESSION_TOKEN_EVENTS = [
+    ('view_', 'panorama_view'),
+    ('tour_', 'tour_view'),
+    ('home_', 'home'),
+    ('api_health_', 'health')
+]
+
+def migrate_database():
+    """Применяет миграцию к существующей базе данных"""
+    
+    # Проверяем оба возможных местоположения базы данных
+    db_paths = [
+        os.path.join(backend_path, 'instance', 'panorama_site.db'),
+        os.path.join(backend_path, 'panorama_site.db')
+    ]
+    
+    db_path = None
+    for path in db_paths:
+        if os.path.exists(path):
+            db_path = path
+            break
+    
+    if not db_path:
+        print("❌ База данных не найдена. Запустите app.py для её создания.")
+        return False
+    
+    print(f"📋 Найдена база данных: {db_path}")
+    
+    try:
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+        
+        # Создаем таблицу журнала активности, если ее еще нет
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS activity_log (
+                id INTEGER NOT NULL PRIMARY KEY,
+                user_id INTEGER,
+                event_type VARCHAR(20) NOT NULL,
+                object_id INTEGER,
+                created_at DATETIME NOT NULL
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_activity_log_user_id ON activity_log (user_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_activity_log_created_at ON activity_log (created_at)")
+        print("✅ Таблица activity_log готова")
+        
+        # Переносим посещения, записанные как сессии с фиктивными токенами
+        print("🔄 Переносим посещения из user_sessions...")
+        
+        moved_count = 0
+        for prefix, event_type in SESSION_TOKEN_EVENTS:
+            cursor.execute(
+                "SELECT id, user_id, token, created_at FROM user_sessions WHERE token LIKE ?",
+                (prefix + '%',)
+            )
+            sessions = cursor.fetchall()
+            
+            for session_id, user_id, token, created_at in sessions:
+                # Для просмотров id объекта зашит в токен: view_<id>_<timestamp>
+                object_id = None
+                parts = token[len(prefix):].split('_')
+                if event_type in ('panorama_view', 'tour_view') and len(parts) == 2 and parts[0].isdigit():
+                    object_id = int(parts[0])
+                
+                cursor.execute(
+                    "INSERT INTO activity_log (user_id, event_type, object_id, created_at) VALUES (?, ?, ?, ?)",
+                    (user_id, event_type, object_id, created_at)
+                )
+                cursor.execute("DELETE FROM user_sessions WHERE id = ?", (session_id,))
+                moved_count += 1
+        
+        conn.commit()
+        conn.close()
+        
+        print(f"✅ Миграция завершена успешно! Перенесено записей: {moved_count}")
+        return True
+    
+    except Exception as e:
+        print(f"❌ Ошибка миграции: {e}")
+        return False
+
+if __name__ == "__main__":
+    print("🚀 Запуск миграции базы данных для журнала активности...")
+    success = migrate_database()
+    
+    if success:
+        print("\n🎉 Миграция выполнена успешно!")
+        print("Теперь в user_sessions остаются только сессии входа.")
+    else:
+        print("\n❌ Миграция не удалась.")
+        sys.exit(1)
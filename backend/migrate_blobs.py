@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Скрипт миграции для переноса файлов панорам в хранилище по хэшу содержимого (таблица blobs)
+"""
+
+import os
+import sys
+import sqlite3
+from datetime import datetime
+
+# Добавляем путь к backend в sys.path
+backend_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, backend_path)
+
+from config import app
+from image_processing import compute_file_hash
+from blob_store import get_blob_path, normalize_extension
+
+def migrate_database():
+    """Применяет миграцию к существующей базе данных"""
+    
+    # Проверяем оба возможных местоположения базы данных
+    db_paths = [
+        os.path.join(backend_path, 'instance', 'panorama_site.db'),
+        os.path.join(backend_path, 'panorama_site.db')
+    ]
+    
+    db_path = None
+    for path in db_paths:
+        if os.path.exists(path):
+            db_path = path
+            break
+    
+    if not db_path:
+        print("❌ База данных не найдена. Запустите app.py для её создания.")
+        return False
+    
+    print(f"📋 Найдена база данных: {db_path}")
+    
+    try:
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+        
+        # Создаем таблицу blobs, если ее еще нет
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                content_hash VARCHAR(64) NOT NULL PRIMARY KEY,
+                file_path VARCHAR(500) NOT NULL UNIQUE,
+                size INTEGER NOT NULL,
+                ref_count INTEGER NOT NULL,
+                created_at DATETIME
+            )
+        """)
+        print("✅ Таблица blobs готова")
+        
+        # Переносим файлы, сохраненные до появления хранилища
+        print("🔄 Переносим файлы панорам в хранилище...")
+        
+        blobs_folder = os.path.abspath(app.config['BLOBS_FOLDER'])
+        cursor.execute("SELECT id, file_path FROM panoramas")
+        panoramas = cursor.fetchall()
+        
+        moved_count = 0
+        duplicate_count = 0
+        for panorama_id, file_path in panoramas:
+            if os.path.abspath(file_path).startswith(blobs_folder + os.sep):
+                continue
+            
+            if not os.path.exists(file_path):
+                print(f"⚠️  Файл не найден для панорамы {panorama_id}: {file_path}")
+                continue
+            
+            try:
+                content_hash = compute_file_hash(file_path)
+                cursor.execute("SELECT file_path FROM blobs WHERE content_hash = ?", (content_hash,))
+                row = cursor.fetchone()
+                
+                if row:
+                    # Такое содержимое уже есть в хранилище - копия не нужна
+                    blob_path = row[0]
+                    cursor.execute("UPDATE blobs SET ref_count = ref_count + 1 WHERE content_hash = ?", (content_hash,))
+                    os.remove(file_path)
+                    duplicate_count += 1
+                else:
+                    blob_path = get_blob_path(content_hash, normalize_extension(file_path))
+                    os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                    os.replace(file_path, blob_path)
+                    cursor.execute(
+                        "INSERT INTO blobs (content_hash, file_path, size, ref_count, created_at) VALUES (?, ?, ?, 1, ?)",
+                        (content_hash, blob_path, os.path.getsize(blob_path), datetime.utcnow())
+                    )
+                
+                cursor.execute(
+                    "UPDATE panoramas SET file_path = ?, content_hash = ? WHERE id = ?",
+                    (blob_path, content_hash, panorama_id)
+                )
+                conn.commit()
+                moved_count += 1
+            except Exception as e:
+                conn.rollback()
+                print(f"⚠️  Не удалось перенести файл панорамы {panorama_id}: {e}")
+        
+        conn.close()
+        
+        print(f"✅ Миграция завершена успешно! Перенесено файлов: {moved_count}, удалено дубликатов: {duplicate_count}")
+        return True
+    
+    except Exception as e:
+        print(f"❌ Ошибка миграции: {e}")
+        return False
+
+if __name__ == "__main__":
+    print("🚀 Запуск миграции базы данных для хранилища файлов по хэшу содержимого...")
+    success = migrate_database()
+    
+    if success:
+        print("\n🎉 Миграция выполнена успешно!")
+        print("Теперь одинаковые файлы панорам хранятся на диске один раз.")
+    else:
+        print("\n❌ Миграция не удалась.")
+        sys.exit(1)
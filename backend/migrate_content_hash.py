@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Скрипт миграции для добавления поля content_hash (SHA-256 файла) в таблицу panoramas
+"""
+
+import os
+import sys
+import sqlite3
+
+# Добавляем путь к backend в sys.path
+backend_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, backend_path)
+
+from image_processing import compute_file_hash
+
+def migrate_database():
+    """Применяет миграцию к существующей базе данных"""
+    
+    # Проверяем оба возможных местоположения базы данных
+    db_paths = [
+        os.path.join(backend_path, 'instance', 'panorama_site.db'),
+        os.path.join(backend_path, 'panorama_site.db')
+    ]
+    
+    db_path = None
+    for path in db_paths:
+        if os.path.exists(path):
+            db_path = path
+            break
+    
+    if not db_path:
+        print("❌ База данных не найдена. Запустите app.py для её создания.")
+        return False
+    
+    print(f"📋 Найдена база данных: {db_path}")
+    
+    try:
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+        
+        # Проверяем, существует ли уже столбец content_hash
+        cursor.execute("PRAGMA table_info(panoramas)")
+        columns = [row[1] for row in cursor.fetchall()]
+        
+        if 'content_hash' not in columns:
+            print("🔄 Добавляем столбец content_hash...")
+            cursor.execute('ALTER TABLE panoramas ADD COLUMN content_hash VARCHAR(64)')
+            print("✅ Добавлен столбец content_hash")
+        else:
+            print("✅ Столбец content_hash уже существует в таблице panoramas")
+        
+        # Считаем хэши для существующих панорам
+        print("🔄 Вычисляем хэши файлов существующих панорам...")
+        
+        cursor.execute("SELECT id, file_path FROM panoramas WHERE content_hash IS NULL")
+        panoramas = cursor.fetchall()
+        
+        updated_count = 0
+        for panorama_id, file_path in panoramas:
+            if os.path.exists(file_path):
+                try:
+                    cursor.execute(
+                        "UPDATE panoramas SET content_hash = ? WHERE id = ?",
+                        (compute_file_hash(file_path), panorama_id)
+                    )
+                    updated_count += 1
+                except Exception as e:
+                    print(f"⚠️  Не удалось вычислить хэш для панорамы {panorama_id}: {e}")
+            else:
+                print(f"⚠️  Файл не найден для панорамы {panorama_id}: {file_path}")
+        
+        conn.commit()
+        conn.close()
+        
+        print(f"✅ Миграция завершена успешно! Обновлено записей: {updated_count}")
+        return True
+    
+    except Exception as e:
+        print(f"❌ Ошибка миграции: {e}")
+        return False
+
+if __name__ == "__main__":
+    print("🚀 Запуск миграции базы данных для добавления поля content_hash...")
+    success = migrate_database()
+    
+    if success:
+        print("\n🎉 Миграция выполнена успешно!")
+        print("Теперь изображения панорам отдаются с ETag и кэшируются браузером.")
+    else:
+        print("\n❌ Миграция не удалась.")
+        sys.exit(1)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Скрипт миграции для создания составных индексов и уникального индекса (tour_id, panorama_id)
+"""
+
+import os
+import sys
+import sqlite3
+
+# Добавляем путь к backend в sys.path
+backend_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, backend_path)
+
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.schema import CreateIndex
+from config import db
+import models  # Регистрирует таблицы и индексы в db.metadata
+
+# Индексы, замененные составными
+OBSOLETE_INDEXES = ['ix_activity_log_user_id']
+
+def get_index_statements():
+    """CREATE INDEX IF NOT EXISTS для всех индексов, объявленных в models.py"""
+    statements = []
+    for table in db.metadata.sorted_tables:
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            sql = str(CreateIndex(index, if_not_exists=True).compile(dialect=sqlite.dialect()))
+            statements.append((index.name, table.name, sql))
+    return statements
+
+def migrate_database():
+    """Применяет миграцию к существующей базе данных"""
+    
+    # Проверяем оба возможных местоположения базы данных
+    db_paths = [
+        os.path.join(backend_path, 'instance', 'panorama_site.db'),
+        os.path.join(backend_path, 'panorama_site.db')
+    ]
+    
+    db_path = None
+    for path in db_paths:
+        if os.path.exists(path):
+            db_path = path
+            break
+    
+    if not db_path:
+        print("❌ База данных не найдена. Запустите app.py для её создания.")
+        return False
+    
+    print(f"📋 Найдена база данных: {db_path}")
+    
+    try:
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        existing_tables = {row[0] for row in cursor.fetchall()}
+        
+        # Перед уникальным индексом удаляем повторные добавления панорамы в тур (остается первое)
+        if 'tour_panoramas' in existing_tables:
+            cursor.execute("""
+                DELETE FROM tour_panoramas
+                WHERE id NOT IN (SELECT MIN(id) FROM tour_panoramas GROUP BY tour_id, panorama_id)
+            """)
+            if cursor.rowcount:
+                print(f"🧹 Удалено повторных связей тур-панорама: {cursor.rowcount}")
+        
+        for index_name in OBSOLETE_INDEXES:
+            cursor.execute(f"DROP INDEX IF EXISTS {index_name}")
+        
+        created_count = 0
+        for index_name, table_name, sql in get_index_statements():
+            if table_name not in existing_tables:
+                continue  # Таблица будет создана app.py вместе с индексами
+            
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (index_name,))
+            if cursor.fetchone():
+                continue
+            
+            cursor.execute(sql)
+            created_count += 1
+            print(f"✅ Создан индекс {index_name} ({table_name})")
+        
+        # Статистика для планировщика запросов
+        cursor.execute("ANALYZE")
+        
+        conn.commit()
+        conn.close()
+        
+        print(f"✅ Миграция завершена успешно! Создано индексов: {created_count}")
+        return True
+    
+    except Exception as e:
+        print(f"❌ Ошибка миграции: {e}")
+        return False
+
+if __name__ == "__main__":
+    print("🚀 Запуск миграции базы данных для составных индексов...")
+    success = migrate_database()
+    
+    if success:
+        print("\n🎉 Миграция выполнена успешно!")
+        print("Планы запросов до и после: python benchmark_query_plans.py")
+    else:
+        print("\n❌ Миграция не удалась.")
+        sys.exit(1)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Скрипт миграции для добавления полей owner и heartbeat_at в таблицу processing_jobs
+"""
+
+import os
+import sys
+import sqlite3
+
+# Добавляем путь к backend в sys.path
+backend_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, backend_path)
+
+def migrate_database():
+    """Применяет миграцию к существующей базе данных"""
+    
+    # Проверяем оба возможных местоположения базы данных
+    db_paths = [
+        os.path.join(backend_path, 'instance', 'panorama_site.db'),
+        os.path.join(backend_path, 'panorama_site.db')
+    ]
+    
+    db_path = None
+    for path in db_paths:
+        if os.path.exists(path):
+            db_path = path
+            break
+    
+    if not db_path:
+        print("❌ База данных не найдена. Запустите app.py для её создания.")
+        return False
+    
+    print(f"📋 Найдена база данных: {db_path}")
+    
+    try:
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='processing_jobs'")
+        if not cursor.fetchone():
+            print("✅ Таблица processing_jobs еще не создана, она появится при запуске app.py")
+            conn.close()
+            return True
+        
+        cursor.execute("PRAGMA table_info(processing_jobs)")
+        columns = [row[1] for row in cursor.fetchall()]
+        
+        for column, column_type in (('owner', 'VARCHAR(255)'), ('heartbeat_at', 'DATETIME')):
+            if column in columns:
+                print(f"✅ Столбец {column} уже существует в таблице processing_jobs")
+                continue
+            
+            print(f"🔄 Добавляем столбец {column}...")
+            cursor.execute(f'ALTER TABLE processing_jobs ADD COLUMN {column} {column_type}')
+            print(f"✅ Добавлен столбец {column}")
+        
+        # Незавершенные задачи без владельца будут возобновлены при следующем запуске сервера
+        conn.commit()
+        conn.close()
+        
+        print("✅ Миграция завершена успешно!")
+        return True
+    
+    except Exception as e:
+        print(f"❌ Ошибка миграции: {e}")
+        return False
+
+if __name__ == "__main__":
+    print("🚀 Запуск миграции базы данных для добавления владельца фоновых задач...")
+    success = migrate_database()
+    
+    if success:
+        print("\n🎉 Миграция выполнена успешно!")
+        print("Теперь задачи процесса, завершившегося во время обработки, возобновляются ровно одним процессом.")
+    else:
+        print("\n❌ Миграция не удалась.")
+        sys.exit(1)
@@ -0,0 +1,16 @@
+"""
+Миграция: составные индексы под частые запросы и уникальный индекс (tour_id, panorama_id) в tour_panoramas
+
+Для выполнения миграции на существующей базе (повторные связи тур-панорама удаляются, остается первая):
+
+python migrate_indexes.py
+
+Сравнение планов запросов (EXPLAIN QUERY PLAN) и времени без индексов и с ними на тестовых данных:
+
+python benchmark_query_plans.py
+
+Или просто удалите файл panorama_site.db и перезапустите app.py для пересоздания базы.
+"""
+
+# Эта миграция будет применена автоматически при первом запуске app.py
+# если база данных будет пересоздана
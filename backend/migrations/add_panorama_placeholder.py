@@ -0,0 +1,20 @@
+"""
+Миграция: добавление поля placeholder к таблице panoramas
+
+Для выполнения миграции с генерацией миниатюр для существующих панорам:
+
+python migrate_placeholders.py
+
+Или вручную в SQLite (миниатюры появятся только у новых панорам):
+
+from app import app
+from config import db
+with app.app_context():
+    db.engine.execute('ALTER TABLE panoramas ADD COLUMN placeholder TEXT')
+    print("Миграция выполнена успешно!")
+
+Или просто удалите файл panorama_site.db и перезапустите app.py для пересоздания базы.
+"""
+
+# Эта миграция будет применена автоматически при первом запуске app.py
+# если база данных будет пересоздана
\ No newline at end of file
@@ -1,10 +1,15 @@
 from datetime import datetime, timedelta
-from config import db
+from config import db, app
+from view_counter import view_counter
 import uuid
 import hashlib
+import json
 
 class User(db.Model):
     __tablename__ = 'users'
+    __table_args__ = (
+        db.Index('ix_users_created_at', 'created_at'),  # Список пользователей в админ-панели, регистрации по дням
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
@@ -21,6 +26,8 @@ class User(db.Model):
     panoramas = db.relationship('Panorama', backref='owner', lazy=True, cascade='all, delete-orphan')
     tours = db.relationship('Tour', backref='creator', lazy=True, cascade='all, delete-orphan')
     sessions = db.relationship('UserSession', backref='user', lazy=True, cascade='all, delete-orphan')
+    processing_jobs = db.relationship('ProcessingJob', backref='user', lazy=True, cascade='all, delete-orphan')
+    chunked_uploads = db.relationship('ChunkedUpload', backref='user', lazy=True, cascade='all, delete-orphan')
     
     def __init__(self, username, email, password_hash):
         self.username = username
@@ -44,13 +51,24 @@ class User(db.Model):
             return True
         
         # Проверяем лимит для бесплатных пользователей (3 в день)
-        today = datetime.utcnow().date()
+        # Диапазон вместо date(колонка) == сегодня, чтобы запрос шел по индексу
+        today = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+        tomorrow = today + timedelta(days=1)
         today_uploads = Panorama.query.filter(
             Panorama.user_id == int(self.id),
-            db.func.date(Panorama.upload_date) == today
+            Panorama.upload_date >= today,
+            Panorama.upload_date < tomorrow
         ).count()
         
-        return today_uploads < 3
+        # Загрузки, которые еще обрабатываются в фоне, тоже учитываются в лимите
+        pending_uploads = ProcessingJob.query.filter(
+            ProcessingJob.user_id == int(self.id),
+            ProcessingJob.status == 'pending',
+            ProcessingJob.created_at >= today,
+            ProcessingJob.created_at < tomorrow
+        ).count()
+        
+        return today_uploads + pending_uploads < 3
     
     def to_dict(self):
         return {
@@ -68,6 +86,13 @@ class User(db.Model):
 
 class Panorama(db.Model):
     __tablename__ = 'panoramas'
+    __table_args__ = (
+        # Индексы под фактические запросы (проверка планов: benchmark_query_plans.py)
+        db.Index('ix_panoramas_public_listing', 'is_public', 'tour_only', 'upload_date'),  # Галерея
+        db.Index('ix_panoramas_user_listing', 'user_id', 'tour_only', 'upload_date'),  # Панорамы пользователя, лимит загрузок
+        db.Index('ix_panoramas_expiry', 'is_permanent', 'expires_at'),  # Очистка истекших
+        db.Index('ix_panoramas_upload_date', 'upload_date'),  # Модерация, загрузки по дням
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -84,6 +109,8 @@ class Panorama(db.Model):
     is_public = db.Column(db.Boolean, default=True)
     embed_code = db.Column(db.String(255), unique=True)
     tour_only = db.Column(db.Boolean, default=False)  # Флаг для панорам только в составе тура
+    placeholder = db.Column(db.Text, nullable=True)  # Размытая миниатюра (data URI) для мгновенного показа
+    content_hash = db.Column(db.String(64), nullable=True)  # SHA-256 файла, используется как ETag
     
     # Отношения
     hotspots_from = db.relationship('Hotspot', foreign_keys='Hotspot.from_panorama_id', backref='from_panorama', lazy=True)
@@ -110,10 +137,15 @@ class Panorama(db.Model):
             return False
         return self.expires_at and self.expires_at <= datetime.utcnow()
     
+    def get_image_url(self):
+        """URL изображения; с версией по хэшу содержимого его можно кэшировать навсегда"""
+        if self.content_hash:
+            return f"/api/panoramas/{self.id}/image?v={self.content_hash[:16]}"
+        return f"/api/panoramas/{self.id}/image"
+    
     def increment_view_count(self):
-        """Увеличение счетчика просмотров"""
-        self.view_count += 1
-        db.session.commit()
+        """Увеличение счетчика просмотров (записывается в БД пачкой в фоне)"""
+        view_counter.increment(self.id)
     
     def to_dict(self):
         return {
@@ -128,15 +160,25 @@ class Panorama(db.Model):
             'upload_date': self.upload_date.isoformat(),
             'expires_at': self.expires_at.isoformat() if self.expires_at else None,
             'is_permanent': self.is_permanent,
-            'view_count': self.view_count,
+            'view_count': (self.view_count or 0) + view_counter.pending(self.id),
             'is_public': self.is_public,
             'embed_code': self.embed_code,
             'tour_only': self.tour_only,  # Добавляем поле в словарь
+            'content_hash': self.content_hash,
+            'image_url': self.get_image_url(),
+            'thumbnail_url': f"/api/panoramas/{self.id}/thumbnail",
+            'preview_url': f"/api/panoramas/{self.id}/thumbnail?w={app.config['THUMBNAIL_WIDTHS'][-1]}",
+            'placeholder': self.placeholder,
             'is_expired': self.is_expired()
         }
 
 class Tour(db.Model):
     __tablename__ = 'tours'
+    __table_args__ = (
+        db.Index('ix_tours_public_listing', 'is_public', 'created_at'),
+        db.Index('ix_tours_user_listing', 'user_id', 'created_at'),
+        db.Index('ix_tours_created_at', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -161,13 +203,18 @@ class Tour(db.Model):
         unique_string = f"tour-{self.user_id}-{datetime.utcnow().timestamp()}-{uuid.uuid4()}"
         return hashlib.md5(unique_string.encode()).hexdigest()[:16]
     
-    def to_dict(self):
-        # Подсчитываем количество панорам в туре
-        panoramas_count = db.session.query(TourPanorama).filter_by(tour_id=self.id).count()
+    def to_dict(self, tour_panoramas=None):
+        if tour_panoramas is not None:
+            # Панорамы тура уже загружены (отсортированы по order_index) - обходимся без запросов
+            panoramas_count = len(tour_panoramas)
+            first_panorama_id = tour_panoramas[0].panorama_id if tour_panoramas else None
+        else:
+            # Подсчитываем количество панорам в туре
+            panoramas_count = db.session.query(TourPanorama).filter_by(tour_id=self.id).count()
         
-        # Получаем ID первой панорамы в туре (по порядку)
-        first_panorama = db.session.query(TourPanorama).filter_by(tour_id=self.id).order_by(TourPanorama.order_index).first()
-        first_panorama_id = first_panorama.panorama_id if first_panorama else None
+            # Получаем ID первой панорамы в туре (по порядку)
+            first_panorama = db.session.query(TourPanorama).filter_by(tour_id=self.id).order_by(TourPanorama.order_index).first()
+            first_panorama_id = first_panorama.panorama_id if first_panorama else None
         
         return {
             'id': self.id,
@@ -184,6 +231,11 @@ class Tour(db.Model):
 
 class TourPanorama(db.Model):
     __tablename__ = 'tour_panoramas'
+    __table_args__ = (
+        db.Index('uq_tour_panoramas_tour_panorama', 'tour_id', 'panorama_id', unique=True),  # Панорама входит в тур один раз
+        db.Index('ix_tour_panoramas_tour_order', 'tour_id', 'order_index'),  # Сцены тура по порядку
+        db.Index('ix_tour_panoramas_panorama', 'panorama_id'),  # Туры с панорамой
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     tour_id = db.Column(db.Integer, db.ForeignKey('tours.id', ondelete='CASCADE'), nullable=False)
@@ -209,6 +261,10 @@ class TourPanorama(db.Model):
 
 class Hotspot(db.Model):
     __tablename__ = 'hotspots'
+    __table_args__ = (
+        db.Index('ix_hotspots_from_to', 'from_panorama_id', 'to_panorama_id'),
+        db.Index('ix_hotspots_to', 'to_panorama_id'),  # Удаление переходов на панораму
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     from_panorama_id = db.Column(db.Integer, db.ForeignKey('panoramas.id'), nullable=False)
@@ -233,6 +289,10 @@ class Hotspot(db.Model):
 
 class UserSession(db.Model):
     __tablename__ = 'user_sessions'
+    __table_args__ = (
+        db.Index('ix_user_sessions_user', 'user_id'),
+        db.Index('ix_user_sessions_created_at', 'created_at'),  # Очистка старых сессий
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -261,4 +321,184 @@ class UserSession(db.Model):
             'created_at': self.created_at.isoformat(),
             'ip_address': self.ip_address,
             'is_expired': self.is_expired()
-        }
\ No newline at end of file
+        }
+
+class ProcessingJob(db.Model):
+    __tablename__ = 'processing_jobs'
+    __table_args__ = (
+        db.Index('ix_processing_jobs_user_status', 'user_id', 'status', 'created_at'),  # Лимит загрузок
+        db.Index('ix_processing_jobs_status', 'status'),  # Возобновление после перезапуска
+    )
+    
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    job_type = db.Column(db.String(50), nullable=False)  # panorama_upload, tour_panorama_upload, panorama_derivatives
+    status = db.Column(db.String(20), default='pending')  # pending, processing, completed, failed
+    payload = db.Column(db.Text, nullable=False)  # JSON с параметрами задачи
+    result = db.Column(db.Text, nullable=True)  # JSON с результатом
+    error = db.Column(db.Text, nullable=True)
+    panorama_id = db.Column(db.Integer, nullable=True)
+    owner = db.Column(db.String(255), nullable=True)  # Процесс, выполняющий задачу (хост:pid)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)  # Последняя отметка владельца, что задача выполняется
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __init__(self, user_id, job_type, payload):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.job_type = job_type
+        self.status = 'pending'
+        self.payload = json.dumps(payload)
+    
+    def get_payload(self):
+        return json.loads(self.payload)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'job_type': self.job_type,
+            'status': self.status,
+            'result': json.loads(self.result) if self.result else None,
+            'error': self.error,
+            'panorama_id': self.panorama_id,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat()
+        }
+
+class ChunkedUpload(db.Model):
+    __tablename__ = 'chunked_uploads'
+    __table_args__ = (
+        db.Index('ix_chunked_uploads_expires_at', 'expires_at'),
+    )
+    
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    title = db.Column(db.String(200), nullable=False)
+    description = db.Column(db.Text, nullable=True)
+    is_public = db.Column(db.Boolean, default=True)
+    tour_id = db.Column(db.Integer, nullable=True)  # Загрузка непосредственно в тур
+    total_size = db.Column(db.Integer, nullable=False)
+    received_size = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    
+    def __init__(self, user_id, filename, title, description, total_size, expires_at, is_public=True, tour_id=None):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.filename = filename
+        self.title = title
+        self.description = description
+        self.total_size = total_size
+        self.received_size = 0
+        self.expires_at = expires_at
+        self.is_public = is_public
+        self.tour_id = tour_id
+    
+    def is_complete(self):
+        """Все части файла получены"""
+        return self.received_size >= self.total_size
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'title': self.title,
+            'tour_id': self.tour_id,
+            'total_size': self.total_size,
+            'received_size': self.received_size,
+            'offset': self.received_size,
+            'is_complete': self.is_complete(),
+            'created_at': self.created_at.isoformat(),
+            'expires_at': self.expires_at.isoformat()
+        }
+
+class Blob(db.Model):
+    __tablename__ = 'blobs'
+    
+    content_hash = db.Column(db.String(64), primary_key=True)  # SHA-256 содержимого
+    file_path = db.Column(db.String(500), unique=True, nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)  # Число панорам (и задач в обработке), ссылающихся на файл
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __init__(self, content_hash, file_path, size):
+        self.content_hash = content_hash
+        self.file_path = file_path
+        self.size = size
+        self.ref_count = 0
+    
+    def to_dict(self):
+        return {
+            'content_hash': self.content_hash,
+            'size': self.size,
+            'ref_count': self.ref_count,
+            'created_at': self.created_at.isoformat()
+        }
+
+class ActivityEvent(db.Model):
+    __tablename__ = 'activity_log'
+    __table_args__ = (
+        db.Index('ix_activity_log_user_created', 'user_id', 'created_at'),  # Последняя активность пользователя
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=True)
+    event_type = db.Column(db.String(20), nullable=False)  # login, register, home, health, panorama_view, tour_view
+    object_id = db.Column(db.Integer, nullable=True)  # id панорамы или тура
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'event_type': self.event_type,
+            'object_id': self.object_id,
+            'created_at': self.created_at.isoformat()
+        }
+
+class DailyRollup(db.Model):
+    __tablename__ = 'daily_rollups'
+    
+    day = db.Column(db.Date, primary_key=True)
+    metric = db.Column(db.String(30), primary_key=True)  # registrations, uploads, visits
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+class StatsTotal(db.Model):
+    __tablename__ = 'stats_totals'
+    
+    metric = db.Column(db.String(50), primary_key=True)  # users, panoramas, tours, ..., subscription:<тип>
+    value = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class UserRollup(db.Model):
+    __tablename__ = 'user_rollups'
+    
+    user_id = db.Column(db.Integer, primary_key=True)
+    panorama_count = db.Column(db.Integer, nullable=False, default=0, index=True)
+    tour_count = db.Column(db.Integer, nullable=False, default=0)
+
+class StorageUsage(db.Model):
+    __tablename__ = 'storage_usage'
+    
+    user_id = db.Column(db.Integer, primary_key=True)  # 0 - общий счетчик по всем пользователям
+    bytes_used = db.Column(db.BigInteger, nullable=False, default=0)  # Сумма Panorama.file_size
+    panorama_count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'user_id': self.user_id,
+            'bytes_used': self.bytes_used,
+            'panorama_count': self.panorama_count,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class RevokedToken(db.Model):
+    __tablename__ = 'revoked_tokens'
+    
+    jti = db.Column(db.String(64), primary_key=True)  # Идентификатор отозванного JWT
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)  # После истечения токена запись не нужна
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -0,0 +1,103 @@
+import json
+import base64
+from datetime import datetime
+from flask import request
+from config import db
+
+# Максимальный размер страницы в режиме курсора
+MAX_CURSOR_PAGE_SIZE = 100
+
+class InvalidCursor(ValueError):
+    """Курсор поврежден или от другого списка"""
+
+def desc_key(column):
+    return (column, True)
+
+def asc_key(column):
+    return (column, False)
+
+def _ordering(sort_keys):
+    return [column.desc() if descending else column.asc() for column, descending in sort_keys]
+
+def encode_cursor(values, total):
+    """Непрозрачный курсор: значения ключей сортировки последней строки и общее число строк"""
+    payload = {
+        'k': [value.isoformat() if isinstance(value, datetime) else value for value in values],
+        't': total
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, sort_keys):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        values = payload['k']
+        if len(values) != len(sort_keys):
+            raise InvalidCursor('Курсор не подходит для этого списка')
+        
+        values = [
+            datetime.fromisoformat(value) if isinstance(column.type, db.DateTime) and value is not None else value
+            for (column, _), value in zip(sort_keys, values)
+        ]
+        return values, payload.get('t')
+    except InvalidCursor:
+        raise
+    except Exception:
+        raise InvalidCursor('Некорректный курсор')
+
+def _after(sort_keys, values):
+    """Условие "строка идет после курсора": (k1 < v1) OR (k1 = v1 AND k2 < v2) OR ... с учетом направлений"""
+    conditions = []
+    for i, (column, descending) in enumerate(sort_keys):
+        equal_prefix = [sort_keys[j][0] == values[j] for j in range(i)]
+        beyond = column < values[i] if descending else column > values[i]
+        conditions.append(db.and_(*equal_prefix, beyond))
+    return db.or_(*conditions)
+
+def paginate_listing(query, sort_keys, default_per_page):
+    """Страница списка по номеру (page) или по курсору (cursor); возвращает (строки, данные пагинации)"""
+    # Последний ключ сортировки должен быть уникальным (id). В режиме курсора нет OFFSET и COUNT на каждую
+    # страницу: общее число считается на первой странице (если не передан count=false) и переносится в курсоре
+    per_page = request.args.get('per_page', default_per_page, type=int)
+    cursor = request.args.get('cursor')
+    
+    if cursor is None:
+        pagination = query.order_by(*_ordering(sort_keys)).paginate(
+            page=request.args.get('page', 1, type=int),
+            per_page=per_page,
+            error_out=False
+        )
+        return pagination.items, {
+            'page': pagination.page,
+            'per_page': pagination.per_page,
+            'total': pagination.total,
+            'pages': pagination.pages,
+            'has_next': pagination.has_next,
+            'has_prev': pagination.has_prev
+        }
+    
+    per_page = max(1, min(per_page, MAX_CURSOR_PAGE_SIZE))
+    single_entity = len(query.column_descriptions) == 1
+    
+    if cursor:
+        values, total = decode_cursor(cursor, sort_keys)
+        page_query = query.filter(_after(sort_keys, values))
+    else:
+        # Первая страница
+        total = query.order_by(None).count() if request.args.get('count', 'true') != 'false' else None
+        page_query = query
+    
+    rows = page_query.add_columns(*[column for column, _ in sort_keys])\
+                     .order_by(*_ordering(sort_keys))\
+                     .limit(per_page + 1).all()
+    
+    has_next = len(rows) > per_page
+    rows = rows[:per_page]
+    key_count = len(sort_keys)
+    items = [row[0] if single_entity else tuple(row[:-key_count]) for row in rows]
+    
+    return items, {
+        'per_page': per_page,
+        'total': total,
+        'has_next': has_next,
+        'next_cursor': encode_cursor(rows[-1][-key_count:], total) if has_next else None
+    }
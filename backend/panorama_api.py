@@ -1,20 +1,80 @@
 import os
 from flask import request, jsonify, send_file, url_for
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
 from werkzeug.utils import secure_filename
-from PIL import Image
-import uuid
 from datetime import datetime
 from config import app, db, allowed_file
-from models import User, Panorama, Tour, TourPanorama
+from models import Panorama, Tour, TourPanorama
+from current_user import get_current_user, get_current_user_id, get_current_user_state
+from image_processing import (
+    CUBE_FACES, load_tiles_metadata, load_cubemap_metadata, get_tile_path, get_cubemap_face_path,
+    remove_panorama_derivatives
+)
+from jobs import enqueue_panorama_upload, request_panorama_derivatives
+from blob_store import store_blob_stream, discard_orphan_blob, release_blob
+from tour_manifest import get_panorama_tour_ids, invalidate_tour_manifests
+from activity_log import record_activity
+from storage_usage import remove_storage_usage
+from stats_rollups import count_removed_panoramas
+from user_stats import invalidate_user_stats
+from search_index import apply_search
+from pagination import paginate_listing, desc_key, asc_key, InvalidCursor
+from thumbnails import get_panorama_thumbnail
+from read_replica import use_read_replica
+
+# MIME типы изображений панорам по расширению
+IMAGE_MIMETYPES = {'jpg': 'image/jpeg', 'jpeg': 'image/jpeg', 'png': 'image/png'}
+
+# Срок кэширования неизменяемых ресурсов (год)
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+def check_panorama_image_access(panorama):
+    """Проверка прав на получение изображений панорамы, возвращает ответ с ошибкой или None"""
+    if panorama.is_expired():
+        return jsonify({'error': 'Срок действия панорамы истек'}), 410
+    
+    # Проверяем права доступа для непубличных панорам
+    if not panorama.is_public:
+        try:
+            from flask_jwt_extended import verify_jwt_in_request
+            verify_jwt_in_request(optional=True)
+            user_id = get_current_user_id()
+            if not user_id or (int(user_id) != panorama.user_id and not panorama.tour_only):
+                # Для панорам только для тура проверяем, находится ли она в каком-либо туре пользователя
+                if panorama.tour_only:
+                    # Проверяем, принадлежит ли панорама какому-либо туру пользователя
+                    user_tour_panorama = TourPanorama.query.join(Tour).filter(
+                        TourPanorama.panorama_id == panorama.id,
+                        Tour.user_id == int(user_id)
+                    ).first()
+                    if not user_tour_panorama:
+                        return jsonify({'error': 'Панорама недоступна'}), 403
+                else:
+                    return jsonify({'error': 'Панорама недоступна'}), 403
+        except Exception as e:
+            return jsonify({'error': 'Панорама недоступна'}), 403
+    
+    return None
+
+def derivatives_pending_response(panorama, name):
+    """Ответ, пока производные файлы строятся в фоне (в запросе они не генерируются)"""
+    if not os.path.exists(panorama.file_path):
+        return jsonify({'error': 'Файл панорамы не найден'}), 404
+    
+    if not request_panorama_derivatives(panorama):
+        return jsonify({'error': f'{name} для панорамы недоступны'}), 404
+    
+    response = jsonify({'message': f'{name} для панорамы строятся, повторите запрос позже'})
+    response.headers['Retry-After'] = '5'
+    return response, 202
 
 @app.route('/api/panoramas/upload', methods=['POST'])
 @jwt_required()
 def upload_panorama():
     """Загрузка панорамы"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(int(user_id))
+        user_id = get_current_user_id()
+        user = get_current_user()
         
         if not user:
             return jsonify({'error': 'Пользователь не найден'}), 404
@@ -50,55 +110,31 @@ def upload_panorama():
         if file_size > app.config['MAX_CONTENT_LENGTH']:
             return jsonify({'error': 'Файл слишком большой. Максимальный размер: 50MB'}), 400
         
-        # Генерация уникального имени файла
-        filename = secure_filename(file.filename)
-        name, ext = os.path.splitext(filename)
-        unique_filename = f"{uuid.uuid4().hex}_{name}{ext}"
-        
-        # Создание папки пользователя
-        user_folder = os.path.join(app.config['UPLOAD_FOLDER'], str(user_id))
-        os.makedirs(user_folder, exist_ok=True)
-        
-        file_path = os.path.join(user_folder, unique_filename)
-        
-        # Сохранение файла
-        file.save(file_path)
-        
-        # Проверка, что это изображение и получение размеров
-        try:
-            with Image.open(file_path) as img:
-                width, height = img.size
-                # Теперь принимаем любые изображения - никаких ограничений по соотношению сторон!
-                
-        except Exception as e:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-            return jsonify({'error': 'Файл поврежден или не является изображением'}), 400
+        # Сохранение файла в хранилище по хэшу содержимого (одинаковые файлы хранятся один раз)
+        blob = store_blob_stream(file.stream, secure_filename(file.filename))
+        file_path = blob.file_path
         
-        # Создание записи в базе данных с размерами изображения
-        panorama = Panorama(
+        # Проверка изображения, создание записи и генерация тайлов выполняются в фоне
+        job = enqueue_panorama_upload(
             user_id=user_id,
-            title=title,
-            description=description,
             file_path=file_path,
             file_size=file_size,
-            width=width,
-            height=height
+            title=title,
+            description=description,
+            is_public=is_public,
+            content_hash=blob.content_hash
         )
-        panorama.is_public = is_public
-        
-        db.session.add(panorama)
-        db.session.commit()
         
         return jsonify({
-            'message': 'Панорама загружена успешно',
-            'panorama': panorama.to_dict()
-        }), 201
+            'message': 'Панорама принята в обработку',
+            'job': job.to_dict(),
+            'status_url': f'/api/jobs/{job.id}'
+        }), 202
         
     except Exception as e:
-        if 'file_path' in locals() and os.path.exists(file_path):
-            os.remove(file_path)
         db.session.rollback()
+        if 'file_path' in locals():
+            discard_orphan_blob(file_path)
         return jsonify({'error': f'Ошибка загрузки: {str(e)}'}), 500
 
 @app.route('/api/panoramas/<int:panorama_id>', methods=['GET'])
@@ -118,9 +154,9 @@ def get_panorama(panorama_id):
             # Проверяем, является ли текущий пользователь владельцем
             # Но разрешаем доступ к панорамам только для тура владельцу
             try:
-                from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+                from flask_jwt_extended import verify_jwt_in_request
                 verify_jwt_in_request(optional=True)
-                user_id = get_jwt_identity()
+                user_id = get_current_user_id()
                 if not user_id or (user_id != panorama.user_id and not panorama.tour_only):
                     # Для панорам только для тура проверяем, находится ли она в каком-либо туре пользователя
                     if panorama.tour_only:
@@ -138,30 +174,18 @@ def get_panorama(panorama_id):
         else:
             # Для публичных панорам тоже проверяем авторизацию
             try:
-                from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+                from flask_jwt_extended import verify_jwt_in_request
                 verify_jwt_in_request(optional=True)
-                user_id = get_jwt_identity()
+                user_id = get_current_user_id()
             except:
                 pass
         
         # Увеличиваем счетчик просмотров
         panorama.increment_view_count()
         
-        # Создаем сессию для отслеживания посещений
+        # Отмечаем просмотр в журнале активности
         if user_id:
-            from models import UserSession
-            from datetime import timedelta
-            # Создание сессии для отслеживания активности
-            session = UserSession(
-                user_id=int(user_id),
-                token=f"view_{panorama_id}_{datetime.utcnow().timestamp()}",
-                expires_at=datetime.utcnow() + timedelta(hours=1),
-                ip_address=request.remote_addr,
-                user_agent=request.headers.get('User-Agent')
-            )
-            
-            db.session.add(session)
-            db.session.commit()
+            record_activity(user_id, 'panorama_view', panorama_id)
         
         return jsonify({
             'panorama': panorama.to_dict(),
@@ -172,6 +196,24 @@ def get_panorama(panorama_id):
         db.session.rollback()
         return jsonify({'error': f'Ошибка получения панорамы: {str(e)}'}), 500
 
+def set_image_cache_headers(response, panorama):
+    """Заголовки кэширования изображения панорамы"""
+    if panorama.is_public:
+        response.cache_control.public = True
+    else:
+        response.cache_control.private = True
+    
+    # URL с версией по хэшу содержимого никогда не меняется - кэшируем навсегда
+    versioned = panorama.content_hash and request.args.get('v') == panorama.content_hash[:16]
+    if versioned:
+        response.cache_control.no_cache = None
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        # Без версии браузер обязан перепроверить ETag, но ответ будет 304 без тела
+        response.cache_control.no_cache = True
+    return response
+
 @app.route('/api/panoramas/<int:panorama_id>/image', methods=['GET'])
 def get_panorama_image(panorama_id):
     """Получение файла изображения панорамы"""
@@ -181,30 +223,16 @@ def get_panorama_image(panorama_id):
         if not panorama:
             return jsonify({'error': 'Панорама не найдена'}), 404
         
-        if panorama.is_expired():
-            return jsonify({'error': 'Срок действия панорамы истек'}), 410
+        access_error = check_panorama_image_access(panorama)
+        if access_error:
+            return access_error
         
-        # Проверяем права доступа для непубличных панорам
-        if not panorama.is_public:
-            try:
-                from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
-                verify_jwt_in_request(optional=True)
-                user_id = get_jwt_identity()
-                if not user_id or (int(user_id) != panorama.user_id and not panorama.tour_only):
-                    # Для панорам только для тура проверяем, находится ли она в каком-либо туре пользователя
-                    if panorama.tour_only:
-                        # Проверяем, принадлежит ли панорама какому-либо туру пользователя
-                        from models import TourPanorama, Tour
-                        user_tour_panorama = TourPanorama.query.join(Tour).filter(
-                            TourPanorama.panorama_id == panorama_id,
-                            Tour.user_id == int(user_id)
-                        ).first()
-                        if not user_tour_panorama:
-                            return jsonify({'error': 'Панорама недоступна'}), 403
-                    else:
-                        return jsonify({'error': 'Панорама недоступна'}), 403
-            except Exception as e:
-                return jsonify({'error': 'Панорама недоступна'}), 403
+        # Повторный запрос: сверяем ETag с хэшем из БД, не обращаясь к файлу
+        etag = panorama.content_hash
+        if etag and request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+            response.set_etag(etag)
+            return set_image_cache_headers(response, panorama)
         
         if not os.path.exists(panorama.file_path):
             return jsonify({'error': 'Файл панорамы не найден'}), 404
@@ -214,22 +242,154 @@ def get_panorama_image(panorama_id):
             return jsonify({'error': 'Неподдерживаемый формат файла'}), 400
         
         # Определяем mimetype на основе расширения файла
-        import mimetypes
-        mime_type, _ = mimetypes.guess_type(panorama.file_path)
-        if mime_type is None:
-            mime_type = 'image/jpeg'  # По умолчанию для изображений
-        
-        return send_file(panorama.file_path, as_attachment=False, mimetype=mime_type)
+        extension = panorama.file_path.rsplit('.', 1)[1].lower()
+        mime_type = IMAGE_MIMETYPES.get(extension, 'image/jpeg')
+        
+        # conditional=True включает ответы 304 по If-Modified-Since и частичную отдачу по Range
+        response = send_file(
+            panorama.file_path,
+            as_attachment=False,
+            mimetype=mime_type,
+            etag=etag or True,
+            conditional=True
+        )
+        return set_image_cache_headers(response, panorama)
         
     except Exception as e:
         return jsonify({'error': f'Ошибка получения изображения: {str(e)}'}), 500
 
+@app.route('/api/panoramas/<int:panorama_id>/thumbnail', methods=['GET'])
+def get_panorama_thumbnail_image(panorama_id):
+    """Получение миниатюры панорамы (ширина в параметре w)"""
+    try:
+        panorama = Panorama.query.get(panorama_id)
+        
+        if not panorama:
+            return jsonify({'error': 'Панорама не найдена'}), 404
+        
+        access_error = check_panorama_image_access(panorama)
+        if access_error:
+            return access_error
+        
+        if not os.path.exists(panorama.file_path):
+            return jsonify({'error': 'Файл панорамы не найден'}), 404
+        
+        width = request.args.get('w', type=int)
+        thumbnail_path = get_panorama_thumbnail(panorama.id, panorama.file_path, width)
+        
+        return send_file(thumbnail_path, as_attachment=False, mimetype='image/jpeg', max_age=86400)
+    
+    except Exception as e:
+        return jsonify({'error': f'Ошибка получения миниатюры: {str(e)}'}), 500
+
+@app.route('/api/panoramas/<int:panorama_id>/tiles', methods=['GET'])
+def get_panorama_tiles(panorama_id):
+    """Получение описания тайловой пирамиды панорамы"""
+    try:
+        panorama = Panorama.query.get(panorama_id)
+        
+        if not panorama:
+            return jsonify({'error': 'Панорама не найдена'}), 404
+        
+        access_error = check_panorama_image_access(panorama)
+        if access_error:
+            return access_error
+        
+        metadata = load_tiles_metadata(panorama_id)
+        if metadata is None:
+            # Пирамида еще не построена (например, панорама загружена до появления тайлов)
+            return derivatives_pending_response(panorama, 'Тайлы')
+        
+        metadata['url_template'] = f"/api/panoramas/{panorama_id}/tiles/{{level}}/{{x}}_{{y}}.jpg"
+        
+        return jsonify({'tiles': metadata}), 200
+    
+    except Exception as e:
+        return jsonify({'error': f'Ошибка получения тайлов: {str(e)}'}), 500
+
+@app.route('/api/panoramas/<int:panorama_id>/tiles/<int:level>/<int:x>_<int:y>.jpg', methods=['GET'])
+def get_panorama_tile(panorama_id, level, x, y):
+    """Получение одного тайла панорамы"""
+    try:
+        panorama = Panorama.query.get(panorama_id)
+        
+        if not panorama:
+            return jsonify({'error': 'Панорама не найдена'}), 404
+        
+        access_error = check_panorama_image_access(panorama)
+        if access_error:
+            return access_error
+        
+        tile_path = get_tile_path(panorama_id, level, x, y)
+        if not os.path.exists(tile_path):
+            return jsonify({'error': 'Тайл не найден'}), 404
+        
+        return send_file(tile_path, as_attachment=False, mimetype='image/jpeg')
+    
+    except Exception as e:
+        return jsonify({'error': f'Ошибка получения тайла: {str(e)}'}), 500
+
+@app.route('/api/panoramas/<int:panorama_id>/cubemap', methods=['GET'])
+def get_panorama_cubemap(panorama_id):
+    """Получение описания кубической карты панорамы"""
+    try:
+        panorama = Panorama.query.get(panorama_id)
+        
+        if not panorama:
+            return jsonify({'error': 'Панорама не найдена'}), 404
+        
+        access_error = check_panorama_image_access(panorama)
+        if access_error:
+            return access_error
+        
+        metadata = load_cubemap_metadata(panorama_id)
+        if metadata is None:
+            # Кубическая карта еще не построена (например, панорама загружена раньше)
+            return derivatives_pending_response(panorama, 'Грани куба')
+        
+        return jsonify({
+            'cubemap': {
+                'face_size': metadata['face_size'],
+                'faces': {
+                    face: f"/api/panoramas/{panorama_id}/cubemap/{face}.jpg" for face in metadata['faces']
+                }
+            }
+        }), 200
+    
+    except Exception as e:
+        return jsonify({'error': f'Ошибка получения кубической карты: {str(e)}'}), 500
+
+@app.route('/api/panoramas/<int:panorama_id>/cubemap/<face>.jpg', methods=['GET'])
+def get_panorama_cubemap_face(panorama_id, face):
+    """Получение грани кубической карты панорамы"""
+    try:
+        if face not in CUBE_FACES:
+            return jsonify({'error': 'Неизвестная грань куба'}), 404
+        
+        panorama = Panorama.query.get(panorama_id)
+        
+        if not panorama:
+            return jsonify({'error': 'Панорама не найдена'}), 404
+        
+        access_error = check_panorama_image_access(panorama)
+        if access_error:
+            return access_error
+        
+        face_path = get_cubemap_face_path(panorama_id, face)
+        if not os.path.exists(face_path):
+            return jsonify({'error': 'Грань куба не найдена'}), 404
+        
+        return send_file(face_path, as_attachment=False, mimetype='image/jpeg')
+    
+    except Exception as e:
+        return jsonify({'error': f'Ошибка получения грани куба: {str(e)}'}), 500
+
 @app.route('/api/panoramas/<int:panorama_id>', methods=['PUT'])
 @jwt_required()
 def update_panorama(panorama_id):
     """Обновление информации о панораме"""
     try:
-        user_id = get_jwt_identity()
+        user_id = get_current_user_id()
         panorama = Panorama.query.get(panorama_id)
         
         if not panorama:
@@ -256,6 +416,7 @@ def update_panorama(panorama_id):
             panorama.is_public = bool(data['is_public'])
         
         db.session.commit()
+        invalidate_tour_manifests(get_panorama_tour_ids(panorama_id))
         
         return jsonify({
             'message': 'Панорама обновлена',
@@ -271,8 +432,8 @@ def update_panorama(panorama_id):
 def delete_panorama(panorama_id):
     """Удаление панорамы"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(int(user_id))
+        user_id = get_current_user_id()
+        user = get_current_user_state()
         panorama = Panorama.query.get(panorama_id)
         
         if not panorama:
@@ -291,19 +452,25 @@ def delete_panorama(panorama_id):
             )
         ).delete(synchronize_session=False)
         
+        # Туры с этой панорамой (и hotspots на нее) нужно будет пересобрать
+        affected_tour_ids = get_panorama_tour_ids(panorama_id)
+        
         # Удаляем все связи с турами
         TourPanorama.query.filter_by(panorama_id=panorama_id).delete(synchronize_session=False)
         
-        # Удаляем файл
-        if os.path.exists(panorama.file_path):
-            try:
-                os.remove(panorama.file_path)
-            except Exception as e:
-                print(f"Ошибка удаления файла {panorama.file_path}: {e}")
+        # Освобождаем файл (удаляется после коммита, если на него не ссылаются другие панорамы)
+        release_blob(panorama.file_path)
+        remove_storage_usage([panorama])
+        count_removed_panoramas([panorama])
         
         # Удаляем запись из базы данных
         db.session.delete(panorama)
         db.session.commit()
+        invalidate_tour_manifests(affected_tour_ids)
+        invalidate_user_stats(panorama.user_id)
+        
+        # Удаляем тайлы и другие производные файлы
+        remove_panorama_derivatives(panorama_id)
         
         return jsonify({'message': 'Панорама удалена'}), 200
         
@@ -315,11 +482,10 @@ def delete_panorama(panorama_id):
         return jsonify({'error': f'Ошибка удаления: {str(e)}'}), 500
 
 @app.route('/api/panoramas', methods=['GET'])
+@use_read_replica
 def list_panoramas():
     """Получение списка публичных панорам"""
     try:
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 12, type=int)
         search = request.args.get('search', '').strip()
         
         # Фильтруем панорамы, исключая те, которые только для тура
@@ -333,44 +499,38 @@ def list_panoramas():
             )
         )
         
+        rank = None
         if search:
-            query = query.filter(
-                db.or_(
-                    Panorama.title.ilike(f'%{search}%'),
-                    Panorama.description.ilike(f'%{search}%')
-                )
+            query, rank = apply_search(
+                query, Panorama, 'panorama_search', search,
+                fallback_columns=[Panorama.title, Panorama.description]
             )
         
-        query = query.order_by(Panorama.upload_date.desc())
+        # Сначала самые релевантные (при поиске), затем новые
+        sort_keys = [desc_key(Panorama.upload_date), desc_key(Panorama.id)]
+        if rank is not None:
+            sort_keys.insert(0, asc_key(rank))
         
-        pagination = query.paginate(
-            page=page,
-            per_page=per_page,
-            error_out=False
-        )
+        items, pagination = paginate_listing(query, sort_keys, default_per_page=12)
         
         panoramas = []
-        for p in pagination.items:
+        for p in items:
             panorama_data = p.to_dict()
             panorama_data['owner'] = p.owner.username if p.owner else 'Unknown'
             panoramas.append(panorama_data)
         
         return jsonify({
             'panoramas': panoramas,
-            'pagination': {
-                'page': page,
-                'per_page': per_page,
-                'total': pagination.total,
-                'pages': pagination.pages,
-                'has_next': pagination.has_next,
-                'has_prev': pagination.has_prev
-            }
+            'pagination': pagination
         }), 200
         
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': f'Ошибка получения списка: {str(e)}'}), 500
 
 @app.route('/api/panoramas/embed/<embed_code>', methods=['GET'])
+@use_read_replica
 def get_panorama_by_embed(embed_code):
     """Получение панорамы по embed коду"""
     try:
@@ -394,6 +554,7 @@ def get_panorama_by_embed(embed_code):
         return jsonify({'error': f'Ошибка получения панорамы: {str(e)}'}), 500
 
 @app.route('/api/panoramas/<int:panorama_id>/embed', methods=['GET'])
+@use_read_replica
 def get_embed_code(panorama_id):
     """Получение HTML кода для встраивания панорамы"""
     try:
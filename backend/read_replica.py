@@ -0,0 +1,149 @@
+import os
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+from flask import g, request
+from config import app, db
+from db_engine import READ_REPLICA_BIND, is_sqlite_uri, is_sqlite_memory_uri
+
+# Cookie, с которой клиент после своей записи читает с основной базы (реплика может отставать)
+READ_PRIMARY_COOKIE = 'read_primary'
+
+def is_read_replica_enabled():
+    return bool(app.config.get('DATABASE_READ_REPLICA_URL'))
+
+def use_read_replica(f):
+    """Декоратор маршрута: SELECT запроса идут на реплику (пока запрос сам ничего не записал)"""
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        if is_read_replica_enabled():
+            g.read_replica = True
+        return f(*args, **kwargs)
+    return wrapper
+
+@contextmanager
+def read_from_primary():
+    """Чтение с основной базы внутри помеченного запроса (например, для данных, которые попадут в кэш)"""
+    previous = g.get('read_primary', False)
+    g.read_primary = True
+    try:
+        yield
+    finally:
+        g.read_primary = previous
+
+@app.before_request
+def _read_your_writes():
+    if is_read_replica_enabled() and request.cookies.get(READ_PRIMARY_COOKIE):
+        g.read_primary = True
+
+@app.after_request
+def _remember_write(response):
+    if is_read_replica_enabled() and g.get('db_wrote'):
+        response.set_cookie(
+            READ_PRIMARY_COOKIE, '1',
+            max_age=app.config['READ_REPLICA_STICKY_SECONDS'],
+            httponly=True,
+            samesite='Lax'
+        )
+    return response
+
+class SqliteReplicaSync:
+    """Периодическое копирование основной SQLite базы в файл реплики (backup API, без остановки записи)"""
+    
+    def __init__(self, interval):
+        self.interval = interval
+        self._syncs = 0
+        self._errors = 0
+        self._last_error = None
+        self._last_sync_at = None
+        self._last_duration = None
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._thread = None
+    
+    def is_configured(self):
+        """Синхронизация нужна, только если и основная база, и реплика - файлы SQLite"""
+        replica_uri = app.config.get('DATABASE_READ_REPLICA_URL')
+        primary_uri = app.config['SQLALCHEMY_DATABASE_URI']
+        return bool(
+            replica_uri
+            and is_sqlite_uri(replica_uri) and not is_sqlite_memory_uri(replica_uri)
+            and is_sqlite_uri(primary_uri) and not is_sqlite_memory_uri(primary_uri)
+        )
+    
+    def start(self):
+        """Запуск фонового потока (повторный вызов ничего не делает)"""
+        if not self.is_configured() or self.interval <= 0:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='replica-sync', daemon=True)
+                self._thread.start()
+    
+    def sync(self):
+        """Копия основной базы в реплику; читатели реплики видят прежние данные до конца копирования"""
+        with self._sync_lock:
+            started = time.monotonic()
+            with app.app_context():
+                primary_path = db.engines[None].url.database
+                replica_path = db.engines[READ_REPLICA_BIND].url.database
+            
+            timeout = app.config['SQLITE_BUSY_TIMEOUT'] / 1000
+            os.makedirs(os.path.dirname(os.path.abspath(replica_path)), exist_ok=True)
+            source = sqlite3.connect(primary_path, timeout=timeout)
+            target = sqlite3.connect(replica_path, timeout=timeout)
+            try:
+                # WAL у реплики, чтобы копирование не блокировало ее читателей
+                target.execute("PRAGMA journal_mode=WAL").fetchall()
+                source.backup(target)
+            finally:
+                target.close()
+                source.close()
+            
+            with self._lock:
+                self._syncs += 1
+                self._last_sync_at = datetime.utcnow()
+                self._last_duration = time.monotonic() - started
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'running': self._thread is not None,
+                'interval': self.interval,
+                'syncs': self._syncs,
+                'errors': self._errors,
+                'last_error': self._last_error,
+                'last_sync_at': self._last_sync_at.isoformat() if self._last_sync_at else None,
+                'last_duration': self._last_duration
+            }
+    
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.sync()
+            except Exception as e:
+                print(f"Ошибка синхронизации реплики: {e}")
+                with self._lock:
+                    self._errors += 1
+                    self._last_error = str(e)
+
+replica_sync = SqliteReplicaSync(app.config['READ_REPLICA_SYNC_INTERVAL'])
+
+def ensure_read_replica():
+    """Начальная копия SQLite реплики при запуске (до первых запросов к ней)"""
+    if replica_sync.is_configured():
+        replica_sync.sync()
+
+def get_read_replica_status():
+    """Состояние реплики для админ-панели"""
+    if not is_read_replica_enabled():
+        return None
+    
+    return {
+        'sticky_seconds': app.config['READ_REPLICA_STICKY_SECONDS'],
+        'sync': replica_sync.stats() if replica_sync.is_configured() else None  # None - внешняя репликация (PostgreSQL)
+    }
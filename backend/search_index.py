@@ -0,0 +1,147 @@
+import re
+from sqlalchemy import text, literal_column, table, column
+from config import db
+
+# Поиск по названию, описанию и имени владельца на SQLite FTS5.
+# Индексы синхронизируются триггерами, поэтому пакетные удаления, каскады и смена имени пользователя
+# не требуют отдельных вызовов из кода API. На других СУБД поиск работает через ILIKE.
+
+# unicode61 приводит к нижнему регистру любые алфавиты и убирает диакритику (café -> cafe),
+# но не считает "ё" буквой "е" с диакритикой - это делается отдельно
+TOKENIZER = 'unicode61 remove_diacritics 2'
+
+# Вес колонок в ранжировании bm25: название, описание, владелец
+COLUMN_WEIGHTS = (10.0, 1.0, 3.0)
+
+# Слова запроса (буквы и цифры любых алфавитов)
+QUERY_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+def _normalized(expression):
+    return f"replace(replace(coalesce({expression}, ''), 'ё', 'е'), 'Ё', 'Е')"
+
+def _index_ddl(index_table, table, owner_column):
+    """Таблица FTS5 и триггеры синхронизации для panoramas или tours"""
+    row_values = f"""new.id, {_normalized('new.title')}, {_normalized('new.description')},
+            (SELECT {_normalized('username')} FROM users WHERE id = new.{owner_column})"""
+    return [
+        f"""CREATE VIRTUAL TABLE IF NOT EXISTS {index_table}
+            USING fts5(title, description, owner, tokenize = '{TOKENIZER}')""",
+        f"""CREATE TRIGGER IF NOT EXISTS {index_table}_insert AFTER INSERT ON {table} BEGIN
+            INSERT INTO {index_table}(rowid, title, description, owner) VALUES ({row_values});
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {index_table}_update
+            AFTER UPDATE OF title, description, {owner_column} ON {table} BEGIN
+            DELETE FROM {index_table} WHERE rowid = old.id;
+            INSERT INTO {index_table}(rowid, title, description, owner) VALUES ({row_values});
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {index_table}_delete AFTER DELETE ON {table} BEGIN
+            DELETE FROM {index_table} WHERE rowid = old.id;
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {index_table}_owner AFTER UPDATE OF username ON users BEGIN
+            UPDATE {index_table} SET owner = {_normalized('new.username')}
+            WHERE rowid IN (SELECT id FROM {table} WHERE {owner_column} = new.id);
+        END"""
+    ]
+
+SEARCH_INDEXES = {
+    'panorama_search': ('panoramas', 'user_id'),
+    'tour_search': ('tours', 'user_id')
+}
+
+_available = False
+
+def _fts5_supported():
+    """FTS5 есть только в SQLite (и должен быть включен при сборке)"""
+    if db.engine.dialect.name != 'sqlite':
+        return False
+    try:
+        db.session.execute(text("CREATE VIRTUAL TABLE IF NOT EXISTS temp.fts5_probe USING fts5(value)"))
+        db.session.execute(text("DROP TABLE temp.fts5_probe"))
+        return True
+    except Exception:
+        db.session.rollback()
+        return False
+
+def is_search_index_available():
+    """Индексы созданы (ensure_search_index); иначе поиск работает через ILIKE"""
+    global _available
+    if not _available and db.engine.dialect.name == 'sqlite':
+        _available = db.session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'panorama_search'")
+        ).first() is not None
+    return _available
+
+def ensure_search_index():
+    """Создание индексов и триггеров (вызывается после db.create_all), новые индексы заполняются из таблиц"""
+    if not _fts5_supported():
+        return False
+    
+    for index_table, (table, owner_column) in SEARCH_INDEXES.items():
+        exists = db.session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': index_table}
+        ).first()
+        
+        for statement in _index_ddl(index_table, table, owner_column):
+            db.session.execute(text(statement))
+        
+        if not exists:
+            _fill_index(index_table, table, owner_column)
+    
+    db.session.commit()
+    return True
+
+def rebuild_search_index():
+    """Полное перестроение индексов (после ручных правок БД в обход триггеров)"""
+    if not is_search_index_available():
+        return False
+    
+    for index_table, (table, owner_column) in SEARCH_INDEXES.items():
+        db.session.execute(text(f"DELETE FROM {index_table}"))
+        _fill_index(index_table, table, owner_column)
+    db.session.commit()
+    return True
+
+def _fill_index(index_table, table, owner_column):
+    db.session.execute(text(f"""
+        INSERT INTO {index_table}(rowid, title, description, owner)
+        SELECT t.id, {_normalized('t.title')}, {_normalized('t.description')}, {_normalized('u.username')}
+        FROM {table} t LEFT JOIN users u ON u.id = t.{owner_column}
+    """))
+
+def build_match_query(search):
+    """Запрос FTS5 из пользовательской строки: все слова обязательны и ищутся по началу (москв -> Москва, Москву)"""
+    tokens = QUERY_TOKEN_RE.findall(search.replace('ё', 'е').replace('Ё', 'Е'))
+    if not tokens:
+        return None
+    
+    # Каждое слово в кавычках, чтобы операторы FTS5 (AND, NEAR, *) в запросе были обычным текстом
+    terms = [f'"{token}"*' for token in tokens]
+    return ' '.join(terms)
+
+def search_subquery(index_table, search):
+    """Подзапрос (id, rank) совпадений для JOIN со списком; меньший rank - более релевантный результат"""
+    match_query = build_match_query(search)
+    if match_query is None:
+        return None
+    
+    weights = ', '.join(str(weight) for weight in COLUMN_WEIGHTS)
+    index = table(index_table, column('rowid'))
+    return db.session.query(
+        index.c.rowid.label('id'),
+        literal_column(f'bm25({index_table}, {weights})').label('rank')
+    ).select_from(index).filter(
+        text(f"{index_table} MATCH :match_query").bindparams(match_query=match_query)
+    ).subquery()
+
+def apply_search(query, model, index_table, search, fallback_columns):
+    """Фильтр списка по поисковой строке; возвращает (запрос, колонка релевантности или None без FTS5)"""
+    if is_search_index_available():
+        matches = search_subquery(index_table, search)
+        if matches is None:
+            return query.filter(db.false()), None
+        return query.join(matches, matches.c.id == model.id), matches.c.rank
+    
+    return query.filter(
+        db.or_(*[column.ilike(f'%{search}%') for column in fallback_columns])
+    ), None
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Запуск API в продакшне: несколько процессов и потоков вместо сервера разработки (app.py)
+
+python serve.py [--workers 4] [--threads 4] [--host 0.0.0.0] [--port 5000]
+
+Linux/macOS - gunicorn: процессы с общим сокетом, приложение загружается до fork (preload),
+плавный перезапуск процессов по SIGHUP (kill -HUP <pid мастера>), обновление кода без
+простоя - SIGUSR2, затем SIGQUIT старому мастеру.
+Windows - waitress: один процесс с пулом потоков (gunicorn под Windows не работает).
+
+Значения по умолчанию берутся из переменных окружения SERVE_*.
+Сравнение производительности с сервером разработки: python load_test.py --compare
+"""
+
+import os
+import sys
+import argparse
+import threading
+
+# Добавляем путь к backend в sys.path
+backend_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, backend_path)
+
+from app import app, db, init_database, start_background_workers
+from db_engine import is_sqlite_uri
+
+def default_workers():
+    """SQLite пишет в один файл: больше нескольких процессов только добавляют ожиданий блокировки"""
+    cpu_count = os.cpu_count() or 1
+    if is_sqlite_uri(app.config['SQLALCHEMY_DATABASE_URI']):
+        return min(cpu_count, 4)
+    return min(2 * cpu_count + 1, 9)
+
+# Файл блокировки держится открытым, пока жив процесс
+_background_lock_file = None
+
+def _background_lock_path():
+    os.makedirs(app.instance_path, exist_ok=True)
+    return os.path.join(app.instance_path, 'background-workers.lock')
+
+def _run_background_workers_when_locked():
+    """Ожидание файловой блокировки: фоновые потоки работают ровно в одном процессе сервера"""
+    global _background_lock_file
+    import fcntl
+    _background_lock_file = open(_background_lock_path(), 'w')
+    # Блокировка снимается ОС при завершении процесса, после чего ее получит другой процесс
+    fcntl.flock(_background_lock_file, fcntl.LOCK_EX)
+    print(f"⚙️  Фоновые задачи запущены в процессе {os.getpid()}", flush=True)
+    # Возобновляются только задачи завершившихся процессов (jobs.resume_unfinished_jobs)
+    start_background_workers()
+
+def post_fork(server, worker):
+    """Хук gunicorn в рабочем процессе сразу после fork"""
+    # Соединения, открытые мастером при загрузке, не должны использоваться в двух процессах
+    # (в том числе пул реплики для чтения)
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    
+    threading.Thread(
+        target=_run_background_workers_when_locked,
+        name='background-lock',
+        daemon=True
+    ).start()
+
+def serve_gunicorn(args):
+    from gunicorn.app.base import BaseApplication
+    
+    options = {
+        'bind': f"{args.host}:{args.port}",
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': 'gthread' if args.threads > 1 else 'sync',
+        'preload_app': True,
+        'keepalive': args.keepalive,
+        'timeout': args.timeout,
+        'graceful_timeout': args.graceful_timeout,
+        'max_requests': args.max_requests,
+        'max_requests_jitter': args.max_requests // 10,
+        'accesslog': '-' if args.access_log else None,
+        'post_fork': post_fork,
+        'proc_name': 'panorama-api'
+    }
+    # Heartbeat рабочих процессов в памяти, а не на диске (иначе медленный диск убивает процессы по timeout)
+    if os.path.isdir('/dev/shm'):
+        options['worker_tmp_dir'] = '/dev/shm'
+    
+    class PanoramaApplication(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+        
+        def load(self):
+            return app
+    
+    PanoramaApplication().run()
+
+def serve_waitress(args):
+    from waitress import serve
+    
+    # Один процесс: вся параллельность в потоках
+    start_background_workers()
+    serve(
+        app,
+        host=args.host,
+        port=args.port,
+        threads=args.threads * args.workers,
+        channel_timeout=args.timeout,
+        connection_limit=args.connection_limit,
+        ident='panorama-api'
+    )
+
+def serve_dev(args):
+    """Сервер разработки, как в app.py (для сравнения в load_test.py)"""
+    start_background_workers()
+    app.run(debug=True, use_reloader=False, host=args.host, port=args.port)
+
+def main():
+    default_server = 'waitress' if os.name == 'nt' else 'gunicorn'
+    parser = argparse.ArgumentParser(description='Запуск API в продакшне')
+    parser.add_argument('--server', choices=['gunicorn', 'waitress', 'dev'],
+                        default=os.environ.get('SERVE_SERVER', default_server), help='WSGI сервер')
+    parser.add_argument('--host', default=os.environ.get('SERVE_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('SERVE_PORT', 5000)))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('SERVE_WORKERS', 0)),
+                        help='Процессов (0 - по числу CPU с учетом типа БД)')
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('SERVE_THREADS', 4)),
+                        help='Потоков в каждом процессе')
+    parser.add_argument('--keepalive', type=int, default=int(os.environ.get('SERVE_KEEPALIVE', 5)),
+                        help='Секунд ожидания следующего запроса в keep-alive соединении')
+    parser.add_argument('--timeout', type=int, default=int(os.environ.get('SERVE_TIMEOUT', 120)),
+                        help='Секунд на запрос (загрузка больших панорам)')
+    parser.add_argument('--graceful-timeout', type=int, default=int(os.environ.get('SERVE_GRACEFUL_TIMEOUT', 30)),
+                        help='Секунд на завершение текущих запросов при перезапуске')
+    parser.add_argument('--max-requests', type=int, default=int(os.environ.get('SERVE_MAX_REQUESTS', 0)),
+                        help='Перезапуск процесса после N запросов (0 - без перезапуска)')
+    parser.add_argument('--connection-limit', type=int, default=int(os.environ.get('SERVE_CONNECTION_LIMIT', 100)),
+                        help='Максимум одновременных соединений (waitress)')
+    parser.add_argument('--access-log', action='store_true', default=os.environ.get('SERVE_ACCESS_LOG') == '1',
+                        help='Журнал запросов в stdout')
+    args = parser.parse_args()
+    
+    if args.server == 'gunicorn' and os.name == 'nt':
+        parser.error('gunicorn не работает под Windows, используйте --server waitress')
+    
+    args.workers = args.workers or default_workers()
+    
+    # Для SQLite режим WAL и PRAGMA включаются при подключении (db_engine.py)
+    init_database()
+    
+    print(f"\n🚀 Panorama 360 App API Server ({args.server}) запускается на http://{args.host}:{args.port}")
+    if args.server == 'gunicorn':
+        print(f"⚙️  Процессов: {args.workers}, потоков в процессе: {args.threads}\n")
+    elif args.server == 'waitress':
+        print(f"⚙️  Потоков: {args.threads * args.workers}\n")
+    
+    if args.server == 'gunicorn':
+        serve_gunicorn(args)
+    elif args.server == 'waitress':
+        serve_waitress(args)
+    else:
+        serve_dev(args)
+
+if __name__ == "__main__":
+    main()
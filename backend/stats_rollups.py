@@ -0,0 +1,261 @@
+import time
+import threading
+from collections import Counter
+from datetime import datetime, date, timedelta
+from sqlalchemy import func, insert, select
+from config import app, db
+from models import User, Panorama, Tour, ActivityEvent, DailyRollup, StatsTotal, UserRollup
+
+# Дневные метрики: таблица и поле даты, по которому считается событие
+DAILY_METRICS = {
+    'registrations': User.created_at,
+    'uploads': Panorama.upload_date,
+    'visits': ActivityEvent.created_at
+}
+
+def refresh_daily_rollups(since=None):
+    """Пересчет дневных агрегатов начиная с дня since (по умолчанию - только текущий день)"""
+    today = datetime.utcnow().date()
+    if since is None:
+        last_day = db.session.query(func.max(DailyRollup.day)).scalar()
+        if last_day is None:
+            # Первый запуск - заполняем историю за период графиков
+            since = today - timedelta(days=app.config['STATS_ROLLUP_BACKFILL_DAYS'])
+        else:
+            # Прошлые дни не меняются; после простоя пересчитываются и пропущенные дни.
+            # События, записанные после полуночи задним числом, учтет сверка
+            since = min(last_day, today)
+    
+    since_dt = datetime.combine(since, datetime.min.time())
+    for metric, column in DAILY_METRICS.items():
+        rows = db.session.query(
+            func.date(column).label('day'),
+            func.count().label('count')
+        ).filter(column >= since_dt).group_by(func.date(column)).all()
+        
+        DailyRollup.query.filter(
+            DailyRollup.metric == metric,
+            DailyRollup.day >= since
+        ).delete(synchronize_session=False)
+        
+        db.session.add_all([
+            DailyRollup(day=date.fromisoformat(str(row.day)), metric=metric, value=row.count)
+            for row in rows
+        ])
+    
+    db.session.commit()
+
+def refresh_totals():
+    """Полный пересчет общих счетчиков для админ-панели, возвращает расхождение со счетчиками до пересчета"""
+    totals = {
+        'users': User.query.count(),
+        'panoramas': Panorama.query.count(),
+        'tours': Tour.query.count(),
+        'premium_users': User.query.filter_by(subscription_type='premium').count(),
+        'active_users': User.query.filter_by(is_active=True).count(),
+        'blocked_users': User.query.filter_by(is_active=False).count()
+    }
+    
+    subscription_stats = db.session.query(
+        User.subscription_type,
+        func.count(User.id)
+    ).group_by(User.subscription_type).all()
+    for subscription_type, count in subscription_stats:
+        totals[f'subscription:{subscription_type}'] = count
+    
+    # При первом пересчете сравнивать не с чем
+    counted = {row.metric: row.value for row in StatsTotal.query.all()}
+    drift = {} if not counted else {
+        metric: counted.get(metric, 0) - totals.get(metric, 0)
+        for metric in set(totals) | set(counted)
+        if counted.get(metric, 0) != totals.get(metric, 0)
+    }
+    
+    now = datetime.utcnow()
+    StatsTotal.query.delete(synchronize_session=False)
+    db.session.add_all([
+        StatsTotal(metric=metric, value=value, updated_at=now)
+        for metric, value in totals.items()
+    ])
+    db.session.commit()
+    return drift
+
+def refresh_user_rollups():
+    """Пересчет числа панорам и туров каждого пользователя одним INSERT ... SELECT"""
+    panorama_counts = db.session.query(
+        Panorama.user_id, func.count(Panorama.id).label('count')
+    ).group_by(Panorama.user_id).subquery()
+    tour_counts = db.session.query(
+        Tour.user_id, func.count(Tour.id).label('count')
+    ).group_by(Tour.user_id).subquery()
+    
+    rows = select(
+        User.id,
+        func.coalesce(panorama_counts.c.count, 0),
+        func.coalesce(tour_counts.c.count, 0)
+    ).outerjoin(panorama_counts, panorama_counts.c.user_id == User.id)\
+     .outerjoin(tour_counts, tour_counts.c.user_id == User.id)
+    
+    UserRollup.query.delete(synchronize_session=False)
+    db.session.execute(
+        insert(UserRollup).from_select(['user_id', 'panorama_count', 'tour_count'], rows)
+    )
+    db.session.commit()
+
+def _adjust_totals(deltas):
+    """Атомарное изменение общих счетчиков в транзакции вызывающего кода.
+    Пока агрегаты ни разу не считались, счетчики не создаются: их заполнит первый пересчет"""
+    now = datetime.utcnow()
+    missing = []
+    for metric, delta in deltas.items():
+        if not delta:
+            continue
+        updated = StatsTotal.query.filter_by(metric=metric).update({
+            StatsTotal.value: StatsTotal.value + delta,
+            StatsTotal.updated_at: now
+        }, synchronize_session=False)
+        if not updated:
+            missing.append(metric)
+    
+    if missing and StatsTotal.query.first():
+        db.session.add_all([StatsTotal(metric=metric, value=deltas[metric], updated_at=now) for metric in missing])
+        db.session.flush()
+
+def _adjust_user_rollup(user_id, delta_panoramas, delta_tours):
+    """Атомарное изменение счетчиков пользователя; строка создается при первом изменении"""
+    updated = UserRollup.query.filter_by(user_id=user_id).update({
+        UserRollup.panorama_count: UserRollup.panorama_count + delta_panoramas,
+        UserRollup.tour_count: UserRollup.tour_count + delta_tours
+    }, synchronize_session=False)
+    
+    if not updated:
+        db.session.add(UserRollup(user_id=user_id, panorama_count=delta_panoramas, tour_count=delta_tours))
+        db.session.flush()
+
+def user_totals(user):
+    """Вклад пользователя в общие счетчики (снимается до изменения подписки или статуса)"""
+    totals = Counter({'users': 1, f'subscription:{user.subscription_type}': 1})
+    if user.subscription_type == 'premium':
+        totals['premium_users'] += 1
+    if user.is_active is not None:
+        totals['active_users' if user.is_active else 'blocked_users'] += 1
+    return totals
+
+def count_new_user(user):
+    """Учет нового пользователя (после flush, в той же транзакции)"""
+    _adjust_totals(user_totals(user))
+    _adjust_user_rollup(user.id, 0, 0)
+
+def count_user_change(before, user):
+    """Учет смены подписки или статуса; before - user_totals(user) до изменения"""
+    after = user_totals(user)
+    _adjust_totals({metric: after[metric] - before[metric] for metric in set(before) | set(after)})
+
+def count_removed_user(user, tour_count):
+    """Учет удаляемого пользователя вместе с его турами (панорамы учитываются count_removed_panoramas)"""
+    deltas = {metric: -value for metric, value in user_totals(user).items()}
+    deltas['tours'] = -tour_count
+    _adjust_totals(deltas)
+    UserRollup.query.filter_by(user_id=user.id).delete(synchronize_session=False)
+
+def count_new_panorama(user_id):
+    _adjust_totals({'panoramas': 1})
+    _adjust_user_rollup(int(user_id), 1, 0)
+
+def count_removed_panoramas(panoramas):
+    """Учет удаляемых панорам (объекты или строки с user_id), по одному UPDATE на пользователя"""
+    counts = Counter(panorama.user_id for panorama in panoramas)
+    if not counts:
+        return
+    
+    for user_id, count in counts.items():
+        _adjust_user_rollup(user_id, -count, 0)
+    _adjust_totals({'panoramas': -sum(counts.values())})
+
+def count_new_tour(user_id):
+    _adjust_totals({'tours': 1})
+    _adjust_user_rollup(int(user_id), 0, 1)
+
+def count_removed_tour(user_id):
+    _adjust_totals({'tours': -1})
+    _adjust_user_rollup(int(user_id), 0, -1)
+
+class StatsRollups:
+    """Агрегаты статистики в фоне: счетчики меняются вместе с данными, текущий день пересчитывается
+    часто, а полный пересчет (сверка) выполняется редко"""
+    
+    def __init__(self, interval, reconcile_interval):
+        self.interval = interval
+        self.reconcile_interval = reconcile_interval
+        self.last_refreshed_at = None
+        self.last_duration = None
+        self.last_reconciled_at = None
+        self.last_drift = None
+        self._last_reconcile = None  # time.monotonic() последней сверки
+        self._lock = threading.Lock()
+        self._thread = None
+    
+    def start(self):
+        """Запуск фонового потока (повторный вызов ничего не делает)"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='stats-rollups', daemon=True)
+                self._thread.start()
+    
+    def refresh(self):
+        """Пересчет дневных агрегатов текущего дня"""
+        with self._lock:
+            started = time.monotonic()
+            with app.app_context():
+                try:
+                    refresh_daily_rollups()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Ошибка пересчета статистики: {e}")
+                    return False
+            
+            self.last_refreshed_at = datetime.utcnow()
+            self.last_duration = time.monotonic() - started
+            return True
+    
+    def reconcile(self):
+        """Полный пересчет всех агрегатов, исправляющий расхождения инкрементальных счетчиков"""
+        with self._lock:
+            started = time.monotonic()
+            with app.app_context():
+                try:
+                    since = datetime.utcnow().date() - timedelta(days=app.config['STATS_ROLLUP_BACKFILL_DAYS'])
+                    refresh_daily_rollups(since)
+                    drift = refresh_totals()
+                    refresh_user_rollups()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Ошибка сверки статистики: {e}")
+                    return None
+            
+            if drift:
+                print(f"Расхождение счетчиков статистики: {drift}")
+            
+            self.last_refreshed_at = self.last_reconciled_at = datetime.utcnow()
+            self.last_duration = time.monotonic() - started
+            self.last_drift = drift
+            self._last_reconcile = time.monotonic()
+            return drift
+    
+    def ensure_fresh(self):
+        """Синхронный пересчет, если агрегаты еще ни разу не считались"""
+        if not StatsTotal.query.first():
+            self.reconcile()
+    
+    def _run(self):
+        while True:
+            if self._last_reconcile is None or time.monotonic() - self._last_reconcile >= self.reconcile_interval:
+                self.reconcile()
+            else:
+                self.refresh()
+            time.sleep(self.interval)
+
+stats_rollups = StatsRollups(
+    interval=app.config['STATS_ROLLUP_INTERVAL'],
+    reconcile_interval=app.config['STATS_RECONCILE_INTERVAL']
+)
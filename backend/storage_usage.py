@@ -0,0 +1,163 @@
+import os
+import time
+import threading
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import func
+from config import app, db
+from models import Panorama, Blob, StorageUsage
+
+# Строка storage_usage с общим счетчиком по всем пользователям
+GLOBAL_USAGE_ID = 0
+
+def _adjust(user_id, delta_bytes, delta_count):
+    """Атомарное изменение счетчика; строка создается при первом изменении"""
+    updated = StorageUsage.query.filter_by(user_id=user_id).update({
+        StorageUsage.bytes_used: StorageUsage.bytes_used + delta_bytes,
+        StorageUsage.panorama_count: StorageUsage.panorama_count + delta_count,
+        StorageUsage.updated_at: datetime.utcnow()
+    }, synchronize_session=False)
+    
+    if not updated:
+        db.session.add(StorageUsage(
+            user_id=user_id,
+            bytes_used=delta_bytes,
+            panorama_count=delta_count,
+            updated_at=datetime.utcnow()
+        ))
+        db.session.flush()
+
+def add_storage_usage(user_id, file_size):
+    """Учет новой панорамы (в той же транзакции, что и ее создание)"""
+    _adjust(int(user_id), file_size, 1)
+    _adjust(GLOBAL_USAGE_ID, file_size, 1)
+
+def remove_storage_usage(panoramas):
+    """Учет удаляемых панорам (объекты или строки с user_id и file_size), по одному UPDATE на пользователя"""
+    sizes = Counter()
+    counts = Counter()
+    for panorama in panoramas:
+        sizes[panorama.user_id] += panorama.file_size
+        counts[panorama.user_id] += 1
+    
+    if not counts:
+        return
+    
+    for user_id, count in counts.items():
+        _adjust(user_id, -sizes[user_id], -count)
+    _adjust(GLOBAL_USAGE_ID, -sum(sizes.values()), -sum(counts.values()))
+
+def get_storage_usage(user_id=GLOBAL_USAGE_ID):
+    """Текущее значение счетчика (байты, число панорам)"""
+    usage = StorageUsage.query.get(user_id)
+    if not usage:
+        return {'bytes_used': 0, 'panorama_count': 0, 'updated_at': None}
+    return usage.to_dict()
+
+def scan_folder_size(folder):
+    """Размер всех файлов в папке (медленно - только для фоновой сверки)"""
+    total_size = 0
+    for dirpath, dirnames, filenames in os.walk(folder):
+        for filename in filenames:
+            try:
+                total_size += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                pass  # Файл удален во время обхода
+    return total_size
+
+def reconcile_storage_usage():
+    """Пересчет счетчиков из таблицы панорам, возвращает найденное расхождение"""
+    actual = {
+        row.user_id: (row.bytes_used, row.panorama_count)
+        for row in db.session.query(
+            Panorama.user_id,
+            func.sum(Panorama.file_size).label('bytes_used'),
+            func.count(Panorama.id).label('panorama_count')
+        ).group_by(Panorama.user_id)
+    }
+    actual[GLOBAL_USAGE_ID] = (
+        sum(bytes_used for bytes_used, _ in actual.values()),
+        sum(count for _, count in actual.values())
+    )
+    counted = {
+        usage.user_id: (usage.bytes_used, usage.panorama_count)
+        for usage in StorageUsage.query.all()
+    }
+    
+    drift = {}
+    for user_id in set(actual) | set(counted):
+        expected = actual.get(user_id, (0, 0))
+        found = counted.get(user_id, (0, 0))
+        if expected != found:
+            drift[user_id] = {
+                'bytes': found[0] - expected[0],
+                'panoramas': found[1] - expected[1]
+            }
+    
+    if drift:
+        now = datetime.utcnow()
+        StorageUsage.query.delete(synchronize_session=False)
+        db.session.add_all([
+            StorageUsage(user_id=user_id, bytes_used=bytes_used, panorama_count=count, updated_at=now)
+            for user_id, (bytes_used, count) in actual.items()
+        ])
+    db.session.commit()
+    
+    return {
+        'users_with_drift': len([user_id for user_id in drift if user_id != GLOBAL_USAGE_ID]),
+        'drift_bytes': drift.get(GLOBAL_USAGE_ID, {}).get('bytes', 0),
+        'drift_panoramas': drift.get(GLOBAL_USAGE_ID, {}).get('panoramas', 0)
+    }
+
+class StorageReconciler:
+    """Периодическая сверка счетчиков места с БД и диском в фоне"""
+    
+    def __init__(self, interval):
+        self.interval = interval
+        self.last_report = None
+        self._lock = threading.Lock()
+        self._thread = None
+    
+    def start(self):
+        """Запуск фонового потока (повторный вызов ничего не делает)"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='storage-reconciler', daemon=True)
+                self._thread.start()
+    
+    def reconcile(self):
+        with self._lock:
+            started = time.monotonic()
+            with app.app_context():
+                try:
+                    report = reconcile_storage_usage()
+                    # Уникальное содержимое хранилища (дубликаты файлов учтены в счетчиках, но на диске лежат один раз)
+                    report['blob_bytes'] = db.session.query(func.coalesce(func.sum(Blob.size), 0)).scalar()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Ошибка сверки места на диске: {e}")
+                    return None
+                
+                report['disk_bytes'] = scan_folder_size(app.config['UPLOAD_FOLDER'])
+            
+            report['reconciled_at'] = datetime.utcnow().isoformat()
+            report['duration'] = time.monotonic() - started
+            if report['users_with_drift'] or report['drift_bytes']:
+                print(f"Расхождение счетчиков места: {report['drift_bytes']} байт, пользователей: {report['users_with_drift']}")
+            
+            self.last_report = report
+            return report
+    
+    def stats(self):
+        return {
+            'running': self._thread is not None,
+            'interval': self.interval,
+            'last_report': self.last_report
+        }
+    
+    def _run(self):
+        while True:
+            self.reconcile()
+            time.sleep(self.interval)
+
+storage_reconciler = StorageReconciler(app.config['STORAGE_RECONCILE_INTERVAL'])
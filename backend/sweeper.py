@@ -0,0 +1,105 @@
+import time
+import threading
+from datetime import datetime
+from config import app, db
+from utils import cleanup_expired_panoramas, cleanup_old_sessions, cleanup_old_activity, cleanup_stale_uploads
+from token_revocation import cleanup_revoked_tokens
+from jobs import resume_unfinished_jobs
+from blob_store import cleanup_blob_tombstones
+from thumbnails import cleanup_thumbnails
+
+class Sweeper:
+    """Фоновая периодическая очистка истекшего контента со статистикой по удаленному"""
+    
+    # Задачи, которые возобновляют записи, а не удаляют их (считаются отдельно от удаленных)
+    RESUMING_TASKS = {'stale_jobs'}
+    
+    def __init__(self, interval, batch_size):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.tasks = [
+            ('expired_panoramas', cleanup_expired_panoramas),
+            ('old_sessions', cleanup_old_sessions),
+            ('old_activity', cleanup_old_activity),
+            ('stale_uploads', cleanup_stale_uploads),
+            ('revoked_tokens', cleanup_revoked_tokens),
+            ('blob_tombstones', cleanup_blob_tombstones),  # Файлы, оставшиеся в корзине после падения процесса
+            ('thumbnails', cleanup_thumbnails),  # Миниатюры сверх общего лимита кэша на диске
+            ('stale_jobs', resume_unfinished_jobs)  # Задачи процессов, завершившихся во время обработки
+        ]
+        self._metrics = {
+            name: {f'{self._outcome(name)}_total': 0, f'{self._outcome(name)}_last': 0, 'errors': 0, 'last_error': None}
+            for name, _ in self.tasks
+        }
+        self._runs = 0
+        self._last_run_at = None
+        self._last_duration = None
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._thread = None
+    
+    def start(self):
+        """Запуск фонового потока (повторный вызов ничего не делает)"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='sweeper', daemon=True)
+                self._thread.start()
+    
+    def _outcome(self, name):
+        return 'resumed' if name in self.RESUMING_TASKS else 'removed'
+    
+    def run_once(self):
+        """Один проход всех задач очистки, возвращает число удаленных и возобновленных записей по задачам"""
+        with self._run_lock:
+            started = time.monotonic()
+            result = {'removed': {}, 'resumed': {}}
+            
+            with app.app_context():
+                for name, task in self.tasks:
+                    try:
+                        count = task(self.batch_size)
+                        error = None
+                    except Exception as e:
+                        db.session.rollback()
+                        print(f"Ошибка очистки ({name}): {e}")
+                        count = 0
+                        error = str(e)
+                    
+                    outcome = self._outcome(name)
+                    result[outcome][name] = count
+                    with self._lock:
+                        metrics = self._metrics[name]
+                        metrics[f'{outcome}_last'] = count
+                        metrics[f'{outcome}_total'] += count
+                        if error:
+                            metrics['errors'] += 1
+                            metrics['last_error'] = error
+            
+            with self._lock:
+                self._runs += 1
+                self._last_run_at = datetime.utcnow()
+                self._last_duration = time.monotonic() - started
+            
+            return result
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'running': self._thread is not None,
+                'interval': self.interval,
+                'batch_size': self.batch_size,
+                'runs': self._runs,
+                'last_run_at': self._last_run_at.isoformat() if self._last_run_at else None,
+                'last_duration': self._last_duration,
+                'tasks': {name: dict(metrics) for name, metrics in self._metrics.items()}
+            }
+    
+    def _run(self):
+        while True:
+            self.run_once()
+            time.sleep(self.interval)
+
+sweeper = Sweeper(
+    interval=app.config['SWEEPER_INTERVAL'],
+    batch_size=app.config['SWEEPER_BATCH_SIZE']
+)
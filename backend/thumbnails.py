@@ -0,0 +1,93 @@
+import os
+import glob
+import time
+import threading
+from config import app
+from image_processing import get_thumbnail_path, render_thumbnail
+
+class ThumbnailCache:
+    """Миниатюры на диске с вытеснением давно не использованных (LRU) при превышении лимита.
+    Время использования хранится в atime файла, поэтому лимит общий для всех процессов сервера"""
+    
+    # Секунд, в течение которых повторные обращения к миниатюре не обновляют atime
+    TOUCH_INTERVAL = 60
+    
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._last_sweep = {'files': 0, 'total_bytes': 0, 'removed': 0}
+        self._lock = threading.Lock()
+    
+    def touch(self, path):
+        """Отметка использования миниатюры, False если файла нет"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        
+        # Меняется только atime: mtime участвует в ETag и Last-Modified ответа
+        now = time.time()
+        if stat.st_atime < now - self.TOUCH_INTERVAL:
+            try:
+                os.utime(path, (now, stat.st_mtime))
+            except OSError:
+                pass
+        return True
+    
+    def sweep(self, batch_size):
+        """Удаление давно не использованных миниатюр сверх лимита, не больше batch_size за проход"""
+        pattern = os.path.join(app.config['DERIVATIVES_FOLDER'], '*', 'thumbs', '*.jpg')
+        files = []
+        total_bytes = 0
+        for path in glob.glob(pattern):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_atime, path, stat.st_size))
+            total_bytes += stat.st_size
+        
+        removed = 0
+        files.sort()
+        for _, path, size in files:
+            if total_bytes <= self.max_bytes or removed >= batch_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_bytes -= size
+            removed += 1
+        
+        with self._lock:
+            self._last_sweep = {'files': len(files) - removed, 'total_bytes': total_bytes, 'removed': removed}
+        return removed
+    
+    def stats(self):
+        with self._lock:
+            return dict(self._last_sweep, max_bytes=self.max_bytes)
+
+thumbnail_cache = ThumbnailCache(app.config['THUMBNAIL_CACHE_MAX_BYTES'])
+
+def cleanup_thumbnails(batch_size=None):
+    """Вытеснение миниатюр сверх THUMBNAIL_CACHE_MAX_BYTES (задача фоновой очистки)"""
+    return thumbnail_cache.sweep(batch_size or app.config['SWEEPER_BATCH_SIZE'])
+
+def normalize_thumbnail_width(width):
+    """Приведение запрошенной ширины к ближайшей допустимой (ограничивает число вариантов в кэше)"""
+    widths = app.config['THUMBNAIL_WIDTHS']
+    if not width:
+        return widths[1]
+    for allowed in widths:
+        if width <= allowed:
+            return allowed
+    return widths[-1]
+
+def get_panorama_thumbnail(panorama_id, file_path, width):
+    """Путь к миниатюре панорамы, при отсутствии в кэше она генерируется"""
+    width = normalize_thumbnail_width(width)
+    thumbnail_path = get_thumbnail_path(panorama_id, width)
+    
+    if not thumbnail_cache.touch(thumbnail_path):
+        render_thumbnail(file_path, thumbnail_path, width, quality=app.config['TILE_QUALITY'])
+    
+    return thumbnail_path
@@ -0,0 +1,123 @@
+import time
+import threading
+from datetime import datetime
+from config import app, db
+from models import RevokedToken
+
+class DatabaseRevocationBackend:
+    """Таблица revoked_tokens с подмножеством интерфейса Redis (set с ex, exists), которым пользуется хранилище"""
+    
+    def set(self, name, value, ex=None):
+        expires_at = datetime.utcfromtimestamp(time.time() + ex) if ex else datetime.max
+        token = RevokedToken.query.get(name)
+        if token:
+            token.expires_at = expires_at
+        else:
+            db.session.add(RevokedToken(jti=name, expires_at=expires_at))
+        db.session.commit()
+        return True
+    
+    def exists(self, *names):
+        return RevokedToken.query.filter(
+            RevokedToken.jti.in_(names),
+            RevokedToken.expires_at > datetime.utcnow()
+        ).count()
+    
+    def prune(self, batch_size):
+        """Удаление записей об уже истекших токенах"""
+        from utils import _delete_in_batches
+        return _delete_in_batches(
+            RevokedToken,
+            RevokedToken.expires_at <= datetime.utcnow(),
+            batch_size,
+            key=RevokedToken.jti
+        )
+
+def create_revocation_backend():
+    """Redis, если задан TOKEN_REVOCATION_REDIS_URL, иначе таблица в основной БД"""
+    redis_url = app.config.get('TOKEN_REVOCATION_REDIS_URL')
+    if not redis_url:
+        return DatabaseRevocationBackend()
+    
+    try:
+        import redis
+    except ImportError:
+        raise RuntimeError('Для TOKEN_REVOCATION_REDIS_URL нужен пакет redis (pip install redis)')
+    return redis.Redis.from_url(redis_url)
+
+class TokenRevocationStore:
+    """Отозванные JWT: общее хранилище (БД или Redis) и кэш в памяти процесса"""
+    
+    # Префикс ключей в общем хранилище (в Redis ключи лежат рядом с чужими)
+    KEY_PREFIX = 'revoked-token:'
+    
+    def __init__(self, backend, cache_ttl, max_entries=100000):
+        self.backend = backend
+        self.cache_ttl = cache_ttl
+        self.max_entries = max_entries
+        self._revoked = {}  # jti -> момент, до которого токен точно считается отозванным
+        self._not_revoked = {}  # jti -> момент, до которого можно не спрашивать хранилище
+        self._lock = threading.Lock()
+    
+    def _key(self, jti):
+        return jti if isinstance(self.backend, DatabaseRevocationBackend) else f"{self.KEY_PREFIX}{jti}"
+    
+    def revoke(self, jti, expires_at):
+        """Отзыв токена до его истечения (expires_at в UTC)"""
+        ttl = max(1, int((expires_at - datetime.utcnow()).total_seconds()) + 1)
+        self.backend.set(self._key(jti), 1, ex=ttl)
+        
+        with self._lock:
+            self._not_revoked.pop(jti, None)
+            self._revoked[jti] = time.monotonic() + ttl
+    
+    def is_revoked(self, jti):
+        now = time.monotonic()
+        with self._lock:
+            if self._revoked.get(jti, 0) > now:
+                return True
+            if self._not_revoked.get(jti, 0) > now:
+                return False
+        
+        # Токен мог быть отозван другим процессом
+        revoked = bool(self.backend.exists(self._key(jti)))
+        
+        with self._lock:
+            self._trim(now)
+            if revoked:
+                self._revoked[jti] = now + self.cache_ttl
+            elif self.cache_ttl:
+                self._not_revoked[jti] = now + self.cache_ttl
+        return revoked
+    
+    def prune(self, batch_size):
+        """Удаление истекших записей (Redis удаляет их сам по ex)"""
+        with self._lock:
+            self._trim(time.monotonic())
+        
+        if isinstance(self.backend, DatabaseRevocationBackend):
+            return self.backend.prune(batch_size)
+        return 0
+    
+    def _trim(self, now):
+        for entries in (self._revoked, self._not_revoked):
+            if len(entries) >= self.max_entries:
+                for jti in [jti for jti, until in entries.items() if until <= now]:
+                    del entries[jti]
+                if len(entries) >= self.max_entries:
+                    entries.clear()
+
+token_revocation_store = TokenRevocationStore(
+    backend=create_revocation_backend(),
+    cache_ttl=app.config['TOKEN_REVOCATION_CACHE_TTL']
+)
+
+def revoke_token(jti, expires_at):
+    token_revocation_store.revoke(jti, expires_at)
+
+def is_token_revoked(jti):
+    return token_revocation_store.is_revoked(jti)
+
+def cleanup_revoked_tokens(batch_size=None):
+    """Очистка записей об отозванных токенах, срок которых уже истек"""
+    return token_revocation_store.prune(batch_size or app.config['SWEEPER_BATCH_SIZE'])
@@ -0,0 +1,53 @@
+from sqlalchemy.orm import joinedload, selectinload
+from models import Tour, TourPanorama, Hotspot
+
+def load_tour(tour_id):
+    """Загрузка тура вместе с автором и панорамами (фиксированное число запросов независимо от размера тура)"""
+    return Tour.query.options(
+        joinedload(Tour.creator),
+        selectinload(Tour.tour_panoramas).joinedload(TourPanorama.panorama)
+    ).filter_by(id=tour_id).first()
+
+def load_tour_hotspots(panorama_ids):
+    """Hotspots между панорамами тура одним запросом, сгруппированные по исходной панораме"""
+    hotspots_by_panorama = {}
+    if not panorama_ids:
+        return hotspots_by_panorama
+    
+    hotspots = Hotspot.query.filter(
+        Hotspot.from_panorama_id.in_(panorama_ids),
+        Hotspot.to_panorama_id.in_(panorama_ids)
+    ).order_by(Hotspot.id).all()
+    
+    for hotspot in hotspots:
+        hotspots_by_panorama.setdefault(hotspot.from_panorama_id, []).append(hotspot.to_dict())
+    
+    return hotspots_by_panorama
+
+def build_tour_data(tour):
+    """Сборка JSON тура с панорамами и hotspots из загруженного через load_tour тура"""
+    tour_panorama_ids = {tp.panorama_id for tp in tour.tour_panoramas}
+    hotspots_by_panorama = load_tour_hotspots(tour_panorama_ids)
+    
+    tour_panoramas = []
+    for tp in tour.tour_panoramas:
+        panorama = tp.panorama
+        if not panorama or panorama.is_expired():
+            continue
+        
+        panorama_data = panorama.to_dict()
+        # Счетчик просмотров меняется при каждом просмотре, а манифест тура живет до изменения тура
+        panorama_data.pop('view_count', None)
+        panorama_data['tour_position'] = {
+            'x': tp.position_x,
+            'y': tp.position_y,
+            'z': tp.position_z,
+            'order_index': tp.order_index
+        }
+        panorama_data['hotspots'] = hotspots_by_panorama.get(panorama.id, [])
+        tour_panoramas.append(panorama_data)
+    
+    tour_data = tour.to_dict(tour_panoramas=tour.tour_panoramas)
+    tour_data['panoramas'] = tour_panoramas
+    tour_data['owner'] = tour.creator.username if tour.creator else 'Unknown'
+    return tour_data
@@ -0,0 +1,184 @@
+import os
+import json
+import uuid
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from config import app, db
+from models import Tour, TourPanorama
+from tour_assembly import load_tour, build_tour_data
+from read_replica import read_from_primary
+
+def get_manifest_path(tour_id):
+    """Путь к скомпилированному манифесту тура на диске"""
+    return os.path.join(app.config['TOUR_MANIFEST_FOLDER'], f"{tour_id}.json")
+
+def get_generation_path(tour_id):
+    """Метка инвалидации тура на диске (общая для всех процессов сервера)"""
+    return os.path.join(app.config['TOUR_MANIFEST_FOLDER'], f"{tour_id}.gen")
+
+def read_generation(tour_id):
+    """Текущая метка инвалидации тура; пустая строка, если тур еще не изменялся"""
+    try:
+        with open(get_generation_path(tour_id), 'r', encoding='utf-8') as f:
+            return f.read()
+    except OSError:
+        return ''
+
+def compile_tour_manifest(tour):
+    """Сборка манифеста тура: готовый JSON ответа и данные для проверки доступа без обращения к БД"""
+    tour_data = build_tour_data(tour)
+    body = json.dumps({'tour': tour_data}, ensure_ascii=False)
+    
+    # Манифест перестает быть действительным, когда истекает одна из его панорам
+    expirations = [
+        tp.panorama.expires_at for tp in tour.tour_panoramas
+        if tp.panorama and not tp.panorama.is_permanent and tp.panorama.expires_at
+    ]
+    valid_until = min(expirations) if expirations else None
+    
+    return {
+        'tour_id': tour.id,
+        'version': f"{tour.id}-{tour.updated_at.isoformat()}",
+        'etag': hashlib.sha256(body.encode('utf-8')).hexdigest()[:32],
+        'user_id': tour.user_id,
+        'is_public': tour.is_public,
+        'embed_code': tour.embed_code,
+        'valid_until': valid_until.isoformat() if valid_until else None,
+        'body': body
+    }
+
+class TourManifestCache:
+    """Манифесты туров: LRU в памяти поверх файлов на диске (общих для всех процессов сервера)"""
+    
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # id тура -> (mtime файла, манифест), от давно использованных к недавним
+        self._embed_codes = {}  # embed код -> id тура
+        self._lock = threading.Lock()
+    
+    def get(self, tour_id):
+        """Действительный манифест тура или None"""
+        path = get_manifest_path(tour_id)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            with self._lock:
+                self._entries.pop(tour_id, None)
+            return None
+        
+        with self._lock:
+            entry = self._entries.get(tour_id)
+            if entry and entry[0] == mtime:
+                self._entries.move_to_end(tour_id)
+                manifest = entry[1]
+            else:
+                manifest = None
+        
+        if manifest is None:
+            # Файл записан или обновлен другим процессом
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError):
+                return None
+            self._remember(mtime, manifest)
+        
+        if manifest['valid_until'] and datetime.fromisoformat(manifest['valid_until']) <= datetime.utcnow():
+            return None
+        # Манифест, собранный до изменения тура другим процессом, не отдается
+        if manifest.get('generation', '') != read_generation(tour_id):
+            return None
+        return manifest
+    
+    def generation(self, tour_id):
+        """Текущая метка инвалидации тура (запоминается перед чтением тура из БД)"""
+        return read_generation(tour_id)
+    
+    def put(self, manifest, generation):
+        """Сохранение манифеста, если тур не изменился (ни в одном процессе), пока манифест собирался"""
+        tour_id = manifest['tour_id']
+        manifest['generation'] = generation
+        if read_generation(tour_id) != generation:
+            return
+        
+        os.makedirs(app.config['TOUR_MANIFEST_FOLDER'], exist_ok=True)
+        path = get_manifest_path(tour_id)
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+        
+        self._remember(os.stat(path).st_mtime_ns, manifest)
+    
+    def find_tour_id(self, embed_code):
+        with self._lock:
+            return self._embed_codes.get(embed_code)
+    
+    def invalidate(self, tour_id):
+        # Новая метка на диске: манифесты, собранные раньше в любом процессе, не запишутся и не отдадутся
+        os.makedirs(app.config['TOUR_MANIFEST_FOLDER'], exist_ok=True)
+        generation_path = get_generation_path(tour_id)
+        temp_path = f"{generation_path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(uuid.uuid4().hex)
+        os.replace(temp_path, generation_path)
+        
+        with self._lock:
+            entry = self._entries.pop(tour_id, None)
+            if entry:
+                self._embed_codes.pop(entry[1]['embed_code'], None)
+        
+        try:
+            os.remove(get_manifest_path(tour_id))
+        except OSError:
+            pass
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries
+            }
+    
+    def _remember(self, mtime, manifest):
+        with self._lock:
+            self._entries[manifest['tour_id']] = (mtime, manifest)
+            self._entries.move_to_end(manifest['tour_id'])
+            self._embed_codes[manifest['embed_code']] = manifest['tour_id']
+            
+            while len(self._entries) > self.max_entries:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._embed_codes.pop(evicted['embed_code'], None)
+
+tour_manifest_cache = TourManifestCache(app.config['TOUR_MANIFEST_CACHE_SIZE'])
+
+def get_tour_manifest(tour_id):
+    """Манифест тура из кэша; при промахе тур загружается из БД и компилируется"""
+    manifest = tour_manifest_cache.get(tour_id)
+    if manifest:
+        return manifest
+    
+    generation = tour_manifest_cache.generation(tour_id)
+    # Манифест живет в кэше до следующего изменения тура: собираем его только с основной базы
+    with read_from_primary():
+        tour = load_tour(tour_id)
+    if not tour:
+        return None
+    
+    manifest = compile_tour_manifest(tour)
+    tour_manifest_cache.put(manifest, generation)
+    return manifest
+
+def get_panorama_tour_ids(panorama_id):
+    """Туры, в которые входит панорама (их манифесты устаревают при изменении панорамы)"""
+    return [row.tour_id for row in db.session.query(TourPanorama.tour_id).filter_by(panorama_id=panorama_id)]
+
+def get_user_tour_ids(user_id):
+    return [row.id for row in db.session.query(Tour.id).filter_by(user_id=user_id)]
+
+def invalidate_tour_manifests(tour_ids):
+    """Сброс манифестов туров (вызывается после коммита изменений)"""
+    for tour_id in set(tour_ids):
+        tour_manifest_cache.invalidate(tour_id)
@@ -1,20 +1,29 @@
 import os
 from flask import request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
 from werkzeug.utils import secure_filename
-from PIL import Image
-import uuid
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime, timedelta
 from config import app, db, allowed_file
-from models import User, Tour, TourPanorama, Panorama, Hotspot, UserSession
+from models import Tour, TourPanorama, Panorama, Hotspot
+from current_user import get_current_user_id, get_current_user_state
+from jobs import enqueue_panorama_upload
+from tour_manifest import get_tour_manifest, tour_manifest_cache, get_panorama_tour_ids, invalidate_tour_manifests
+from activity_log import record_activity
+from blob_store import store_blob_stream, discard_orphan_blob
+from search_index import apply_search
+from user_stats import invalidate_user_stats
+from stats_rollups import count_new_tour, count_removed_tour
+from pagination import paginate_listing, desc_key, asc_key, InvalidCursor
+from read_replica import use_read_replica
 
 @app.route('/api/tours', methods=['POST'])
 @jwt_required()
 def create_tour():
     """Создание нового виртуального тура"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(int(user_id))
+        user_id = get_current_user_id()
+        user = get_current_user_state()
         
         if not user:
             return jsonify({'error': 'Пользователь не найден'}), 404
@@ -40,7 +49,9 @@ def create_tour():
         tour.is_public = is_public
         
         db.session.add(tour)
+        count_new_tour(user_id)
         db.session.commit()
+        invalidate_user_stats(tour.user_id)
         
         return jsonify({
             'message': 'Тур создан успешно',
@@ -53,99 +64,44 @@ def create_tour():
         return jsonify({'error': f'Ошибка создания тура: {str(e)}'}), 500
 
 @app.route('/api/tours/<int:tour_id>', methods=['GET'])
+@use_read_replica
 def get_tour(tour_id):
     """Получение информации о туре"""
     try:
-        tour = Tour.query.get(tour_id)
+        # Скомпилированный манифест из кэша; БД читается только при промахе
+        manifest = get_tour_manifest(tour_id)
         
-        if not tour:
+        if not manifest:
             return jsonify({'error': 'Тур не найден'}), 404
         
-        # Отладочная информация
-        print(f"Tour found: id={tour.id}, title={tour.title}, panoramas_count={len(tour.tour_panoramas)}")
-        
         user_id = None
-        if not tour.is_public:
+        if not manifest['is_public']:
             # Проверяем права доступа
             try:
-                from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+                from flask_jwt_extended import verify_jwt_in_request
                 verify_jwt_in_request(optional=True)
-                user_id = get_jwt_identity()
-                if not user_id or user_id != tour.user_id:
+                user_id = get_current_user_id()
+                if not user_id or user_id != manifest['user_id']:
                     return jsonify({'error': 'Тур недоступен'}), 403
             except:
                 return jsonify({'error': 'Тур недоступен'}), 403
         else:
             # Для публичных туров тоже проверяем авторизацию
             try:
-                from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+                from flask_jwt_extended import verify_jwt_in_request
                 verify_jwt_in_request(optional=True)
-                user_id = get_jwt_identity()
+                user_id = get_current_user_id()
             except:
                 pass
         
-        # Получаем панорамы тура с их hotspots
-        tour_panoramas = []
-        for tp in tour.tour_panoramas:
-            # Добавляем проверку на существование отношения
-            if hasattr(tp, 'panorama') and tp.panorama:
-                panorama = tp.panorama
-                if not panorama.is_expired():
-                    panorama_data = panorama.to_dict()
-                    panorama_data['tour_position'] = {
-                        'x': tp.position_x,
-                        'y': tp.position_y,
-                        'z': tp.position_z,
-                        'order_index': tp.order_index
-                    }
-                    
-                    # Получаем hotspots из этой панорамы
-                    hotspots = []
-                    for hotspot in panorama.hotspots_from:
-                        # Проверяем, что целевая панорама тоже в этом туре
-                        target_in_tour = any(
-                            tp2.panorama_id == hotspot.to_panorama_id 
-                            for tp2 in tour.tour_panoramas
-                        )
-                        if target_in_tour:
-                            hotspots.append(hotspot.to_dict())
-                    
-                    panorama_data['hotspots'] = hotspots
-                    tour_panoramas.append(panorama_data)
-                    print(f"Added panorama to tour: id={panorama.id}, title={panorama.title}, hotspots_count={len(hotspots)}")
-                    if hotspots:
-                        print(f"Hotspots data: {hotspots}")
-                else:
-                    print(f"Panorama not added to tour: id={tp.panorama_id}, panorama={panorama}, expired={panorama.is_expired() if panorama else True}")
-            else:
-                print(f"TourPanorama record has no panorama: id={tp.id}, panorama_id={tp.panorama_id}")
-        
-        tour_data = tour.to_dict()
-        tour_data['panoramas'] = tour_panoramas
-        tour_data['owner'] = tour.creator.username if tour.creator else 'Unknown'
-        
-        # Отладочная информация
-        print(f"Tour data being returned: {tour_data}")
-        
-        # Создаем сессию для отслеживания посещений
+        # Отмечаем просмотр в журнале активности
         if user_id:
-            from models import UserSession
-            from datetime import timedelta
-            # Создание сессии для отслеживания активности
-            session = UserSession(
-                user_id=int(user_id),
-                token=f"tour_{tour_id}_{datetime.utcnow().timestamp()}",
-                expires_at=datetime.utcnow() + timedelta(hours=1),
-                ip_address=request.remote_addr,
-                user_agent=request.headers.get('User-Agent')
-            )
-            
-            db.session.add(session)
-            db.session.commit()
-        
-        return jsonify({
-            'tour': tour_data
-        }), 200
+            record_activity(user_id, 'tour_view', tour_id)
+                    
+        # Готовый JSON отдается без повторной сериализации
+        response = app.response_class(manifest['body'], mimetype='application/json')
+        response.set_etag(manifest['etag'])
+        return response.make_conditional(request)
         
     except Exception as e:
         db.session.rollback()
@@ -159,8 +115,8 @@ def get_tour(tour_id):
 def update_tour(tour_id):
     """Обновление информации о туре"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(int(user_id))
+        user_id = get_current_user_id()
+        user = get_current_user_state()
         tour = Tour.query.get(tour_id)
         
         if not tour:
@@ -189,6 +145,7 @@ def update_tour(tour_id):
         
         tour.updated_at = datetime.utcnow()
         db.session.commit()
+        invalidate_tour_manifests([tour_id])
         
         return jsonify({
             'message': 'Тур обновлен',
@@ -204,8 +161,8 @@ def update_tour(tour_id):
 def delete_tour(tour_id):
     """Удаление тура"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(int(user_id))
+        user_id = get_current_user_id()
+        user = get_current_user_state()
         tour = Tour.query.get(tour_id)
         
         if not tour:
@@ -229,8 +186,11 @@ def delete_tour(tour_id):
             ).delete(synchronize_session=False)
         
         # Удаляем тур (cascade удалит связанные записи)
+        count_removed_tour(tour.user_id)
         db.session.delete(tour)
         db.session.commit()
+        invalidate_tour_manifests([tour_id])
+        invalidate_user_stats(tour.user_id)
         
         return jsonify({'message': 'Тур удален'}), 200
         
@@ -246,14 +206,14 @@ def delete_tour(tour_id):
 def add_panorama_to_tour(tour_id):
     """Добавление панорамы в тур"""
     try:
-        user_id = get_jwt_identity()
+        user_id = get_current_user_id()
         tour = Tour.query.get(tour_id)
         
         if not tour:
             return jsonify({'error': 'Тур не найден'}), 404
         
         # Check if user is the owner of the tour or an admin
-        user = User.query.get(int(user_id))
+        user = get_current_user_state()
         if tour.user_id != user_id and not (user and user.is_admin()):
             return jsonify({'error': 'Недостаточно прав'}), 403
         
@@ -306,7 +266,13 @@ def add_panorama_to_tour(tour_id):
         
         db.session.add(tour_panorama)
         tour.updated_at = datetime.utcnow()
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Параллельный запрос успел добавить ту же панораму (уникальный индекс tour_id, panorama_id)
+            db.session.rollback()
+            return jsonify({'error': 'Панорама уже добавлена в тур'}), 400
+        invalidate_tour_manifests([tour_id])
         
         print(f"Panorama added to tour successfully: tour_panorama_id={tour_panorama.id}")
         
@@ -324,8 +290,8 @@ def add_panorama_to_tour(tour_id):
 def remove_panorama_from_tour(tour_id, panorama_id):
     """Удаление панорамы из тура"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(int(user_id))
+        user_id = get_current_user_id()
+        user = get_current_user_state()
         tour = Tour.query.get(tour_id)
         
         if not tour:
@@ -343,6 +309,9 @@ def remove_panorama_from_tour(tour_id, panorama_id):
         if not tour_panorama:
             return jsonify({'error': 'Панорама не найдена в туре'}), 404
         
+        # Hotspots панорамы удаляются во всех турах, где она есть
+        affected_tour_ids = get_panorama_tour_ids(panorama_id)
+        
         # Удаляем связанные hotspots
         Hotspot.query.filter(
             db.or_(
@@ -355,6 +324,7 @@ def remove_panorama_from_tour(tour_id, panorama_id):
         db.session.delete(tour_panorama)
         tour.updated_at = datetime.utcnow()
         db.session.commit()
+        invalidate_tour_manifests(affected_tour_ids)
         
         return jsonify({'message': 'Панорама удалена из тура'}), 200
         
@@ -370,8 +340,8 @@ def remove_panorama_from_tour(tour_id, panorama_id):
 def create_hotspot(tour_id):
     """Создание hotspot'а между панорамами в туре"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(int(user_id))
+        user_id = get_current_user_id()
+        user = get_current_user_state()
         tour = Tour.query.get(tour_id)
         
         if not tour:
@@ -436,6 +406,9 @@ def create_hotspot(tour_id):
         tour.updated_at = datetime.utcnow()
         db.session.commit()
         
+        # Hotspot виден во всех турах, где есть обе панорамы
+        invalidate_tour_manifests(get_panorama_tour_ids(from_panorama_id))
+        
         return jsonify({
             'message': 'Hotspot создан',
             'hotspot': hotspot.to_dict()
@@ -450,8 +423,8 @@ def create_hotspot(tour_id):
 def delete_hotspot(hotspot_id):
     """Удаление hotspot'а"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(int(user_id))
+        user_id = get_current_user_id()
+        user = get_current_user_state()
         hotspot = Hotspot.query.get(hotspot_id)
         
         if not hotspot:
@@ -463,8 +436,11 @@ def delete_hotspot(hotspot_id):
         if from_panorama.user_id != user_id and not (user and user.is_admin()):
             return jsonify({'error': 'Недостаточно прав'}), 403
         
+        affected_tour_ids = get_panorama_tour_ids(hotspot.from_panorama_id)
+        
         db.session.delete(hotspot)
         db.session.commit()
+        invalidate_tour_manifests(affected_tour_ids)
         
         return jsonify({'message': 'Hotspot удален'}), 200
         
@@ -473,68 +449,66 @@ def delete_hotspot(hotspot_id):
         return jsonify({'error': f'Ошибка удаления hotspot: {str(e)}'}), 500
 
 @app.route('/api/tours', methods=['GET'])
+@use_read_replica
 def list_tours():
     """Получение списка публичных туров"""
     try:
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 12, type=int)
         search = request.args.get('search', '').strip()
         
         query = Tour.query.filter_by(is_public=True)
         
+        rank = None
         if search:
-            query = query.filter(
-                db.or_(
-                    Tour.title.ilike(f'%{search}%'),
-                    Tour.description.ilike(f'%{search}%')
-                )
+            query, rank = apply_search(
+                query, Tour, 'tour_search', search,
+                fallback_columns=[Tour.title, Tour.description]
             )
         
-        query = query.order_by(Tour.created_at.desc())
+        # Сначала самые релевантные (при поиске), затем новые
+        sort_keys = [desc_key(Tour.created_at), desc_key(Tour.id)]
+        if rank is not None:
+            sort_keys.insert(0, asc_key(rank))
         
-        pagination = query.paginate(
-            page=page,
-            per_page=per_page,
-            error_out=False
-        )
+        items, pagination = paginate_listing(query, sort_keys, default_per_page=12)
         
         tours = []
-        for t in pagination.items:
+        for t in items:
             tour_data = t.to_dict()
             tour_data['owner'] = t.creator.username if t.creator else 'Unknown'
             tours.append(tour_data)
         
         return jsonify({
             'tours': tours,
-            'pagination': {
-                'page': page,
-                'per_page': per_page,
-                'total': pagination.total,
-                'pages': pagination.pages,
-                'has_next': pagination.has_next,
-                'has_prev': pagination.has_prev
-            }
+            'pagination': pagination
         }), 200
         
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': f'Ошибка получения списка туров: {str(e)}'}), 500
 
 @app.route('/api/tours/embed/<embed_code>', methods=['GET'])
+@use_read_replica
 def get_tour_by_embed(embed_code):
     """Получение тура по embed коду"""
     try:
-        tour = Tour.query.filter_by(embed_code=embed_code).first()
+        # Для туров с манифестом в кэше БД не нужна
+        tour_id = tour_manifest_cache.find_tour_id(embed_code)
         
-        if not tour:
-            return jsonify({'error': 'Тур не найден'}), 404
+        if not tour_id:
+            tour = db.session.query(Tour.id).filter_by(embed_code=embed_code).first()
+            if not tour:
+                return jsonify({'error': 'Тур не найден'}), 404
+            tour_id = tour.id
         
         # Получаем данные тура через основной метод
-        return get_tour(tour.id)
+        return get_tour(tour_id)
         
     except Exception as e:
         return jsonify({'error': f'Ошибка получения тура: {str(e)}'}), 500
 
 @app.route('/api/tours/<int:tour_id>/embed', methods=['GET'])
+@use_read_replica
 def get_tour_embed_code(tour_id):
     """Получение HTML кода для встраивания тура"""
     try:
@@ -574,14 +548,14 @@ def get_tour_embed_code(tour_id):
 def upload_panorama_to_tour(tour_id):
     """Загрузка панорамы непосредственно в тур (не отображается в общей коллекции)"""
     try:
-        user_id = get_jwt_identity()
+        user_id = get_current_user_id()
         tour = Tour.query.get(tour_id)
         
         if not tour:
             return jsonify({'error': 'Тур не найден'}), 404
         
         # Check if user is the owner of the tour or an admin
-        user = User.query.get(int(user_id))
+        user = get_current_user_state()
         if tour.user_id != user_id and not (user and user.is_admin()):
             return jsonify({'error': 'Недостаточно прав'}), 403
         
@@ -609,65 +583,31 @@ def upload_panorama_to_tour(tour_id):
         if file_size > app.config['MAX_CONTENT_LENGTH']:
             return jsonify({'error': 'Файл слишком большой. Максимальный размер: 50MB'}), 400
         
-        # Генерация уникального имени файла
-        filename = secure_filename(file.filename)
-        name, ext = os.path.splitext(filename)
-        unique_filename = f"{uuid.uuid4().hex}_{name}{ext}"
-        
-        # Создание папки пользователя
-        user_folder = os.path.join(app.config['UPLOAD_FOLDER'], str(user_id))
-        os.makedirs(user_folder, exist_ok=True)
+        # Сохранение файла в хранилище по хэшу содержимого (одинаковые файлы хранятся один раз)
+        blob = store_blob_stream(file.stream, secure_filename(file.filename))
+        file_path = blob.file_path
         
-        file_path = os.path.join(user_folder, unique_filename)
-        
-        # Сохранение файла
-        file.save(file_path)
-        
-        # Проверка, что это изображение и получение размеров
-        try:
-            with Image.open(file_path) as img:
-                width, height = img.size
-        except Exception as e:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-            return jsonify({'error': 'Файл поврежден или не является изображением'}), 400
-        
-        # Создание записи в базе данных с размерами изображения
-        # Указываем, что панорама является частью тура (tour_only=True)
-        panorama = Panorama(
+        # Проверка изображения, создание записи и добавление в тур выполняются в фоне
+        # (панорама будет помечена как tour_only и не попадет в общую коллекцию)
+        job = enqueue_panorama_upload(
             user_id=user_id,
-            title=title,
-            description=description,
             file_path=file_path,
             file_size=file_size,
-            width=width,
-            height=height
-        )
-        panorama.is_public = False  # Панорамы только для тура не публичные
-        panorama.tour_only = True   # Флаг, указывающий, что панорама только для тура
-        
-        db.session.add(panorama)
-        db.session.flush()  # Получаем ID панорамы до коммита
-        
-        # Добавляем панораму в тур
-        tour_panorama = TourPanorama(
+            title=title,
+            description=description,
+            is_public=False,
             tour_id=tour_id,
-            panorama_id=panorama.id,
-            order_index=len(tour.tour_panoramas)  # Добавляем в конец
+            content_hash=blob.content_hash
         )
         
-        db.session.add(tour_panorama)
-        tour.updated_at = datetime.utcnow()
-        db.session.commit()
-        
         return jsonify({
-            'message': 'Панорама загружена и добавлена в тур',
-            'panorama': panorama.to_dict(),
-            'tour_panorama': tour_panorama.to_dict()
-        }), 201
+            'message': 'Панорама принята в обработку и будет добавлена в тур',
+            'job': job.to_dict(),
+            'status_url': f'/api/jobs/{job.id}'
+        }), 202
         
     except Exception as e:
-        if 'file_path' in locals() and os.path.exists(file_path):
-            os.remove(file_path)
         db.session.rollback()
+        if 'file_path' in locals():
+            discard_orphan_blob(file_path)
         return jsonify({'error': f'Ошибка загрузки: {str(e)}'}), 500
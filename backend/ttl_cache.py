@@ -0,0 +1,33 @@
+import time
+import threading
+
+class TTLCache:
+    """Короткоживущий кэш в памяти процесса: значение загружается заново, когда истекает его срок"""
+    
+    def __init__(self, ttl, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}  # ключ -> (момент истечения, значение)
+        self._lock = threading.Lock()
+    
+    def get(self, key, loader):
+        """Значение из кэша или результат loader() (загрузка идет без блокировки кэша)"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                return entry[1]
+        
+        value = loader()
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                # Убираем истекшие записи, а если их нет - весь кэш
+                self._entries = {cached_key: entry for cached_key, entry in self._entries.items() if entry[0] > now}
+                if len(self._entries) >= self.max_entries:
+                    self._entries.clear()
+            self._entries[key] = (now + self.ttl, value)
+        return value
+    
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
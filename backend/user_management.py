@@ -1,14 +1,18 @@
 from flask import request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
 from datetime import datetime, timedelta
 from config import app, db
-from models import User, Panorama, Tour
+from models import Panorama, Tour
+from pagination import paginate_listing, desc_key, InvalidCursor
+from user_stats import get_user_stats
+from stats_rollups import user_totals, count_user_change
+from current_user import get_current_user, get_current_user_state, invalidate_user_state
+from read_replica import use_read_replica
 
 def admin_required(f):
     """Декоратор для проверки прав администратора"""
     def decorated_function(*args, **kwargs):
-        user_id = get_jwt_identity()
-        user = User.query.get(int(user_id))
+        user = get_current_user_state()
         
         if not user or not user.is_admin():
             return jsonify({'error': 'Требуются права администратора'}), 403
@@ -23,8 +27,7 @@ def admin_required(f):
 def upgrade_subscription():
     """Покупка премиум подписки"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(int(user_id))
+        user = get_current_user()
         
         if not user:
             return jsonify({'error': 'Пользователь не найден'}), 404
@@ -42,6 +45,7 @@ def upgrade_subscription():
         # В реальном приложении здесь была бы интеграция с платежной системой
         # Пока просто обновляем подписку
         
+        before = user_totals(user)
         user.subscription_type = subscription_type
         
         # Расчет срока действия подписки
@@ -53,7 +57,9 @@ def upgrade_subscription():
             user.subscription_expires = datetime.utcnow() + timedelta(days=30 * duration_months)
         
         user.updated_at = datetime.utcnow()
+        count_user_change(before, user)
         db.session.commit()
+        invalidate_user_state(user.id)
         
         return jsonify({
             'message': 'Подписка успешно обновлена',
@@ -69,8 +75,7 @@ def upgrade_subscription():
 def subscription_status():
     """Получение статуса подписки"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(int(user_id))
+        user = get_current_user()
         
         if not user:
             return jsonify({'error': 'Пользователь не найден'}), 404
@@ -105,61 +110,31 @@ def subscription_status():
 
 @app.route('/api/users/stats', methods=['GET'])
 @jwt_required()
+@use_read_replica
 def user_stats():
     """Получение статистики пользователя"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(int(user_id))
+        user = get_current_user_state()
         
         if not user:
             return jsonify({'error': 'Пользователь не найден'}), 404
         
-        # Статистика панорам
-        panoramas = Panorama.query.filter_by(user_id=user.id).all()
-        total_views = sum(p.view_count for p in panoramas)
-        
-        # Статистика по дням (последние 7 дней)
-        daily_stats = []
-        for i in range(7):
-            date = datetime.utcnow().date() - timedelta(days=i)
-            uploads = Panorama.query.filter(
-                Panorama.user_id == user.id,
-                db.func.date(Panorama.upload_date) == date
-            ).count()
-            daily_stats.append({
-                'date': date.isoformat(),
-                'uploads': uploads
-            })
-        
-        return jsonify({
-            'panoramas': {
-                'total': len(panoramas),
-                'active': len([p for p in panoramas if not p.is_expired()]),
-                'expired': len([p for p in panoramas if p.is_expired()]),
-                'total_views': total_views
-            },
-            'tours': {
-                'total': Tour.query.filter_by(user_id=user.id).count()
-            },
-            'daily_uploads': daily_stats
-        }), 200
+        return jsonify(get_user_stats(user.id)), 200
         
     except Exception as e:
         return jsonify({'error': f'Ошибка получения статистики: {str(e)}'}), 500
 
 @app.route('/api/users/panoramas', methods=['GET'])
 @jwt_required()
+@use_read_replica
 def user_panoramas():
     """Получение списка панорам пользователя"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(int(user_id))
+        user = get_current_user_state()
         
         if not user:
             return jsonify({'error': 'Пользователь не найден'}), 404
         
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 10, type=int)
         status = request.args.get('status', 'all')  # all, active, expired
         
         # Исключаем панорамы, предназначенные только для тура
@@ -178,67 +153,50 @@ def user_panoramas():
                 Panorama.expires_at <= datetime.utcnow()
             )
         
-        query = query.order_by(Panorama.upload_date.desc())
-        
-        pagination = query.paginate(
-            page=page,
-            per_page=per_page,
-            error_out=False
+        items, pagination = paginate_listing(
+            query,
+            [desc_key(Panorama.upload_date), desc_key(Panorama.id)],
+            default_per_page=10
         )
         
-        panoramas = [p.to_dict() for p in pagination.items]
+        panoramas = [p.to_dict() for p in items]
         
         return jsonify({
             'panoramas': panoramas,
-            'pagination': {
-                'page': page,
-                'per_page': per_page,
-                'total': pagination.total,
-                'pages': pagination.pages,
-                'has_next': pagination.has_next,
-                'has_prev': pagination.has_prev
-            }
+            'pagination': pagination
         }), 200
         
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': f'Ошибка получения панорам: {str(e)}'}), 500
 
 @app.route('/api/users/tours', methods=['GET'])
 @jwt_required()
+@use_read_replica
 def user_tours():
     """Получение списка туров пользователя"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(int(user_id))
+        user = get_current_user_state()
         
         if not user:
             return jsonify({'error': 'Пользователь не найден'}), 404
         
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 10, type=int)
-        
-        query = Tour.query.filter_by(user_id=user.id).order_by(Tour.created_at.desc())
-        
-        pagination = query.paginate(
-            page=page,
-            per_page=per_page,
-            error_out=False
+        items, pagination = paginate_listing(
+            Tour.query.filter_by(user_id=user.id),
+            [desc_key(Tour.created_at), desc_key(Tour.id)],
+            default_per_page=10
         )
         
-        tours = [t.to_dict() for t in pagination.items]
+        tours = [t.to_dict() for t in items]
         
         return jsonify({
             'tours': tours,
-            'pagination': {
-                'page': page,
-                'per_page': per_page,
-                'total': pagination.total,
-                'pages': pagination.pages,
-                'has_next': pagination.has_next,
-                'has_prev': pagination.has_prev
-            }
+            'pagination': pagination
         }), 200
         
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': f'Ошибка получения туров: {str(e)}'}), 500
 
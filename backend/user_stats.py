@@ -0,0 +1,84 @@
+from datetime import datetime, date, timedelta
+from sqlalchemy import func, case
+from config import app, db
+from models import Panorama, Tour
+from ttl_cache import TTLCache
+from view_counter import view_counter
+
+# Дней в графике загрузок на дашборде
+DAILY_UPLOADS_DAYS = 7
+
+def compute_user_stats(user_id):
+    """Статистика пользователя тремя агрегирующими запросами вместо загрузки всех панорам"""
+    now = datetime.utcnow()
+    is_expired = db.and_(
+        Panorama.is_permanent == False,
+        Panorama.expires_at.isnot(None),
+        Panorama.expires_at <= now
+    )
+    totals = db.session.query(
+        func.count(Panorama.id).label('total'),
+        func.coalesce(func.sum(case((is_expired, 1), else_=0)), 0).label('expired'),
+        func.coalesce(func.sum(Panorama.view_count), 0).label('total_views')
+    ).filter(Panorama.user_id == user_id).one()
+    
+    # Просмотры из буфера view_counter, как в Panorama.to_dict (иначе сумма меньше, чем по карточкам)
+    total_views = totals.total_views
+    pending_views = view_counter.pending_counts()
+    if pending_views:
+        total_views += sum(
+            pending_views[row.id] for row in db.session.query(Panorama.id).filter(
+                Panorama.user_id == user_id,
+                Panorama.id.in_(list(pending_views))
+            )
+        )
+    
+    tour_total = db.session.query(func.count(Tour.id)).filter(Tour.user_id == user_id).scalar()
+    
+    # Загрузки по дням одним GROUP BY; дни без загрузок заполняются нулями
+    today = now.date()
+    since = datetime.combine(today - timedelta(days=DAILY_UPLOADS_DAYS - 1), datetime.min.time())
+    uploads_by_day = {
+        date.fromisoformat(str(row.day)): row.uploads
+        for row in db.session.query(
+            func.date(Panorama.upload_date).label('day'),
+            func.count(Panorama.id).label('uploads')
+        ).filter(
+            Panorama.user_id == user_id,
+            Panorama.upload_date >= since
+        ).group_by(func.date(Panorama.upload_date))
+    }
+    
+    daily_stats = []
+    for i in range(DAILY_UPLOADS_DAYS):
+        day = today - timedelta(days=i)
+        daily_stats.append({
+            'date': day.isoformat(),
+            'uploads': uploads_by_day.get(day, 0)
+        })
+    
+    return {
+        'panoramas': {
+            'total': totals.total,
+            'active': totals.total - totals.expired,
+            'expired': totals.expired,
+            'total_views': total_views
+        },
+        'tours': {
+            'total': tour_total
+        },
+        'daily_uploads': daily_stats
+    }
+
+# Дашборд запрашивает статистику при каждом открытии
+user_stats_cache = TTLCache(app.config['USER_STATS_CACHE_TTL'])
+
+def get_user_stats(user_id):
+    """Статистика пользователя (из кэша, если она посчитана недавно)"""
+    if not user_stats_cache.ttl:
+        return compute_user_stats(user_id)
+    return user_stats_cache.get(int(user_id), lambda: compute_user_stats(user_id))
+
+def invalidate_user_stats(user_id):
+    """Сброс кэша после загрузки или удаления панорамы пользователем"""
+    user_stats_cache.invalidate(int(user_id))
@@ -1,42 +1,114 @@
 import os
 from datetime import datetime, timedelta
-from config import db
+from config import app, db
 
-def cleanup_expired_panoramas():
+def _delete_in_batches(model, condition, batch_size, key=None):
+    """Удаление строк пачками DELETE ... WHERE id IN (SELECT ... LIMIT), чтобы не держать блокировку БД долго"""
+    key = key if key is not None else model.id
+    total = 0
+    while True:
+        ids = db.session.query(key).filter(condition).limit(batch_size).scalar_subquery()
+        deleted = model.query.filter(key.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        total += deleted
+        if deleted < batch_size:
+            return total
+
+def cleanup_expired_panoramas(batch_size=None):
     """Очистка истекших панорам"""
-    from models import Panorama
-    expired = Panorama.query.filter(
-        Panorama.expires_at <= datetime.utcnow(),
-        Panorama.is_permanent == False
-    ).all()
+    from models import Panorama, TourPanorama, Hotspot
+    from image_processing import remove_panorama_derivatives
+    from blob_store import release_blob
+    from tour_manifest import invalidate_tour_manifests
+    from storage_usage import remove_storage_usage
+    from stats_rollups import count_removed_panoramas
+    batch_size = batch_size or app.config['SWEEPER_BATCH_SIZE']
     
-    for panorama in expired:
-        try:
-            # Удаляем файл
-            if os.path.exists(panorama.file_path):
-                os.remove(panorama.file_path)
-            # Удаляем запись из БД
-            db.session.delete(panorama)
-        except Exception as e:
-            print(f"Ошибка удаления панорамы {panorama.id}: {e}")
+    total = 0
+    while True:
+        expired = db.session.query(Panorama.id, Panorama.user_id, Panorama.file_path, Panorama.file_size).filter(
+            Panorama.expires_at <= datetime.utcnow(),
+            Panorama.is_permanent == False
+        ).limit(batch_size).all()
     
-    db.session.commit()
-    return len(expired)
+        if not expired:
+            return total
+
+        panorama_ids = [row.id for row in expired]
+        affected_tour_ids = [
+            row.tour_id for row in db.session.query(TourPanorama.tour_id).filter(TourPanorama.panorama_id.in_(panorama_ids))
+        ]
+        
+        # Освобождаем файлы (удаляются после коммита, если на них не ссылаются другие панорамы)
+        for row in expired:
+            release_blob(row.file_path)
+        remove_storage_usage(expired)
+        count_removed_panoramas(expired)
+        
+        Hotspot.query.filter(
+            db.or_(
+                Hotspot.from_panorama_id.in_(panorama_ids),
+                Hotspot.to_panorama_id.in_(panorama_ids)
+            )
+        ).delete(synchronize_session=False)
+        TourPanorama.query.filter(TourPanorama.panorama_id.in_(panorama_ids)).delete(synchronize_session=False)
+        Panorama.query.filter(Panorama.id.in_(panorama_ids)).delete(synchronize_session=False)
+        db.session.commit()
+        
+        for panorama_id in panorama_ids:
+            remove_panorama_derivatives(panorama_id)
+        invalidate_tour_manifests(affected_tour_ids)
+        
+        total += len(panorama_ids)
+        if len(panorama_ids) < batch_size:
+            return total
+
+def cleanup_old_activity(batch_size=None):
+    """Очистка журнала активности старше срока хранения"""
+    from models import ActivityEvent
+    threshold = datetime.utcnow() - timedelta(days=app.config['ACTIVITY_LOG_RETENTION_DAYS'])
+    return _delete_in_batches(
+        ActivityEvent,
+        ActivityEvent.created_at < threshold,
+        batch_size or app.config['SWEEPER_BATCH_SIZE']
+    )
 
-def cleanup_old_sessions():
+def cleanup_old_sessions(batch_size=None):
     """Очистка старых сессий (старше 30 дней)"""
     from models import UserSession
     thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-    old_sessions = UserSession.query.filter(
-        UserSession.created_at < thirty_days_ago
-    ).all()
+    return _delete_in_batches(
+        UserSession,
+        UserSession.created_at < thirty_days_ago,
+        batch_size or app.config['SWEEPER_BATCH_SIZE']
+    )
     
-    count = len(old_sessions)
-    for session in old_sessions:
-        try:
-            db.session.delete(session)
-        except Exception as e:
-            print(f"Ошибка удаления сессии {session.id}: {e}")
+def cleanup_stale_uploads(batch_size=None):
+    """Очистка незавершенных загрузок по частям с истекшим сроком"""
+    from models import ChunkedUpload
+    from chunked_upload import get_assembly_path
+    batch_size = batch_size or app.config['SWEEPER_BATCH_SIZE']
     
-    db.session.commit()
-    return count
\ No newline at end of file
+    total = 0
+    while True:
+        stale_ids = [row.id for row in db.session.query(ChunkedUpload.id).filter(
+            ChunkedUpload.expires_at <= datetime.utcnow()
+        ).limit(batch_size)]
+        
+        if not stale_ids:
+            return total
+        
+        ChunkedUpload.query.filter(ChunkedUpload.id.in_(stale_ids)).delete(synchronize_session=False)
+        db.session.commit()
+        
+        for upload_id in stale_ids:
+            assembly_path = get_assembly_path(upload_id)
+            if os.path.exists(assembly_path):
+                try:
+                    os.remove(assembly_path)
+                except Exception as e:
+                    print(f"Ошибка удаления файла загрузки {assembly_path}: {e}")
+        
+        total += len(stale_ids)
+        if len(stale_ids) < batch_size:
+            return total
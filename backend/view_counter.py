@@ -0,0 +1,91 @@
+import atexit
+import threading
+from collections import Counter
+from sqlalchemy import update, case
+from config import app, db
+
+class ViewCounter:
+    """Буфер просмотров панорам: инкременты копятся в памяти процесса и записываются в БД пачкой"""
+    
+    def __init__(self, flush_interval, flush_threshold):
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self._pending = Counter()  # id панорамы -> число еще не записанных просмотров
+        self._pending_total = 0
+        self._in_flight = Counter()  # Просмотры, которые сейчас записываются в БД
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flush_requested = threading.Event()
+        self._thread = None
+    
+    def increment(self, panorama_id):
+        with self._lock:
+            self._pending[panorama_id] += 1
+            self._pending_total += 1
+            self._ensure_thread()
+            if self._pending_total >= self.flush_threshold:
+                self._flush_requested.set()
+    
+    def pending(self, panorama_id):
+        """Просмотры панорамы, еще не записанные в БД"""
+        with self._lock:
+            return self._pending.get(panorama_id, 0) + self._in_flight.get(panorama_id, 0)
+    
+    def pending_counts(self):
+        """Все еще не записанные в БД просмотры: id панорамы -> число"""
+        with self._lock:
+            return self._pending + self._in_flight
+    
+    def flush(self):
+        """Запись накопленных просмотров одним UPDATE ... CASE, возвращает число обновленных панорам"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch = self._pending
+                self._in_flight = batch
+                self._pending = Counter()
+                self._pending_total = 0
+            
+            from models import Panorama
+            try:
+                with app.app_context():
+                    db.session.execute(
+                        update(Panorama)
+                        .where(Panorama.id.in_(list(batch)))
+                        .values(view_count=Panorama.view_count + case(dict(batch), value=Panorama.id, else_=0))
+                        .execution_options(synchronize_session=False)
+                    )
+                    db.session.commit()
+            except Exception as e:
+                # Возвращаем просмотры в буфер, чтобы записать их при следующей попытке
+                print(f"Ошибка записи счетчиков просмотров: {e}")
+                with self._lock:
+                    self._in_flight = Counter()
+                    self._pending.update(batch)
+                    self._pending_total += sum(batch.values())
+                return 0
+            
+            with self._lock:
+                self._in_flight = Counter()
+            return len(batch)
+    
+    def _ensure_thread(self):
+        # Поток запускается при первом просмотре, а не при импорте (скрипты миграций и воркеры его не создают)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='view-counter-flush', daemon=True)
+            self._thread.start()
+    
+    def _run(self):
+        while True:
+            self._flush_requested.wait(self.flush_interval)
+            self._flush_requested.clear()
+            self.flush()
+
+view_counter = ViewCounter(
+    flush_interval=app.config['VIEW_COUNT_FLUSH_INTERVAL'],
+    flush_threshold=app.config['VIEW_COUNT_FLUSH_THRESHOLD']
+)
+
+# Несохраненные просмотры записываются при остановке сервера
+atexit.register(view_counter.flush)
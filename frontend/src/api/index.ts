@@ -5,7 +5,11 @@ import {
   LoginForm, 
   RegisterForm, 
   Panorama, 
+  PanoramaTiles,
+  PanoramaCubemap,
   Tour,
+  ProcessingJob,
+  ChunkedUpload,
   CreateTourForm,
   UploadPanoramaForm,
   UserStats,
@@ -98,16 +102,116 @@ export const authAPI = {
   },
 };
 
+// API методы фоновых задач
+export const jobAPI = {
+  // Получение статуса задачи
+  getById: async (id: string): Promise<{ job: ProcessingJob }> => {
+    const response = await api.get<{ job: ProcessingJob }>(`/jobs/${id}`);
+    return response.data;
+  },
+
+  // Ожидание появления результата задачи (панорама создана)
+  waitForResult: async (id: string, intervalMs: number = 1000): Promise<ProcessingJob> => {
+    for (;;) {
+      const { job } = await jobAPI.getById(id);
+      if (job.status === 'failed') {
+        throw { response: { data: { error: job.error || 'Ошибка обработки панорамы' } } };
+      }
+      if (job.result) {
+        return job;
+      }
+      await new Promise(resolve => setTimeout(resolve, intervalMs));
+    }
+  },
+};
+
+// API методы загрузки по частям (возобновляемая загрузка больших панорам)
+export const chunkedUploadAPI = {
+  // Создание загрузки
+  init: async (data: {
+    filename: string;
+    total_size: number;
+    title: string;
+    description?: string;
+    is_public?: boolean;
+    tour_id?: number;
+  }): Promise<{ upload: ChunkedUpload; chunk_size: number }> => {
+    const response = await api.post<{ upload: ChunkedUpload; chunk_size: number }>('/uploads', data);
+    return response.data;
+  },
+
+  // Состояние загрузки
+  getStatus: async (id: string): Promise<{ upload: ChunkedUpload }> => {
+    const response = await api.get<{ upload: ChunkedUpload }>(`/uploads/${id}`);
+    return response.data;
+  },
+
+  // Отправка части файла
+  putChunk: async (id: string, offset: number, chunk: Blob): Promise<{ upload: ChunkedUpload }> => {
+    const response = await api.put<{ upload: ChunkedUpload }>(`/uploads/${id}`, chunk, {
+      params: { offset },
+      headers: {
+        'Content-Type': 'application/octet-stream',
+      },
+    });
+    return response.data;
+  },
+
+  // Завершение загрузки
+  complete: async (id: string): Promise<{ job: ProcessingJob }> => {
+    const response = await api.post<{ job: ProcessingJob }>(`/uploads/${id}/complete`);
+    return response.data;
+  },
+
+  // Загрузка файла целиком с повтором оборвавшихся частей
+  uploadFile: async (
+    file: File,
+    fields: { title: string; description?: string; is_public?: boolean; tour_id?: number },
+    onProgress?: (percent: number) => void,
+    maxRetries: number = 5
+  ): Promise<ProcessingJob> => {
+    const { upload, chunk_size } = await chunkedUploadAPI.init({
+      filename: file.name,
+      total_size: file.size,
+      ...fields,
+    });
+
+    let offset = upload.offset;
+    let retries = 0;
+    while (offset < file.size) {
+      try {
+        const result = await chunkedUploadAPI.putChunk(upload.id, offset, file.slice(offset, offset + chunk_size));
+        offset = result.upload.offset;
+        retries = 0;
+        onProgress?.(Math.round((offset / file.size) * 100));
+      } catch (error) {
+        if (++retries > maxRetries) {
+          throw error;
+        }
+        // После обрыва связи узнаем у сервера, сколько байт уже сохранено
+        await new Promise(resolve => setTimeout(resolve, 1000 * retries));
+        const status = await chunkedUploadAPI.getStatus(upload.id);
+        offset = status.upload.offset;
+      }
+    }
+
+    const { job } = await chunkedUploadAPI.complete(upload.id);
+    return jobAPI.waitForResult(job.id);
+  },
+};
+
 // API методы панорам
 export const panoramaAPI = {
   // Загрузка панорамы
   upload: async (data: FormData): Promise<{ panorama: Panorama }> => {
-    const response = await api.post<{ panorama: Panorama }>('/panoramas/upload', data, {
+    const response = await api.post<{ job: ProcessingJob }>('/panoramas/upload', data, {
       headers: {
         'Content-Type': 'multipart/form-data',
       },
     });
-    return response.data;
+    // Сервер обрабатывает панораму в фоне, дожидаемся завершения задачи
+    const job = await jobAPI.waitForResult(response.data.job.id);
+    return job.result;
   },
 
   // Получение списка панорам
@@ -115,6 +219,7 @@ export const panoramaAPI = {
     page?: number;
     per_page?: number;
     search?: string;
+    cursor?: string;
   }): Promise<{ panoramas: Panorama[]; pagination: any }> => {
     const response = await api.get<{ panoramas: Panorama[]; pagination: any }>('/panoramas', { params });
     return response.data;
@@ -149,6 +254,28 @@ export const panoramaAPI = {
     return `/api/panoramas/${id}/image`;
   },
 
+  // Получение URL миниатюры панорамы (для карточек в списках)
+  getThumbnailUrl: (id: number, width: number = 640): string => {
+    return `/api/panoramas/${id}/thumbnail?w=${width}`;
+  },
+
+  // Получение описания тайловой пирамиды
+  getTiles: async (id: number): Promise<{ tiles: PanoramaTiles }> => {
+    const response = await api.get<{ tiles: PanoramaTiles }>(`/panoramas/${id}/tiles`);
+    return response.data;
+  },
+
+  // Получение URL тайла панорамы
+  getTileUrl: (id: number, level: number, x: number, y: number): string => {
+    return `/api/panoramas/${id}/tiles/${level}/${x}_${y}.jpg`;
+  },
+
+  // Получение граней кубической карты
+  getCubemap: async (id: number): Promise<{ cubemap: PanoramaCubemap }> => {
+    const response = await api.get<{ cubemap: PanoramaCubemap }>(`/panoramas/${id}/cubemap`);
+    return response.data;
+  },
+
   // Получение embed кода
   getEmbedCode: async (id: number): Promise<{ embed_code: string; embed_url: string }> => {
     const response = await api.get<{ embed_code: string; embed_url: string }>(`/panoramas/${id}/embed`);
@@ -176,6 +303,7 @@ export const tourAPI = {
     page?: number;
     per_page?: number;
     search?: string;
+    cursor?: string;
   }): Promise<{ tours: Tour[]; pagination: any }> => {
     const response = await api.get<{ tours: Tour[]; pagination: any }>('/tours', { params });
     return response.data;
@@ -207,12 +335,14 @@ export const tourAPI = {
 
   // Загрузка панорамы непосредственно в тур
   uploadPanorama: async (tourId: number, data: FormData): Promise<{ panorama: any; tour_panorama: any }> => {
-    const response = await api.post<{ panorama: any; tour_panorama: any }>(`/tours/${tourId}/upload-panorama`, data, {
+    const response = await api.post<{ job: ProcessingJob }>(`/tours/${tourId}/upload-panorama`, data, {
       headers: {
         'Content-Type': 'multipart/form-data',
       },
     });
-    return response.data;
+    // Сервер обрабатывает панораму в фоне, дожидаемся завершения задачи
+    const job = await jobAPI.waitForResult(response.data.job.id);
+    return job.result;
   },
 
   // Добавление панорамы в тур
@@ -295,6 +425,7 @@ export const userAPI = {
     page?: number;
     per_page?: number;
     status?: 'all' | 'active' | 'expired';
+    cursor?: string;
   }): Promise<{ panoramas: Panorama[]; pagination: any }> => {
     const response = await api.get<{ panoramas: Panorama[]; pagination: any }>('/users/panoramas', { params });
     return response.data;
@@ -304,6 +435,7 @@ export const userAPI = {
   getTours: async (params?: {
     page?: number;
     per_page?: number;
+    cursor?: string;
   }): Promise<{ tours: Tour[]; pagination: any }> => {
     const response = await api.get<{ tours: Tour[]; pagination: any }>('/users/tours', { params });
     return response.data;
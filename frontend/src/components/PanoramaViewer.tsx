@@ -774,16 +774,71 @@ const PanoramaViewer: React.FC<PanoramaViewerProps> = ({
     }
   }, [hotspots, isLoading, error]);
 
-  // Load panorama texture
+  // Apply loaded texture to the sphere (previous texture is disposed)
+  const applyPanoramaTexture = (texture: THREE.Texture) => {
+    texture.flipY = true; // Set to true for correct orientation of equirectangular textures
+    texture.colorSpace = THREE.SRGBColorSpace; // Set color space
+    texture.needsUpdate = true; // Ensure texture update is triggered
+    console.log('[PanoramaViewer] Texture dimensions:', texture.image.width, 'x', texture.image.height);
+
+    if (sphereRef.current) {
+      const material = sphereRef.current.material as THREE.MeshBasicMaterial;
+      if (material.map && material.map !== texture) {
+        material.map.dispose();
+      }
+      material.map = texture; // Texture application logic (restored)
+      material.needsUpdate = true;
+    }
+  };
+
+  // Load panorama texture: mid-resolution preview first, then the full image
   const loadPanoramaTexture = (panoramaId: number) => {
     console.log('[PanoramaViewer] loadPanoramaTexture called with panorama ID:', panoramaId);
     setIsLoading(true);
     setError(null);
   
-    const imageUrl = `/api/panoramas/${panoramaId}/image`;
-    console.log('[PanoramaViewer] Loading texture from:', imageUrl);
+    const previewUrl = `/api/panoramas/${panoramaId}/thumbnail?w=2048`;
+    // URL с версией по хэшу содержимого кэшируется браузером без повторных запросов
+    const target = [panorama, ...tourPanoramas].find(p => p.id === panoramaId);
+    const imageUrl = target?.image_url || `/api/panoramas/${panoramaId}/image`;
     const textureLoader = new THREE.TextureLoader();
-  
+    let fullLoaded = false;
+    let previewShown = false;
+
+    const showError = (err: unknown) => {
+      console.error('[PanoramaViewer] Error loading texture:', err);
+      setError('Не удалось загрузить изображение панорамы.');
+      setIsLoading(false);
+      // Fallback to gray sphere
+      if (sphereRef.current) {
+        const material = sphereRef.current.material as THREE.MeshBasicMaterial;
+        material.map = null;
+        material.color.set(0x333333);
+        material.needsUpdate = true;
+      }
+    };
+
+    // Превью среднего разрешения показывается сразу, пока грузится оригинал
+    console.log('[PanoramaViewer] Loading preview from:', previewUrl);
+    textureLoader.load(
+      previewUrl,
+      (texture) => {
+        if (!isMountedRef.current || fullLoaded) {
+          texture.dispose();
+          return;
+        }
+        previewShown = true;
+        applyPanoramaTexture(texture);
+        setIsLoading(false);
+        console.log('[PanoramaViewer] Preview texture applied');
+      },
+      undefined,
+      (err) => {
+        console.log('[PanoramaViewer] Preview not available, waiting for full image:', err);
+      }
+    );
+
+    console.log('[PanoramaViewer] Loading texture from:', imageUrl);
     textureLoader.load(
       imageUrl,
       (texture) => {
@@ -793,35 +848,20 @@ const PanoramaViewer: React.FC<PanoramaViewerProps> = ({
           return;
         }
 
-        texture.flipY = true; // Set to true for correct orientation of equirectangular textures
-        texture.colorSpace = THREE.SRGBColorSpace; // Set color space
-        texture.needsUpdate = true; // Ensure texture update is triggered
-        console.log('[PanoramaViewer] texture.flipY after setting:', texture.flipY);
-        console.log('[PanoramaViewer] Texture dimensions:', texture.image.width, 'x', texture.image.height);
-
-        if (sphereRef.current) {
-          const material = sphereRef.current.material as THREE.MeshBasicMaterial;
-          material.map = texture; // Texture application logic (restored)
-          material.needsUpdate = true;
-        }
-
+        fullLoaded = true;
+        applyPanoramaTexture(texture);
         setIsLoading(false);
         console.log('[PanoramaViewer] Texture loaded and applied successfully');
       },
       undefined,
       (err) => {
-        console.log('[PanoramaViewer] Error loading texture:', err);
         if (!isMountedRef.current) return;
-        console.error('[PanoramaViewer] Error loading texture:', err);
-        setError('Не удалось загрузить изображение панорамы.');
-        setIsLoading(false);
-        // Fallback to gray sphere
-        if (sphereRef.current) {
-          const material = sphereRef.current.material as THREE.MeshBasicMaterial;
-          material.map = null;
-          material.color.set(0x333333);
-          material.needsUpdate = true;
+        if (previewShown) {
+          // Остаемся на превью, если оригинал не загрузился
+          console.error('[PanoramaViewer] Error loading full texture, keeping preview:', err);
+          return;
         }
+        showError(err);
       }
     );
   };
@@ -1061,6 +1101,12 @@ const PanoramaViewer: React.FC<PanoramaViewerProps> = ({
       />
       
       {/* Loading indicator */}
+      {isLoading && panorama.placeholder && (
+        <div
+          className="absolute inset-0 bg-cover bg-center blur-md scale-110 z-30"
+          style={{ backgroundImage: `url(${panorama.placeholder})` }}
+        />
+      )}
       {isLoading && (
         <div className="absolute inset-0 flex items-center justify-center bg-black bg-opacity-75 z-40">
           <div className="text-center text-white">
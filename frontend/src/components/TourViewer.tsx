@@ -304,7 +304,7 @@ const TourViewer: React.FC<TourViewerProps> = ({ embedMode = false, tour: propTo
                   <div className="flex items-center">
                     <div className="flex-shrink-0 w-12 h-12 bg-gray-700 rounded-lg overflow-hidden mr-3">
                       <img
-                        src={`http://localhost:5000/api/panoramas/${panorama.id}/image`}
+                        src={`http://localhost:5000/api/panoramas/${panorama.id}/thumbnail?w=160`}
                         alt={panorama.title}
                         className="w-full h-full object-cover"
                         onError={(e) => {
@@ -449,7 +449,7 @@ const DashboardPage: React.FC = () => {
                   <div key={panorama.id} className="bg-white border rounded-xl overflow-hidden hover:shadow-lg transition-shadow">
                     <div className="aspect-video bg-gray-100 relative overflow-hidden cursor-pointer" onClick={() => navigate(`/panorama/${panorama.id}`)}>
                       <img 
-                        src={`http://localhost:5000/api/panoramas/${panorama.id}/image`}
+                        src={`http://localhost:5000/api/panoramas/${panorama.id}/thumbnail?w=640`}
                         alt={panorama.title}
                         className="w-full h-full object-cover hover:scale-105 transition-transform duration-300"
                         onError={(e) => {
@@ -570,7 +570,7 @@ const DashboardPage: React.FC = () => {
                     <div className="aspect-video bg-gray-100 relative overflow-hidden cursor-pointer" onClick={() => navigate(`/tour/${tour.id}`)}>
                       {tour.first_panorama_id ? (
                         <img 
-                          src={`http://localhost:5000/api/panoramas/${tour.first_panorama_id}/image`}
+                          src={`http://localhost:5000/api/panoramas/${tour.first_panorama_id}/thumbnail?w=640`}
                           alt={tour.title}
                           className="w-full h-full object-cover hover:scale-105 transition-transform duration-300"
                           onError={(e) => {
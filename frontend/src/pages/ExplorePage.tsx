@@ -6,8 +6,6 @@ import {
   UserIcon,
   CalendarIcon,
   PhotoIcon,
-  ChevronLeftIcon,
-  ChevronRightIcon,
   HomeIcon,
   UserCircleIcon
 } from '@heroicons/react/24/outline';
@@ -23,12 +21,10 @@ interface PanoramaData {
 }
 
 interface PaginationData {
-  page: number;
   per_page: number;
-  total: number;
-  pages: number;
+  total: number | null;
   has_next: boolean;
-  has_prev: boolean;
+  next_cursor: string | null;
 }
 
 const ExplorePage: React.FC = () => {
@@ -37,19 +33,24 @@ const ExplorePage: React.FC = () => {
   const [panoramas, setPanoramas] = useState<PanoramaData[]>([]);
   const [pagination, setPagination] = useState<PaginationData | null>(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [error, setError] = useState('');
   const [searchQuery, setSearchQuery] = useState('');
-  const [currentPage, setCurrentPage] = useState(1);
 
   useEffect(() => {
     fetchPanoramas();
-  }, [currentPage, searchQuery]);
+  }, [searchQuery]);
 
-  const fetchPanoramas = async () => {
+  // Пустой курсор - первая страница; следующие страницы догружаются по next_cursor
+  const fetchPanoramas = async (cursor = '') => {
     try {
-      setLoading(true);
+      if (cursor) {
+        setLoadingMore(true);
+      } else {
+        setLoading(true);
+      }
       const params = new URLSearchParams({
-        page: currentPage.toString(),
+        cursor,
         per_page: '12'
       });
       
@@ -61,7 +62,7 @@ const ExplorePage: React.FC = () => {
       const data = await response.json();
 
       if (response.ok) {
-        setPanoramas(data.panoramas);
+        setPanoramas(prev => cursor ? [...prev, ...data.panoramas] : data.panoramas);
         setPagination(data.pagination);
       } else {
         setError(data.error || 'Ошибка загрузки панорам');
@@ -70,12 +71,12 @@ const ExplorePage: React.FC = () => {
       setError('Ошибка подключения к серверу');
     } finally {
       setLoading(false);
+      setLoadingMore(false);
     }
   };
 
   const handleSearch = (e: React.FormEvent) => {
     e.preventDefault();
-    setCurrentPage(1);
     fetchPanoramas();
   };
 
@@ -83,20 +84,6 @@ const ExplorePage: React.FC = () => {
     return new Date(dateString).toLocaleDateString('ru-RU');
   };
 
-  const renderPaginationButton = (page: number, label: string, isActive = false) => (
-    <button
-      key={page}
-      onClick={() => setCurrentPage(page)}
-      className={`px-3 py-2 text-sm font-medium rounded-lg transition-colors ${
-        isActive
-          ? 'bg-primary-500 text-white'
-          : 'bg-white text-gray-700 hover:bg-gray-50 border border-gray-300'
-      }`}
-    >
-      {label}
-    </button>
-  );
-
   return (
     <div className="min-h-screen bg-gradient-to-br from-accent-gray via-white to-purple-50">
       <div className="bg-white shadow-sm border-b">
@@ -184,7 +171,7 @@ const ExplorePage: React.FC = () => {
           <>
             <div className="mb-6">
               <p className="text-gray-600">
-                {pagination && (
+                {pagination && pagination.total !== null && (
                   <>Найдено {pagination.total} панорам{pagination.total === 1 ? 'а' : pagination.total < 5 ? 'ы' : ''}</>
                 )}
               </p>
@@ -199,7 +186,7 @@ const ExplorePage: React.FC = () => {
                 >
                   <div className="aspect-[2/1] bg-gray-100 relative overflow-hidden">
                     <img 
-                      src={`http://localhost:5000/api/panoramas/${panorama.id}/image`}
+                      src={`http://localhost:5000/api/panoramas/${panorama.id}/thumbnail?w=640`}
                       alt={panorama.title}
                       className="w-full h-full object-cover group-hover:scale-105 transition-transform duration-300"
                       onError={(e) => {
@@ -254,28 +241,14 @@ const ExplorePage: React.FC = () => {
               ))}
             </div>
 
-            {pagination && pagination.pages > 1 && (
-              <div className="flex items-center justify-center space-x-2">
-                <button
-                  onClick={() => setCurrentPage(currentPage - 1)}
-                  disabled={!pagination.has_prev}
-                  className="p-2 text-gray-500 hover:text-gray-700 disabled:opacity-50 disabled:cursor-not-allowed"
-                >
-                  <ChevronLeftIcon className="h-5 w-5" />
-                </button>
-
-                {Array.from({ length: Math.min(5, pagination.pages) }, (_, i) => {
-                  const page = Math.max(1, currentPage - 2) + i;
-                  if (page > pagination.pages) return null;
-                  return renderPaginationButton(page, page.toString(), page === currentPage);
-                })}
-
+            {pagination && pagination.next_cursor && (
+              <div className="flex justify-center">
                 <button
-                  onClick={() => setCurrentPage(currentPage + 1)}
-                  disabled={!pagination.has_next}
-                  className="p-2 text-gray-500 hover:text-gray-700 disabled:opacity-50 disabled:cursor-not-allowed"
+                  onClick={() => fetchPanoramas(pagination.next_cursor!)}
+                  disabled={loadingMore}
+                  className="btn-secondary disabled:opacity-50 disabled:cursor-not-allowed"
                 >
-                  <ChevronRightIcon className="h-5 w-5" />
+                  {loadingMore ? 'Загрузка...' : 'Показать еще'}
                 </button>
               </div>
             )}
@@ -153,7 +153,7 @@ const ToursListPage: React.FC = () => {
                 <div className="h-48 bg-gray-100 relative overflow-hidden cursor-pointer" onClick={() => navigate(`/tour/${tour.id}`)}>
                   {tour.first_panorama_id ? (
                     <img 
-                      src={`http://localhost:5000/api/panoramas/${tour.first_panorama_id}/image`}
+                      src={`http://localhost:5000/api/panoramas/${tour.first_panorama_id}/thumbnail?w=640`}
                       alt={tour.title}
                       className="w-full h-full object-cover hover:scale-105 transition-transform duration-300"
                       onError={(e) => {
@@ -877,7 +877,7 @@ const AdminPage: React.FC = () => {
                             <div className="flex-shrink-0 h-16 w-16 rounded-md overflow-hidden">
                               <img 
                                 className="h-16 w-16 object-cover cursor-pointer hover:opacity-75 transition-opacity"
-                                src={`http://localhost:5000/api/panoramas/${panorama.id}/image`}
+                                src={`http://localhost:5000/api/panoramas/${panorama.id}/thumbnail?w=640`}
                                 alt={panorama.title}
                                 onError={(e) => {
                                   const target = e.target as HTMLImageElement;
@@ -964,7 +964,7 @@ const AdminPage: React.FC = () => {
                               {tour.first_panorama_id ? (
                                 <img 
                                   className="h-16 w-16 object-cover cursor-pointer hover:opacity-75 transition-opacity"
-                                  src={`http://localhost:5000/api/panoramas/${tour.first_panorama_id}/image`}
+                                  src={`http://localhost:5000/api/panoramas/${tour.first_panorama_id}/thumbnail?w=640`}
                                   alt={tour.title}
                                   onError={(e) => {
                                     const target = e.target as HTMLImageElement;
@@ -26,10 +26,61 @@ export interface Panorama {
   is_public: boolean;
   embed_code: string;
   is_expired: boolean;
+  content_hash?: string | null;
+  image_url?: string;
+  thumbnail_url?: string;
+  preview_url?: string;
+  placeholder?: string | null; // Размытая миниатюра (data URI) для мгновенного показа
   owner?: string;
   hotspots?: Hotspot[];
 }
 
+export interface PanoramaTileLevel {
+  level: number;
+  width: number;
+  height: number;
+  columns: number;
+  rows: number;
+}
+
+export interface PanoramaTiles {
+  width: number;
+  height: number;
+  tile_size: number;
+  levels: PanoramaTileLevel[];
+  url_template: string;
+}
+
+export interface PanoramaCubemap {
+  face_size: number;
+  faces: Record<'px' | 'nx' | 'py' | 'ny' | 'pz' | 'nz', string>;
+}
+
+export interface ProcessingJob {
+  id: string;
+  user_id: number;
+  job_type: 'panorama_upload' | 'tour_panorama_upload';
+  status: 'pending' | 'processing' | 'completed' | 'failed';
+  result: { panorama: Panorama; tour_panorama?: TourPanorama; metadata?: any } | null;
+  error: string | null;
+  panorama_id: number | null;
+  created_at: string;
+  updated_at: string;
+}
+
+export interface ChunkedUpload {
+  id: string;
+  filename: string;
+  title: string;
+  tour_id: number | null;
+  total_size: number;
+  received_size: number;
+  offset: number;
+  is_complete: boolean;
+  created_at: string;
+  expires_at: string;
+}
+
 export interface Tour {
   id: number;
   user_id: number;
@@ -87,6 +138,14 @@ export interface PaginationMeta {
   has_prev: boolean;
 }
 
+// Пагинация по курсору (параметр cursor): пустой курсор - первая страница
+export interface CursorPaginationMeta {
+  per_page: number;
+  total: number | null;
+  has_next: boolean;
+  next_cursor: string | null;
+}
+
 export interface PaginatedResponse<T> {
   items: T[];
   pagination: PaginationMeta;